@@ -42,6 +42,23 @@ Options:
                 and generated source output
   --encoding    <encoding>
                 use <encoding> in generated source according to pep-0263
+  --max-items <integer>
+  --max-reductions <integer>
+  --max-seconds <number>
+  --max-nodes <integer>
+                stop decompiling a file when parsing one of its code
+                objects takes more than this many Earley items,
+                reductions, seconds, or syntax-tree nodes
+  --rule-profile <file>
+                parse with the grammar rules seen used in the rule
+                profile <file> first, and with the others only when needed.
+                Faster, but where the grammar is ambiguous the result can
+                differ from what the whole grammar gives
+  --prune-grammar
+                parse each code object with just the grammar rules that
+                can match its instructions. Faster, but where the grammar
+                is ambiguous the result can differ from what the whole
+                grammar gives
   --help        show this message
 
 Debugging Options:
@@ -50,6 +67,20 @@ Debugging Options:
   --tree={{before|after}}
   -t {{before|after}}     include syntax before (or after) tree transformation
   --tree++ | -T         add template rules to --tree=before when possible
+  --profile-reducechecks
+                        show calls, accepts, rejects and time spent in
+                        grammar reduction checks, by rule
+  --profile-ambiguity
+                        show the code objects whose parses had the most
+                        ambiguities to settle
+  --profile-chart       show the code objects whose parses had the largest
+                        Earley charts, in items
+  --profile-rules <file>
+                        count the reductions by each grammar rule, used
+                        or rejected, and add them to the rule profile <file>
+  --grammar-coverage <file>
+                        add which grammar rules were used, and how often,
+                        to the grammar coverage report <file>
 
 Extensions of generated files:
   '.pyc_dis' '.pyo_dis'   successfully decompiled
@@ -60,6 +91,15 @@ Extensions of generated files:
 program = "decompyle3"
 
 from decompyle3.main import main, status_msg
+from decompyle3.parsers import (
+    ambiguity_profile,
+    chart_profile,
+    grammar_coverage,
+    reduce_profile,
+    rule_profile,
+)
+from decompyle3.parsers.main import PythonLambdaParser
+from decompyle3.parsers.pool import parser_pool
 from decompyle3.version import __version__
 
 
@@ -83,6 +123,11 @@ def main_bin():
     out_base = None
     source_paths = []
     timestamp = False
+    profile_reducechecks = False
+    profile_ambiguity = False
+    profile_chart = False
+    profile_rules = None
+    coverage_report = None
     timestampfmt = "# %Y.%m.%d %H:%M:%S %Z"
 
     try:
@@ -92,7 +137,10 @@ def main_bin():
             "help asm compile= grammar linemaps recurse "
             "timestamp tree= tree+ "
             "fragments verify verify-run version "
-            "syntax-verify "
+            "syntax-verify profile-reducechecks profile-ambiguity profile-chart "
+            "profile-rules= rule-profile= prune-grammar "
+            "grammar-coverage= "
+            "max-items= max-reductions= max-seconds= max-nodes= "
             "showgrammar".split(" "),
         )
     except getopt.GetoptError as e:
@@ -147,6 +195,24 @@ def main_bin():
             recurse_dirs = True
         elif opt == "--encoding":
             options["source_encoding"] = val
+        elif opt == "--profile-reducechecks":
+            profile_reducechecks = True
+        elif opt == "--profile-ambiguity":
+            profile_ambiguity = True
+        elif opt == "--profile-chart":
+            profile_chart = True
+        elif opt == "--profile-rules":
+            profile_rules = val
+        elif opt == "--grammar-coverage":
+            coverage_report = val
+        elif opt == "--rule-profile":
+            parser_pool.use_profile(val)
+        elif opt == "--prune-grammar":
+            PythonLambdaParser.prune_grammar = True
+        elif opt in ("--max-items", "--max-reductions", "--max-nodes"):
+            options.setdefault("budgets", {})[opt[len("--max-") :]] = int(val)
+        elif opt == "--max-seconds":
+            options.setdefault("budgets", {})["seconds"] = float(val)
         else:
             print(opt, file=sys.stderr)
             usage()
@@ -188,12 +254,29 @@ def main_bin():
     if timestamp:
         print(time.strftime(timestampfmt))
 
+    # The profiles to record. Worker processes start with them turned on
+    # and send back what they recorded, in this order.
+    profiles = []
+    if profile_reducechecks:
+        profiles.append(reduce_profile.profile)
+    if profile_ambiguity:
+        profiles.append(ambiguity_profile.profile)
+    if profile_chart:
+        profiles.append(chart_profile.profile)
+    if profile_rules:
+        profiles.append(rule_profile.profile)
+    if coverage_report:
+        profiles.append(grammar_coverage.profile)
+    for profile in profiles:
+        profile.enable()
+
     if numproc <= 1:
         try:
             result = main(
                 src_base, out_base, pyc_paths, source_paths, outfile, **options
             )
-            result = list(result) + [options.get("do_verify", None)]
+            over_budget = result.over_budget
+            result = list(result) + [options.get("do_verify", None), over_budget]
             if len(pyc_paths) > 1:
                 mess = status_msg(do_verify, *result)
                 print("# " + mess)
@@ -227,50 +310,94 @@ def main_bin():
                     0,
                     0,
                 )
+                over_budget_files = 0
                 while 1:
                     f = fqueue.get()
                     if f is None:
                         break
-                    (t, o, f, v) = main(
-                        src_base, out_base, [f], None, outfile, **options
-                    )
+                    result = main(src_base, out_base, [f], [], outfile, **options)
+                    (t, o, f, v) = result
                     tot_files += t
                     okay_files += o
                     failed_files += f
                     verify_failed_files += v
+                    over_budget_files += result.over_budget
             except (Empty, KeyboardInterrupt):
                 pass
-            rqueue.put((tot_files, okay_files, failed_files, verify_failed_files))
+            rqueue.put(
+                (
+                    tot_files,
+                    okay_files,
+                    failed_files,
+                    verify_failed_files,
+                    over_budget_files,
+                )
+                + tuple(profile.snapshot() for profile in profiles)
+            )
             rqueue.close()
 
         try:
             procs = [Process(target=process_func) for i in range(numproc)]
             for p in procs:
                 p.start()
+            (tot_files, okay_files, failed_files, verify_failed_files) = (
+                0,
+                0,
+                0,
+                0,
+            )
+            over_budget_files = 0
+            # Each worker sends one result. Take them before joining: a
+            # worker doesn't exit until what it sent has been read, and
+            # profiles can be more than the queue's pipe holds.
+            results = 0
+            while results < len(procs):
+                try:
+                    result = rqueue.get(timeout=1)
+                except Empty:
+                    if not any(p.is_alive() for p in procs):
+                        break
+                    continue
+                results += 1
+                (t, o, f, v, b) = result[:5]
+                tot_files += t
+                okay_files += o
+                failed_files += f
+                verify_failed_files += v
+                over_budget_files += b
+                for profile, data in zip(profiles, result[5:]):
+                    profile.merge(data)
             for p in procs:
                 p.join()
-            try:
-                (tot_files, okay_files, failed_files, verify_failed_files) = (
-                    0,
-                    0,
-                    0,
-                    0,
-                )
-                while True:
-                    (t, o, f, v) = rqueue.get(False)
-                    tot_files += t
-                    okay_files += o
-                    failed_files += f
-                    verify_failed_files += v
-            except Empty:
-                pass
-            print(
-                "# decompiled %i files: %i okay, %i failed, %i verify failed"
-                % (tot_files, okay_files, failed_files, verify_failed_files)
+            mess = "# decompiled %i files: %i okay, %i failed, %i verify failed" % (
+                tot_files,
+                okay_files,
+                failed_files,
+                verify_failed_files,
             )
+            if over_budget_files:
+                mess += ", %i over budget" % over_budget_files
+            print(mess)
         except (KeyboardInterrupt, OSError):
             pass
 
+    if profile_reducechecks:
+        print(reduce_profile.format_table(), file=sys.stderr)
+
+    if profile_ambiguity:
+        print(ambiguity_profile.format_table(), file=sys.stderr)
+
+    if profile_chart:
+        print(chart_profile.format_table(), file=sys.stderr)
+
+    if profile_rules:
+        if os.path.exists(profile_rules):
+            rule_profile.profile.merge(rule_profile.read(profile_rules))
+        rule_profile.write(profile_rules)
+
+    if coverage_report:
+        grammar_coverage.update(coverage_report)
+
     if timestamp:
         print(time.strftime(timestampfmt))
 
@@ -14,14 +14,14 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime, py_compile, os, sys
-from typing import Any, Tuple
+from typing import Any
 from xdis import iscode, load_module
 from xdis.version_info import version_tuple_to_str
 
 from decompyle3 import IS_PYPY, PYTHON_VERSION_TRIPLE
 from decompyle3.disas import check_object_path
 from decompyle3.semantics import pysource
-from decompyle3.parsers import ParserError
+from decompyle3.parsers import ParserBudgetExceeded, ParserError
 from decompyle3.version import __version__
 
 # from decompyle3.linenumbers import line_number_mapping
@@ -59,6 +59,7 @@ def decompile(
     mapstream=None,
     do_fragments=False,
     compile_mode="exec",
+    budgets=None,
 ) -> Any:
     """
     ingests and deparses a given code block 'co'
@@ -66,6 +67,9 @@ def decompile(
     if `bytecode_version` is None, use the current Python intepreter
     version.
 
+    `budgets` limits parsing each code object; see
+    decompyle3.parsers.main.BUDGETS.
+
     Caller is responsible for closing `out` and `mapstream`
     """
     if bytecode_version is None:
@@ -120,6 +124,7 @@ def decompile(
                 showgrammar,
                 code_objects=code_objects,
                 is_pypy=is_pypy,
+                budgets=budgets,
             )
             header_count = 3 + len(sys_version_lines)
             linemap = [
@@ -139,6 +144,7 @@ def decompile(
                 debug_opts=debug_opts,
                 is_pypy=is_pypy,
                 compile_mode=compile_mode,
+                budgets=budgets,
             )
             pass
         return deparsed
@@ -172,6 +178,7 @@ def decompile_file(
     source_encoding=None,
     mapstream=None,
     do_fragments=False,
+    budgets=None,
 ) -> Any:
     """
     decompile Python byte-code file (.pyc). Return objects to
@@ -201,6 +208,7 @@ def decompile_file(
                     is_pypy=is_pypy,
                     magic_int=magic_int,
                     mapstream=mapstream,
+                    budgets=budgets,
                 ),
             )
     else:
@@ -221,6 +229,7 @@ def decompile_file(
                 mapstream=mapstream,
                 do_fragments=do_fragments,
                 compile_mode="exec",
+                budgets=budgets,
             )
         ]
     co = None
@@ -228,6 +237,19 @@ def decompile_file(
 
 
 # FIXME: combine into an options parameter
+class FileCounts(tuple):
+    """
+    The counts of files main() returns: total, okay, failed, and failed
+    verification. Files stopped because parsing went over budget are in
+    the total and counted in over_budget, not as failed.
+    """
+
+    def __new__(cls, counts, over_budget: int = 0):
+        self = tuple.__new__(cls, counts)
+        self.over_budget = over_budget
+        return self
+
+
 def main(
     in_base: str,
     out_base: str,
@@ -242,12 +264,19 @@ def main(
     raise_on_error=False,
     do_linemaps=False,
     do_fragments=False,
-) -> Tuple[int, int, int, int]:
+    budgets=None,
+) -> FileCounts:
     """
     in_base	base directory for input files
     out_base	base directory for output files (ignored when
     files	list of filenames to be uncompyled (relative to in_base)
     outfile	write output to this filename (overwrites out_base)
+    budgets	limits on parsing each code object, see
+		decompyle3.parsers.main.BUDGETS
+
+    Returns counts of files: total, okay, failed, and failed
+    verification, with the files stopped because parsing went over
+    budget in the over_budget attribute; see FileCounts.
 
     For redirecting output to
     - <filename>		outfile=<filename> (out_base is ignored)
@@ -255,6 +284,7 @@ def main(
     - stdout			out_base=None, outfile=None
     """
     tot_files = okay_files = failed_files = verify_failed_files = 0
+    over_budget_files = 0
     current_outfile = outfile
     linemap_stream = None
 
@@ -303,6 +333,7 @@ def main(
                 source_encoding,
                 linemap_stream,
                 do_fragments,
+                budgets,
             )
             if do_fragments:
                 for d in deparsed:
@@ -322,11 +353,24 @@ def main(
                         outstream.write(extractInfo.markerLine + "\n\n")
                     pass
                 pass
+            for d in deparsed:
+                # Done with it, so its parsers can decompile the next file.
+                if d is not None:
+                    d.release_parser()
             tot_files += 1
-        except (ValueError, SyntaxError, ParserError, pysource.SourceWalkerError) as e:
+        except (
+            ValueError,
+            SyntaxError,
+            ParserError,
+            ParserBudgetExceeded,
+            pysource.SourceWalkerError,
+        ) as e:
             sys.stdout.write("\n")
             sys.stderr.write(f"\n# file {infile}\n# {e}\n")
-            failed_files += 1
+            if isinstance(e, ParserBudgetExceeded):
+                over_budget_files += 1
+            else:
+                failed_files += 1
             tot_files += 1
         except KeyboardInterrupt:
             if outfile:
@@ -381,6 +425,7 @@ def main(
                         failed_files,
                         verify_failed_files,
                         do_verify,
+                        over_budget_files,
                     ),
                 )
             )
@@ -397,7 +442,9 @@ def main(
         except:
             pass
         pass
-    return (tot_files, okay_files, failed_files, verify_failed_files)
+    return FileCounts(
+        (tot_files, okay_files, failed_files, verify_failed_files), over_budget_files
+    )
 
 
 # ---- main ----
@@ -418,7 +465,13 @@ else:
 
 
 def status_msg(
-    do_verify, tot_files, okay_files, failed_files, verify_failed_files, weak_verify
+    do_verify,
+    tot_files,
+    okay_files,
+    failed_files,
+    verify_failed_files,
+    weak_verify,
+    over_budget_files=0,
 ):
     if weak_verify == "weak":
         verification_type = "weak "
@@ -429,6 +482,8 @@ def status_msg(
     if tot_files == 1:
         if failed_files:
             return "\n# decompile failed"
+        elif over_budget_files:
+            return "\n# decompile stopped: parsing went over budget"
         elif verify_failed_files:
             return f"\n# decompile {verification_type}verification failed"
         else:
@@ -436,4 +491,6 @@ def status_msg(
             pass
         pass
     mess = f"decompiled {tot_files} files: {okay_files} okay, {failed_files} failed"
+    if over_budget_files:
+        mess += f", {over_budget_files} over budget"
     return mess
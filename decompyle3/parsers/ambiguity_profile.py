@@ -0,0 +1,76 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Profiling of ambiguities, per code object.
+
+The grammar is ambiguous, and the parser settles an ambiguity each time
+it builds a tree node where more than one rule could have been used.
+That includes the trees built for reduce checks. Code that gives the
+parser many ambiguities to settle is usually code whose parse charts
+are large, so this points at the functions where parse time goes.
+
+The parser counts the ambiguities of each parse() in its ambiguities
+attribute. When profiling is turned on with profile.enable(), the counts
+are also recorded for each code object. The data is a dictionary from a
+description of the code object to [parses, ambiguities]. format_table()
+lists the most ambiguous code objects first.
+"""
+
+from typing import Dict, Optional
+
+from decompyle3.parsers.profiling import Profile
+
+# Per-code-object [parses, ambiguities].
+profile = Profile()
+
+
+def code_name(code) -> str:
+    """Return how the code object *code* is shown in the table."""
+    if code is None:
+        return "?"
+    return "%s:%d %s" % (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def record(code, ambiguities: int) -> None:
+    code_objects = profile.data
+    name = code_name(code)
+    counts = code_objects.get(name)
+    if counts is None:
+        counts = code_objects[name] = [0, 0]
+    counts[0] += 1
+    counts[1] += ambiguities
+
+
+def format_table(data: Optional[Dict[str, list]] = None, limit: int = 50) -> str:
+    """Return a table of the *limit* code objects with the most
+    ambiguities, most first, and the totals over all of them."""
+    if data is None:
+        data = profile.snapshot()
+    header = "%10s %12s  %s" % ("parses", "ambiguities", "code object")
+    lines = [header, "-" * len(header)]
+    items = sorted(data.items(), key=lambda item: (-item[1][1], item[0]))
+    for name, (parses, ambiguities) in items[:limit]:
+        lines.append("%10d %12d  %s" % (parses, ambiguities, name))
+    if len(items) > limit:
+        lines.append("%23s  (%d more)" % ("...", len(items) - limit))
+    lines.append("-" * len(header))
+    lines.append(
+        "%10d %12d  total"
+        % (
+            sum(counts[0] for counts in data.values()),
+            sum(counts[1] for counts in data.values()),
+        )
+    )
+    return "\n".join(lines)
@@ -0,0 +1,104 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Profiling of Earley chart sizes, per code object.
+
+The Earley parser keeps a set of items for each token position, each
+a rule with how far into it the parse has got, and the position the
+rule started at. spark keeps these bundled by parse state, but its
+time still goes with the number of items. Right-recursive rules, and
+nullable ones like "else_suite_opt ::=" that spark expands into a rule
+for each way of leaving them out, add many.
+
+When profiling is turned on with profile.enable(), the parser keeps the
+number of items at each position of a parse() in its chart_sizes
+attribute, and those are added up for each code object. The data is a
+dictionary from a description of the code object to [parses, positions,
+items, peak], where peak is the most items seen at a position.
+format_table() lists the code objects with the most items first.
+"""
+
+from typing import Dict, Optional
+
+from decompyle3.parsers.ambiguity_profile import code_name
+from decompyle3.parsers.profiling import Profile
+
+
+def add_counts(counts: list, more: list) -> None:
+    counts[0] += more[0]
+    counts[1] += more[1]
+    counts[2] += more[2]
+    counts[3] = max(counts[3], more[3])
+
+
+# Per-code-object [parses, positions, items, peak].
+profile = Profile(add_counts)
+
+
+def record(code, sizes: list) -> None:
+    code_objects = profile.data
+    name = code_name(code)
+    counts = code_objects.get(name)
+    if counts is None:
+        counts = code_objects[name] = [0, 0, 0, 0]
+    counts[0] += 1
+    counts[1] += len(sizes)
+    counts[2] += sum(sizes)
+    counts[3] = max(counts[3], max(sizes, default=0))
+
+
+def total_items(data: Optional[Dict[str, list]] = None) -> int:
+    """Return the number of items over all code objects."""
+    if data is None:
+        data = profile.snapshot()
+    return sum(counts[2] for counts in data.values())
+
+
+def format_table(data: Optional[Dict[str, list]] = None, limit: int = 50) -> str:
+    """Return a table of the *limit* code objects with the most items,
+    most first, and the totals over all of them."""
+    if data is None:
+        data = profile.snapshot()
+    header = "%8s %10s %10s %8s %7s  %s" % (
+        "parses",
+        "positions",
+        "items",
+        "per pos",
+        "peak",
+        "code object",
+    )
+    lines = [header, "-" * len(header)]
+    items = sorted(data.items(), key=lambda item: (-item[1][2], item[0]))
+
+    def line(parses, positions, items, peak, name):
+        per_position = items / positions if positions else 0.0
+        return "%8d %10d %10d %8.1f %7d  %s" % (
+            parses,
+            positions,
+            items,
+            per_position,
+            peak,
+            name,
+        )
+
+    for name, counts in items[:limit]:
+        lines.append(line(*counts, name))
+    if len(items) > limit:
+        lines.append("%38s  (%d more)" % ("...", len(items) - limit))
+    lines.append("-" * len(header))
+    totals = [sum(counts[i] for counts in data.values()) for i in range(3)]
+    peak = max((counts[3] for counts in data.values()), default=0)
+    lines.append(line(*totals, peak, "total"))
+    return "\n".join(lines)
@@ -0,0 +1,154 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Memoization of grammar customization.
+
+customize_grammar_rules() walks the tokens of a code object and adds
+rules for the instructions it finds there. What gets added is decided by
+much less than the full token stream: the set of opcodes seen, a couple
+of flags, and for each instruction that gets rules, its name, its
+argument when the rules depend on it, and whatever it looks at in
+neighboring instructions. The parser's customize_signature() method
+boils a token stream down to that. Code objects in a module, and across
+a corpus, often have the same signature.
+
+The first time we see a signature, we run the customization and log the
+calls it makes that change the grammar; the parser logs them to its
+customize_log while that is set. After that, the log is replayed.
+The replayed calls go through the same parser methods, so rules that
+are already in the grammar are skipped just as they are when
+customizing from scratch.
+
+The reduction checks that the customization sets up are compiled, see
+compile_reduce_checks(), when it is run, and what that gives is kept
+with the log, so replaying doesn't compile them again.
+"""
+
+# Stop adding entries beyond this many.
+MAX_ENTRIES = 5000
+
+# Logged customizations, keyed by parser class and signature.
+_entries = {}
+
+# How often a signature was found, not found, or couldn't be computed.
+stats = {"hits": 0, "misses": 0, "uncached": 0}
+
+
+class _FromToken:
+    """Stands in for an add_unique_rule() argument count that is an
+    instruction argument not covered by the signature, such as the code
+    object of a LOAD_LISTCOMP. On replay it is taken from the first token
+    with the given opname."""
+
+    def __repr__(self) -> str:
+        return "FROM_TOKEN"
+
+
+FROM_TOKEN = _FromToken()
+
+
+def customize_grammar_rules(p, tokens: list, customize: dict) -> None:
+    """Run p.customize_grammar_rules(tokens, customize), or replay what
+    it did the last time it saw tokens with the same signature."""
+    signature = p.customize_signature(tokens, customize)
+    if signature is None:
+        stats["uncached"] += 1
+        p.customize_grammar_rules(tokens, customize)
+        p.compile_reduce_checks()
+        return
+    key, token_keys = signature
+    key = (p.__class__, key)
+    entry = _entries.get(key)
+    if entry is not None:
+        stats["hits"] += 1
+        replay(p, entry, tokens, token_keys, customize)
+        return
+    stats["misses"] += 1
+    entry = record(p, tokens, token_keys, customize)
+    if entry is not None and len(_entries) < MAX_ENTRIES:
+        _entries[key] = entry
+
+
+def record(p, tokens: list, token_keys: list, customize: dict):
+    """Customize the grammar of *p* for *tokens* and compile its
+    reduction checks, and return a log of what was done. None is
+    returned if token kinds were changed in a way that doesn't follow
+    from the signature."""
+    kinds = [t.kind for t in tokens]
+    calls = []
+    outer_log, p.customize_log = p.customize_log, calls
+    try:
+        p.customize_grammar_rules(tokens, customize)
+    finally:
+        p.customize_log = outer_log
+    p.compile_reduce_checks()
+
+    log = []
+    for name, args in calls:
+        if name == "add_unique_rule":
+            rule, opname, arg_count = args[:3]
+            if opname.startswith("LOAD_"):
+                arg_count = FROM_TOKEN
+            args = (rule, opname, arg_count)
+        log.append((name, args))
+
+    # customize_grammar_rules() renames some instructions, for example
+    # CALL_FUNCTION becomes CALL_FUNCTION_<n>.
+    new_kinds = {}
+    for token, kind, token_key in zip(tokens, kinds, token_keys):
+        if token.kind != kind:
+            if token_key is None:
+                return None
+            if new_kinds.setdefault(token_key, token.kind) != token.kind:
+                return None
+
+    return {
+        "log": tuple(log),
+        "new_kinds": new_kinds,
+        "check_reduce": dict(p.check_reduce),
+        "reduce_check_table": dict(getattr(p, "reduce_check_table", {})),
+        "memoized_reduce_checks": p.memoized_reduce_checks,
+    }
+
+
+def replay(p, entry: dict, tokens: list, token_keys: list, customize: dict) -> None:
+    for name, args in entry["log"]:
+        if name == "add_unique_rule":
+            rule, opname, arg_count = args
+            if arg_count is FROM_TOKEN:
+                arg_count = next(t.attr for t in tokens if t.kind == opname)
+            p.add_unique_rule(rule, opname, arg_count, customize)
+        else:
+            getattr(p, name)(*args)
+
+    new_kinds = entry["new_kinds"]
+    if new_kinds:
+        for token, token_key in zip(tokens, token_keys):
+            kind = new_kinds.get(token_key)
+            if kind is not None:
+                token.kind = kind
+
+    # The reduction checks that customization sets up don't depend on
+    # the tokens, and were compiled when they were logged.
+    p.check_reduce = dict(entry["check_reduce"])
+    p.reduce_check_table = dict(entry["reduce_check_table"])
+    p.memoized_reduce_checks = entry["memoized_reduce_checks"]
+
+
+def clear() -> None:
+    """Forget logged customizations and reset the counters."""
+    _entries.clear()
+    for name in stats:
+        stats[name] = 0
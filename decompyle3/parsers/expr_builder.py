@@ -0,0 +1,430 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Building expressions ahead of parsing.
+
+Much of the grammar rebuilds expressions: calls, attribute chains,
+binary operations, subscripts and so on. Within a basic block, the
+instructions for those are evaluated on the stack in the order they
+appear, so simulating the stack is enough to put their trees together.
+
+reduce_expressions() does that for each run of such instructions, and
+replaces each expression built, other than a lone load, by a single
+pre-reduced token. These are the terminals in PRE_REDUCED; the grammar
+has "expr ::= EXPR" and the like for them, and the parser's terminal()
+hands back the tree the token stands for. What the Earley parser is
+left with is mostly statement and control-flow structure.
+
+The trees are built with the rules of the parser's grammar and the
+functions that go with them, so they are the ones the Earley parser
+builds. An instruction that can't be reduced here, because it isn't
+handled, its operands aren't all in the run, the rule it needs isn't in
+the customized grammar or has a reduce check, is left for the Earley
+parser along with what is on the stack. Runs end at jump targets, and
+the value that follows a conditional jump is left alone too: the
+Earley parser may take it as the end of an "and" or "or", unless it
+starts a huge literal; see HUGE_LITERAL.
+"""
+
+from decompyle3.scanners.tok import Token, off2int
+
+# How many tokens were offered, and how many are left after building
+# expressions.
+stats = {"tokens": 0, "reduced": 0}
+
+# The terminals that stand for expressions built here. The kinds of
+# expression that some rule uses other than as an "expr" get their own.
+PRE_REDUCED = {"call": "EXPR_CALL", "compare": "EXPR_COMPARE"}
+PRE_REDUCED_KINDS = frozenset(PRE_REDUCED.values()) | {"EXPR"}
+
+# Loads that are left as they are until we see what they are used for;
+# some rules use them other than as an "expr".
+LOADS = frozenset(
+    (
+        "LOAD_CONST",
+        "LOAD_DEREF",
+        "LOAD_FAST",
+        "LOAD_GLOBAL",
+        "LOAD_NAME",
+        "LOAD_STR",
+    )
+)
+
+# The nonterminal built by each BUILD_xxx_n instruction.
+COLLECTIONS = {
+    "BUILD_LIST": "list",
+    "BUILD_SET": "set",
+    "BUILD_STRING": "joined_str",
+    "BUILD_TUPLE": "tuple",
+}
+
+# How many items a list, set, tuple or dict made of loads alone needs to
+# be built here even though the first of them follows a conditional jump.
+# Literals like that run to thousands of items in generated tables, and
+# the Earley parser takes time more than linear in their length.
+HUGE_LITERAL = 256
+
+# Those of COLLECTIONS whose items the grammar groups by 32 and 1024.
+GROUPED = frozenset(("BUILD_LIST", "BUILD_SET", "BUILD_TUPLE"))
+
+
+class NotReduced(Exception):
+    """The instruction is left to the Earley parser."""
+
+
+def shrinkage() -> float:
+    """Return how many times fewer tokens the Earley parser was given."""
+    return stats["tokens"] / stats["reduced"] if stats["reduced"] else 1.0
+
+
+def clear() -> None:
+    """Reset the counters."""
+    for name in stats:
+        stats[name] = 0
+
+
+def first_token(node):
+    """Return the token that *node*, a tree built here, starts with."""
+    while not isinstance(node, Token):
+        node = node[0]
+    return node
+
+
+def last_token(node):
+    """Return the token that *node*, a tree built here, ends with."""
+    while not isinstance(node, Token):
+        node = node[-1]
+    return node
+
+
+def lone_token(node):
+    """Return the token of *node*, a tree built here, if it has only
+    the one."""
+    while not isinstance(node, Token):
+        if len(node) != 1:
+            return None
+        node = node[0]
+    return node
+
+
+def expand(tokens, index: int):
+    """Return *tokens* with each pre-reduced token replaced by the
+    instructions it stands for, and where the token at *index* went."""
+    expanded = []
+    new_index = None
+    for i, token in enumerate(tokens):
+        if i == index:
+            new_index = len(expanded)
+        if token.kind in PRE_REDUCED_KINDS:
+            expanded.extend(leaves(token.attr))
+        else:
+            expanded.append(token)
+    if new_index is None:
+        new_index = len(expanded) + index - len(tokens)
+    return expanded, new_index
+
+
+def leaves(node) -> list:
+    """Return the tokens of *node*, a tree built here, in order."""
+    if isinstance(node, Token):
+        return [node]
+    return [token for child in node for token in leaves(child)]
+
+
+def jump_targets(tokens) -> frozenset:
+    """Return the offsets jumped to by *tokens*."""
+    jumps = tokens[0].opc.JUMP_OPS
+    return frozenset(token.attr for token in tokens if token.op in jumps)
+
+
+def reduce_expressions(p, tokens, chunks=()):
+    """Return *tokens* with the expressions that can be built ahead of
+    parsing with parser *p* replaced by pre-reduced tokens, and *chunks*,
+    indices at which *tokens* can be split into statements, adjusted to
+    match. Indices that now fall inside a pre-reduced token are dropped.
+    The grammar of *p* should have been customized for *tokens*.
+    """
+    stats["tokens"] += len(tokens)
+    if not tokens or ("expr", ("EXPR",)) not in p.rule2func:
+        stats["reduced"] += len(tokens)
+        return tokens, chunks
+
+    builder = ExpressionBuilder(p)
+    stack = builder.stack
+    targets = jump_targets(tokens)
+    chunks = frozenset(chunks)
+    new_chunks = []
+    reduced = []
+
+    def flush():
+        builder.floor = 0
+        for item in stack:
+            if isinstance(item, Token):
+                reduced.append(item)
+            elif lone_token(item):
+                # Something like BUILD_LIST_0, which starts comprehensions
+                # too; the grammar wants the instruction there.
+                reduced.append(lone_token(item))
+            else:
+                reduced.append(pre_reduced(item))
+        del stack[:]
+
+    for i, token in enumerate(tokens):
+        if stack and token.off2int(prefer_last=False) in targets:
+            flush()
+        if i in chunks and not stack:
+            new_chunks.append(len(reduced))
+        kind = token.kind
+        if kind in LOADS:
+            stack.append(token)
+            continue
+        method, count = builder.method(kind)
+        if method is not None:
+            saved = stack[:]
+            try:
+                if count is None:
+                    method(builder, token)
+                else:
+                    method(builder, token, count)
+                continue
+            except NotReduced:
+                stack[:] = saved
+        flush()
+        reduced.append(token)
+        if "JUMP_IF" in kind:
+            # The Earley parser can take what comes next as the end of an
+            # "and" or "or" and apply the operator consuming it to that,
+            # so it is left to it.
+            builder.floor = 1
+    flush()
+
+    stats["reduced"] += len(reduced)
+    return reduced, tuple(new_chunks)
+
+
+def pre_reduced(expr):
+    """Return the token standing for *expr*, an "expr" tree."""
+    node = expr[0]
+    first = first_token(node)
+    token = PreReducedToken(
+        PRE_REDUCED.get(node.kind, "EXPR"),
+        attr=node,
+        pattr=node.kind,
+        linestart=first.linestart,
+        opc=first.opc,
+    )
+    token.offset = first.offset
+    token.last_offset = last_token(node).offset
+    return token
+
+
+class PreReducedToken(Token):
+    """A token standing for an expression built ahead of parsing.
+
+    Its offset is that of the first instruction of the expression. Like
+    a token preceded by EXTENDED_ARG, it covers more than one offset:
+    off2int() gives the last instruction's unless *prefer_last* is
+    false, which is what reduce checks looking for where a rule ends
+    expect.
+    """
+
+    __slots__ = ("last_offset",)
+
+    def off2int(self, prefer_last=True) -> int:
+        if prefer_last:
+            return off2int(self.last_offset, prefer_last)
+        return off2int(self.offset, prefer_last)
+
+
+class ExpressionBuilder:
+    """Build expressions with the rules of a parser's grammar by
+    simulating the stack. Items on the stack are either tokens not yet
+    reduced, see LOADS, or "expr" trees.
+    """
+
+    def __init__(self, p):
+        self.rule2func = p.rule2func
+        self.check_reduce = p.check_reduce
+        self.stack = []
+        # How many items at the bottom of the stack can't be popped.
+        self.floor = 0
+
+    def reduce(self, lhs: str, args: list, rhs=None):
+        """Reduce *args* with the rule *lhs* ::= *rhs*, which is taken
+        from the kinds of *args* if it isn't given."""
+        if rhs is None:
+            rhs = tuple(arg.kind for arg in args)
+        func = self.rule2func.get((lhs, rhs))
+        if func is None or lhs in self.check_reduce:
+            raise NotReduced
+        return func(args)
+
+    def method(self, kind: str):
+        """Return the method that handles instructions of kind *kind*,
+        and the count at the end of *kind*, if any."""
+        name, _, count = kind.rpartition("_")
+        if count.isdigit():
+            return self.COUNTED.get(name), int(count)
+        method = self.SIMPLE.get(kind)
+        if method is None:
+            if kind.startswith("BINARY_"):
+                method = ExpressionBuilder.binary_op
+            elif kind.startswith("UNARY_"):
+                method = ExpressionBuilder.unary_op
+        return method, None
+
+    def pop_expr(self):
+        if len(self.stack) <= self.floor:
+            raise NotReduced
+        return self.expr(self.stack.pop())
+
+    def pop_exprs(self, n: int) -> list:
+        if n > len(self.stack) - self.floor and not self.is_literal(n):
+            raise NotReduced
+        if n == 0:
+            return []
+        args = self.stack[-n:]
+        del self.stack[-n:]
+        return [self.expr(arg) for arg in args]
+
+    def is_literal(self, n: int) -> bool:
+        """Return whether the top *n* items of the stack are the items of
+        a huge literal: loads of constants or names, too many of them for
+        the first to be the end of an "and" or "or"."""
+        stack = self.stack
+        return HUGE_LITERAL <= n <= len(stack) and all(
+            isinstance(item, Token) for item in stack[-n:]
+        )
+
+    def pop_token(self, kind: str):
+        if len(self.stack) <= self.floor:
+            raise NotReduced
+        token = self.stack.pop()
+        if not isinstance(token, Token) or token.kind != kind:
+            raise NotReduced
+        return token
+
+    def expr(self, item):
+        if isinstance(item, Token):
+            return self.reduce("expr", [item])
+        if getattr(item, "kind", None) != "expr":
+            raise NotReduced
+        return item
+
+    def push_expr(self, node) -> None:
+        self.stack.append(self.reduce("expr", [node]))
+
+    def binary_op(self, token) -> None:
+        op = self.reduce("binary_operator", [token])
+        right = self.pop_expr()
+        left = self.pop_expr()
+        self.push_expr(self.reduce("bin_op", [left, right, op]))
+
+    def unary_op(self, token) -> None:
+        if token.kind == "UNARY_NOT":
+            self.push_expr(self.reduce("unary_not", [self.pop_expr(), token]))
+            return
+        op = self.reduce("unary_operator", [token])
+        self.push_expr(self.reduce("unary_op", [self.pop_expr(), op]))
+
+    def subscript(self, token) -> None:
+        index = self.pop_expr()
+        self.push_expr(self.reduce("subscript", [self.pop_expr(), index, token]))
+
+    def compare_op(self, token) -> None:
+        right = self.pop_expr()
+        compare = self.reduce("compare_single", [self.pop_expr(), right, token])
+        self.push_expr(self.reduce("compare", [compare]))
+
+    def format_value(self, token) -> None:
+        self.push_expr(self.reduce("formatted_value1", [self.pop_expr(), token]))
+
+    def load_attr(self, token) -> None:
+        self.push_expr(self.reduce("attribute", [self.pop_expr(), token]))
+
+    def load_method(self, token) -> None:
+        self.push_expr(self.reduce("attribute37", [self.pop_expr(), token]))
+
+    def call(self, token, count: int) -> None:
+        if token.attr != count:
+            raise NotReduced
+        args = self.pop_exprs(count + 1)
+        self.push_expr(self.reduce("call", args + [token]))
+
+    def build_collection(self, token, count: int) -> None:
+        name = token.kind.rpartition("_")[0]
+        args = self.pop_exprs(count)
+        if name in GROUPED:
+            args = self.group(args)
+        self.push_expr(self.reduce(COLLECTIONS[name], args + [token]))
+
+    def group(self, exprs: list) -> list:
+        """Return *exprs*, the items of a list, set or tuple, with those
+        at the front grouped into "expr1024" and "expr32" nodes the way
+        the grammar has it for long collections."""
+        count = len(exprs)
+        if count < 32:
+            return exprs
+        grouped = count // 32 * 32
+        in_1024s = count // 1024 * 32
+        expr32s = [
+            self.reduce("expr32", exprs[i : i + 32]) for i in range(0, grouped, 32)
+        ]
+        expr1024s = [
+            self.reduce("expr1024", expr32s[i : i + 32])
+            for i in range(0, in_1024s, 32)
+        ]
+        return expr1024s + expr32s[in_1024s:] + exprs[grouped:]
+
+    def build_slice(self, token, count: int) -> None:
+        args = self.pop_exprs(count)
+        self.push_expr(self.reduce("build_slice%d" % count, args + [token]))
+
+    def build_const_key_map(self, token, count: int) -> None:
+        keys = self.pop_token("LOAD_CONST")
+        args = self.pop_exprs(count)
+        self.push_expr(self.reduce("dict", args + [keys, token]))
+
+    def build_map(self, token, count: int) -> None:
+        kvlist = "kvlist_%d" % count
+        kvlist = self.reduce(kvlist, self.pop_exprs(2 * count) + [token])
+        self.push_expr(self.reduce("dict", [kvlist]))
+
+    def build_map_unpack(self, token, count: int) -> None:
+        # Also how dict displays of more than 65535 entries are put
+        # together from pieces.
+        args = self.pop_exprs(count)
+        self.push_expr(self.reduce("unmap_dict", args + [token]))
+
+    SIMPLE = {
+        "BINARY_SUBSCR": subscript,
+        "COMPARE_OP": compare_op,
+        "FORMAT_VALUE": format_value,
+        "LOAD_ATTR": load_attr,
+        "LOAD_METHOD": load_method,
+    }
+
+    COUNTED = {
+        "BUILD_CONST_KEY_MAP": build_const_key_map,
+        "BUILD_LIST": build_collection,
+        "BUILD_MAP": build_map,
+        "BUILD_MAP_UNPACK": build_map_unpack,
+        "BUILD_SET": build_collection,
+        "BUILD_SLICE": build_slice,
+        "BUILD_STRING": build_collection,
+        "BUILD_TUPLE": build_collection,
+        "CALL_FUNCTION": call,
+        "CALL_METHOD": call,
+    }
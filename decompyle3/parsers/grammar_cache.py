@@ -0,0 +1,322 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Caching of the base grammar and the tables derived from it.
+
+Building a parser means collecting the rules found in the docstrings
+of every ``p_*`` method, splitting and storing each of them, and
+later computing the nullable symbols and epsilon-free rules that the
+Earley parser works from. None of that depends on the code being
+decompiled, so we do it once, save the result to disk and keep it in
+memory for the life of the process. The same goes for the full set of
+parse states, which checkpointed parsers build customized grammars from.
+
+The cache key includes the decompyle3 and spark_parser versions, the
+parser class (which fixes the bytecode version), the start symbol
+(which is fixed by the compile mode), a fingerprint of the grammar
+docstrings, and the modification times of the parser modules, so an
+edited grammar is never served from a stale cache.
+
+The location of the on-disk cache can be set with the environment
+variable DECOMPYLE3_GRAMMAR_CACHE. Setting it to the empty string or to
+"off" turns off the on-disk part of the cache. Each cache file starts
+with a line giving the versions of the cache format, decompyle3,
+spark_parser and Python that wrote it, and a file is only unpickled if
+those match the ones running.
+"""
+
+import hashlib
+import os
+import os.path as osp
+import pickle
+import sys
+import tempfile
+
+import spark_parser
+from spark_parser.spark import _namelist
+
+try:
+    from spark_parser.version import VERSION as SPARK_VERSION
+except ImportError:
+    # spark_parser 1.9 has __version__ only.
+    SPARK_VERSION = getattr(spark_parser, "__version__", "unknown")
+
+from decompyle3.version import __version__
+
+# Bump this when the layout of what we store changes.
+CACHE_FORMAT = 2
+
+# The first line of each cache file; see read_entry().
+CACHE_HEADER = (
+    "decompyle3 grammar cache %s %s %s %s\n"
+    % (
+        CACHE_FORMAT,
+        __version__,
+        SPARK_VERSION,
+        "%d.%d" % sys.version_info[:2],
+    )
+).encode("utf-8")
+
+# In-process copy of entries, keyed by cache key.
+_entries = {}
+
+# Cache keys, keyed by parser class and start symbol.
+_keys = {}
+
+
+def cache_dir():
+    """Return the directory used to store grammar tables, or None
+    if the on-disk cache has been turned off."""
+    path = os.environ.get("DECOMPYLE3_GRAMMAR_CACHE")
+    if path is None:
+        base = os.environ.get("XDG_CACHE_HOME") or osp.join(
+            osp.expanduser("~"), ".cache"
+        )
+        return osp.join(base, "decompyle3", "grammar")
+    if path in ("", "off"):
+        return None
+    return path
+
+
+def cacheable(parser) -> bool:
+    """Grammar coverage and duplicate-rule reporting hook into the
+    rule-collection phase, so they need a grammar built from scratch."""
+    return (
+        getattr(parser, "start_symbol", None) is not None
+        and getattr(parser, "profile_info", None) is None
+        and not getattr(parser, "debug", {}).get("dups", False)
+    )
+
+
+def grammar_key(parser) -> str:
+    """Return the cache key of the base grammar of *parser*."""
+    cls = parser.__class__
+    key = _keys.get((cls, parser.start_symbol))
+    if key is not None:
+        return key
+    fingerprint = hashlib.sha1()
+    for name in _namelist(parser):
+        if name[:2] == "p_":
+            fingerprint.update(name.encode("utf-8"))
+            fingerprint.update((getattr(parser, name).__doc__ or "").encode("utf-8"))
+    # Rules can also be added or removed in code, so an edit to any of the
+    # parser modules invalidates the cache.
+    for klass in cls.__mro__:
+        path = getattr(sys.modules.get(klass.__module__), "__file__", None)
+        if path is not None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+    key = "|".join(
+        (
+            str(CACHE_FORMAT),
+            __version__,
+            SPARK_VERSION,
+            cls.__module__,
+            cls.__qualname__,
+            parser.start_symbol,
+            fingerprint.hexdigest(),
+        )
+    )
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    key = f"{cls.__name__}-{parser.start_symbol}-{digest}"
+    _keys[cls, parser.start_symbol] = key
+    return key
+
+
+def load_rules(parser) -> bool:
+    """Fill in the collected grammar rules of *parser* from the cache.
+    Return False if there is nothing cached.
+    """
+    key = grammar_key(parser)
+    entry = _entries.get(key)
+    if entry is None:
+        entry = read_entry(key)
+        if entry is None:
+            parser.grammar_cache_entry = {"key": key}
+            return False
+        _entries[key] = entry
+
+    # Customization appends to and removes from the rule lists, so each
+    # parser gets its own copy of those.
+    parser.rules = {lhs: list(rules) for lhs, rules in entry["rules"].items()}
+    parser.rule2name = dict(entry["rule2name"])
+    parser.rule2func = {
+        rule: parser.preprocess(rule, None)[1] for rule in parser.rule2name
+    }
+    parser.optional_nt |= entry["optional_nt"]
+    parser.list_like_nt |= entry["list_like_nt"]
+    parser.grammar_cache_entry = entry
+    return True
+
+
+def save_rules(parser) -> None:
+    """Record the collected grammar rules of *parser*. They are written out
+    along with the derived tables once those have been computed."""
+    parser.grammar_cache_entry.update(
+        {
+            "rules": {lhs: tuple(rules) for lhs, rules in parser.rules.items()},
+            "rule2name": dict(parser.rule2name),
+            "optional_nt": frozenset(parser.optional_nt),
+            "list_like_nt": frozenset(parser.list_like_nt),
+        }
+    )
+
+
+def install_tables(parser) -> None:
+    """Give the newly built grammar of *parser* its nullable and
+    epsilon-free rule tables, computing and saving them if this is the
+    first time we have seen this grammar.
+    """
+    entry = parser.grammar_cache_entry
+    if "newrules" not in entry:
+        parser.computeNull()
+        parser.newrules = {}
+        parser.new2old = {}
+        parser.makeNewRules()
+        entry["nullable"] = parser.nullable
+        entry["newrules"] = parser.newrules
+        entry["new2old"] = parser.new2old
+        _entries[entry["key"]] = entry
+        write_entry(entry)
+    else:
+        # These are replaced, never updated in place, when the
+        # grammar changes, so they can be shared between parsers.
+        parser.nullable = entry["nullable"]
+        parser.newrules = entry["newrules"]
+        parser.new2old = entry["new2old"]
+
+    parser.ruleschanged = False
+    parser.edges, parser.cores = {}, {}
+    parser.states = {0: parser.makeState0()}
+    parser.makeState(0, parser._BOF)
+
+
+def complete_states(parser) -> None:
+    """Build every parse state of the grammar of *parser*, not just the
+    ones that parsing has needed so far. If the grammar is the cached
+    base grammar, or one changed from it, the states are saved with it,
+    so this is done once.
+    """
+    entry = getattr(parser, "grammar_cache_entry", None)
+    if entry is not None and entry.get("newrules") is not parser.newrules:
+        # The grammar has been changed since it was built.
+        entry = changed_entry(parser, entry)
+    if entry is not None and "states" in entry:
+        parser.states = dict(entry["states"])
+        parser.edges = dict(entry["edges"])
+        parser.cores = dict(entry["cores"])
+        return
+
+    edges = parser.edges
+    pending = [key for key, state in edges.items() if state is None]
+    while pending:
+        for key in pending:
+            parser.goto(*key)
+        pending = [key for key, state in edges.items() if state is None]
+
+    if entry is not None:
+        # Parse states are never changed once built, so they can be
+        # shared between parsers.
+        entry["states"] = dict(parser.states)
+        entry["edges"] = dict(parser.edges)
+        entry["cores"] = dict(parser.cores)
+        write_entry(entry)
+
+
+def changed_entry(parser, entry: dict) -> dict:
+    """Return the cache entry for the grammar of *parser*, which was
+    built as the grammar of *entry* and then had rules added or removed,
+    giving *parser* the tables cached there if there are any."""
+    rules = sorted(rule for lhs_rules in parser.rules.values() for rule in lhs_rules)
+    digest = hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()[:20]
+    key = f"{entry['key']}-{digest}"
+    entry = _entries.get(key) or read_entry(key) or {"key": key}
+    _entries[key] = entry
+    if "newrules" in entry:
+        parser.nullable = entry["nullable"]
+        parser.newrules = entry["newrules"]
+        parser.new2old = entry["new2old"]
+    else:
+        entry["nullable"] = parser.nullable
+        entry["newrules"] = parser.newrules
+        entry["new2old"] = parser.new2old
+    return entry
+
+
+def cache_path(key: str):
+    path = cache_dir()
+    if path is None:
+        return None
+    return osp.join(path, key + ".pickle")
+
+
+def read_entry(key: str):
+    path = cache_path(key)
+    if path is None or not osp.exists(path):
+        return None
+    try:
+        with open(path, "rb") as fp:
+            # Don't unpickle what other versions wrote.
+            if fp.readline() != CACHE_HEADER:
+                return None
+            entry = pickle.load(fp)
+    except Exception:
+        # A truncated or otherwise unusable file is just a cache miss.
+        return None
+    if not isinstance(entry, dict) or entry.get("key") != key:
+        return None
+    return entry
+
+
+def write_entry(entry: dict) -> None:
+    path = cache_path(entry["key"])
+    if path is None:
+        return
+    try:
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename it so that concurrent
+        # processes never see a partially written file.
+        fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(path), suffix=".tmp")
+    except OSError:
+        # The cache is only an optimization; a read-only or full
+        # file system should not stop us from decompiling.
+        return
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(CACHE_HEADER)
+            pickle.dump(entry, fp, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def clear_cache() -> None:
+    """Forget in-process entries and remove on-disk ones."""
+    _entries.clear()
+    path = cache_dir()
+    if path is None or not osp.isdir(path):
+        return
+    for name in os.listdir(path):
+        if name.endswith(".pickle"):
+            try:
+                os.remove(osp.join(path, name))
+            except OSError:
+                pass
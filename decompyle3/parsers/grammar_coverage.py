@@ -0,0 +1,133 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Grammar coverage.
+
+When collecting is turned on with profile.enable(), each grammar a
+parse uses is registered with all of its rules, and each rule is
+counted every time a tree node is built with it. That includes nodes
+built for reduce checks and expressions built ahead of the Earley
+parser. Grammars go by
+the name of their parser class, since for example the rules of
+Python37Parser and Python38Parser overlap.
+
+Collecting is done in the process that decompiles, so unlike spark's
+SPARK_PARSER_COVERAGE there is no pickle file rewritten after each
+parse, and the grammar cache stays in use. Worker processes send back
+a profile.snapshot() that is merged into the parent's.
+
+The report that format_report() gives and update() writes lists, for
+each grammar, its unused rules and then its used ones by how often they
+were used, the way spark-parser-coverage does:
+
+    # decompyle3 grammar coverage, format 1
+    # Python38Parser: 612 of 1013 rules used
+    0: async_for ::= GET_AITER _come_froms SETUP_FINALLY ...
+    ...
+    1204: expr ::= LOAD_FAST
+
+A report can be read back with read(), so that coverage of several runs
+can be added up.
+"""
+
+from typing import Dict, Optional
+
+from spark_parser.spark import rule2str
+
+from decompyle3.parsers.profiling import Profile
+
+HEADER = "# decompyle3 grammar coverage, format 1"
+
+
+def add_counts(counts: Dict[tuple, int], more: Dict[tuple, int]) -> None:
+    for rule, count in more.items():
+        counts[rule] = counts.get(rule, 0) + count
+
+
+# Per grammar, the reductions by each of its rules.
+profile = Profile(add_counts, dict)
+
+
+def add_grammar(p) -> None:
+    """Register the grammar of parser *p*, as it was before any
+    customization, if it hasn't been. The start rule, which no tree is
+    built with, is left out."""
+    grammars = profile.data
+    name = type(p).__name__
+    if name in grammars:
+        return
+    checkpoint = getattr(p, "grammar_checkpoint", None)
+    rules = checkpoint["rule2func"] if checkpoint else p.rule2func
+    counts = grammars.setdefault(name, {})
+    for rule in rules:
+        if rule[0] != p._START:
+            counts.setdefault(rule, 0)
+
+
+def record(name: str, rule: tuple) -> None:
+    grammars = profile.data
+    counts = grammars.get(name)
+    if counts is None:
+        counts = grammars[name] = {}
+    counts[rule] = counts.get(rule, 0) + 1
+
+
+def format_report(data: Optional[Dict[str, Dict[tuple, int]]] = None) -> str:
+    if data is None:
+        data = profile.snapshot()
+    lines = [HEADER]
+    for name, counts in sorted(data.items()):
+        used = sum(1 for count in counts.values() if count)
+        lines.append("# %s: %d of %d rules used" % (name, used, len(counts)))
+        for count, rule in sorted((count, rule) for rule, count in counts.items()):
+            lines.append("%d: %s" % (count, rule2str(rule)))
+    return "\n".join(lines) + "\n"
+
+
+def parse_report(text: str) -> Dict[str, Dict[tuple, int]]:
+    lines = text.splitlines()
+    if not lines or lines[0] != HEADER:
+        raise ValueError(
+            "not a grammar coverage report, or not one in a format we know"
+        )
+    data = {}
+    counts = None
+    for line in lines[1:]:
+        if line.startswith("# "):
+            counts = data.setdefault(line[2:].partition(":")[0], {})
+        elif line:
+            count, _, rule = line.partition(": ")
+            lhs, _, rhs = rule.partition(" ::=")
+            counts[(lhs, tuple(rhs.split()))] = int(count)
+    return data
+
+
+def read(path: str) -> Dict[str, Dict[tuple, int]]:
+    """Return the coverage in the report file *path*."""
+    with open(path) as fp:
+        return parse_report(fp.read())
+
+
+def update(path: str) -> None:
+    """Add what has been collected here to the report file *path*,
+    creating it if there isn't one."""
+    data = profile.snapshot()
+    try:
+        for name, counts in read(path).items():
+            add_counts(data.setdefault(name, {}), counts)
+    except FileNotFoundError:
+        pass
+    with open(path, "w") as fp:
+        fp.write(format_report(data))
@@ -28,33 +28,190 @@ Note however all of this is imported from the __init__ module
 """
 
 import sys
+from copy import copy
+from functools import wraps
+from time import perf_counter
 
 from xdis import iscode
 from xdis.version_info import version_tuple_to_str
 from spark_parser import GenericASTBuilder, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
+from decompyle3.scanners.tok import off2int, offset2str
 from decompyle3.show import maybe_show_asm
+from decompyle3.parsers import (
+    ambiguity_profile,
+    chart_profile,
+    customize_cache,
+    expr_builder,
+    grammar_cache,
+    grammar_coverage,
+    rule_profile,
+    straight_line,
+)
+
+# spark_parser 1.9 hands error() a wrong token index, so there the
+# parser keeps track of the index it got to itself; see error().
+TRACK_ERROR_INDEX = not grammar_cache.SPARK_VERSION.startswith("1.8.")
+
+# Parse states that customized grammars always build for themselves:
+# state 0, and states 1 and 2 which parsing starts out from.
+OVERLAY_FRESH = (0, 1, 2)
+
+# Limits that can be put on parsing a code object, and what they count.
+BUDGETS = {
+    "items": "Earley items",
+    "reductions": "reductions",
+    "seconds": "seconds",
+    "nodes": "tree nodes",
+}
 
 
 class ParserError(Exception):
-    def __init__(self, token, offset: int, debug: bool):
+    """A parse failed at *token*.
+
+    Failures are common enough when decompiling a lot of code that
+    working out the diagnostics for them up front would cost more than
+    the parse did. So the parser just hands over what it had at the
+    time: *context*, the instructions and the index of the one where
+    the failure is, and *errorstack*, the parse states at the failure
+    and the table of them. The instructions around the failure are
+    only worked out from these when the error is shown, and the stacks
+    of completed symbols only when asked for with format_errorstack(),
+    or with verbose() for everything.
+    """
+
+    def __init__(
+        self, token, offset: int, debug: bool, context=None, errorstack=None
+    ):
         self.token = token
         self.offset = offset
         self.debug = debug
+        self.context = context
+        self.errorstack = errorstack
 
     def __str__(self) -> str:
-        return "Parse error at or near `%r' instruction at offset %s\n" % (
+        return "Parse error at or near `%r' instruction at offset %s\n%s" % (
             self.token,
-            self.offset,
+            offset2str(self.offset),
+            self.format_context(),
+        )
+
+    def format_context(self) -> str:
+        """Return the instructions of the line the parse failed in, with
+        an arrow at the failing one, or "" if we don't have them."""
+        if self.context is None:
+            return ""
+        instructions, index = self.context
+        # Report the instructions, not the expressions built from them.
+        if any(t.kind in expr_builder.PRE_REDUCED_KINDS for t in instructions):
+            instructions, index = expr_builder.expand(instructions, index)
+        # Find the last line boundary
+        start, finish = -1, -1
+        for start in range(index, -1, -1):
+            if instructions[start].linestart:
+                break
+            pass
+        for finish in range(index + 1, len(instructions)):
+            if instructions[finish].linestart:
+                break
+            pass
+        lines = ["Instruction context:"]
+        for i in range(start, finish):
+            indent = "-> " if i == index else "   "
+            lines.append("%s%s" % (indent, instructions[i]))
+        return "\n".join(lines) + "\n"
+
+    def format_errorstack(self) -> str:
+        """Return the stacks of completed symbols at the failure, as
+        spark's errorstack() would have shown them, or "" if the parser
+        wasn't asked to keep them."""
+        if self.errorstack is None:
+            return ""
+        states, edge_states, full = self.errorstack
+        state_stack = set()
+        for state in edge_states:
+            if not state:
+                continue
+            # Keep the rules that can follow, up to the dot.
+            for (lhs, rhs), dot in states[state].items:
+                if dot > 0:
+                    if full:
+                        state_stack.add(
+                            "%s ::= %s . %s"
+                            % (lhs, " ".join(rhs[:dot]), " ".join(rhs[dot:]))
+                        )
+                    else:
+                        state_stack.add("%s ::= %s" % (lhs, " ".join(rhs[:dot])))
+        return "\n-- Stacks of completed symbols:\n" + "".join(
+            stack + "\n" for stack in sorted(state_stack)
         )
 
+    def verbose(self) -> str:
+        """Return the message with all the diagnostics we can give."""
+        return str(self) + self.format_errorstack()
+
+
+class ParserBudgetExceeded(Exception):
+    """Parsing a code object went over one of its BUDGETS. This isn't a
+    ParserError: the code may well be fine, and we stop rather than try
+    to recover."""
+
+    def __init__(self, budget: str, limit, token=None):
+        self.budget = budget
+        self.limit = limit
+        self.token = token
+
+    def __str__(self) -> str:
+        mess = "Parse stopped after more than %s %s" % (self.limit, BUDGETS[self.budget])
+        if self.token is not None:
+            mess += " at or near `%r' instruction at offset %s" % (
+                self.token,
+                offset2str(self.token.offset),
+            )
+        return mess
+
 
 def nop_func(self, args):
     return None
 
 
+def logged_for_customize_cache(method):
+    """Have calls to the grammar-changing parser method *method* logged
+    while customize_cache records a customization; see
+    PythonLambdaParser.customize_log."""
+    name = method.__name__
+
+    @wraps(method)
+    def call(self, *args):
+        log = self.customize_log
+        if log is None:
+            return method(self, *args)
+        log.append((name, args))
+        # Calls this makes to logged methods aren't logged, since
+        # replaying this call repeats them.
+        self.customize_log = None
+        try:
+            return method(self, *args)
+        finally:
+            self.customize_log = log
+
+    return call
+
+
 class PythonLambdaParser(GenericASTBuilder):
+    # While customize_cache records a customization, a list that calls
+    # changing the grammar are logged to as (method name, args) pairs.
+    customize_log = None
+
+    addRule = logged_for_customize_cache(GenericASTBuilder.addRule)
+    remove_rules = logged_for_customize_cache(GenericASTBuilder.remove_rules)
+
     def __init__(self, SyntaxTree, start_symbol, debug):
+        # Needed before the grammar is collected; it is part of the
+        # grammar cache key.
+        self.start_symbol = start_symbol
         super(PythonLambdaParser, self).__init__(SyntaxTree, start_symbol, debug)
+        if self.grammar_cache_entry is not None:
+            grammar_cache.install_tables(self)
         # FIXME: customize per python parser version
 
         # These are the non-terminals we should collect into a list.
@@ -92,20 +249,597 @@ class PythonLambdaParser(GenericASTBuilder):
         # so on but that would require major changes to the
         # semantic actions
         self.singleton = frozenset(("str", "store", "inplace_op"))
-        # Instructions filled in from scanner
+        # Instructions and their control-flow graph filled in from scanner
         self.insts = []
+        self.cfg = None
 
         # true if we are parsing inside a lambda expression.
         # because a lambda expression are wrtten on a single line, certain line-oriented
         # statements behave differently
         self.is_lambda = True
 
+        # Identifies the grammar the derived tables are for, when we can
+        # tell grammars apart cheaply; see install_overlay().
+        self.tables_key = None
+        # Tables for pruned grammars, keyed by tables_key and the
+        # instructions seen. The most recently used come last.
+        self.pruned_tables = {}
+
+        # Verdicts of reduce checks in the current parse; see reduce_memo.
+        self.reduce_memo = {}
+
+        # For each epsilon-free rule, what ambiguity() goes by; filled in
+        # by checkpoint() for the checkpointed grammar, and as they come
+        # up for rules added after that.
+        self.rule_priority = {}
+
+        # What is left of the budgets for the code being parsed, or None
+        # if there is no limit; see start_budgets().
+        self.budgets = None
+        self.nodes_left = None
+
+        # The number of Earley items at each position of the current parse
+        # when chart sizes are profiled, None otherwise; see chart_profile.
+        self.chart_sizes = None
+
+        # The index of the last token counting_makeSet() made a chart set
+        # for, None before it has been used; see error().
+        self.last_set = None
+
+    def collectRules(self):
+        """Collect grammar rules from the p_ docstrings, or from the
+        grammar cache if we have seen this grammar before.
+        """
+        if not grammar_cache.cacheable(self):
+            self.grammar_cache_entry = None
+            GenericASTBuilder.collectRules(self)
+        elif not grammar_cache.load_rules(self):
+            GenericASTBuilder.collectRules(self)
+            grammar_cache.save_rules(self)
+
+    # Attributes that customize_grammar_rules() changes, other than the
+    # grammar rules themselves.
+    checkpoint_attrs = (
+        "added_rules",
+        "check_reduce",
+        "customized",
+        "new_rules",
+        "reduce_check_table",
+    )
+
+    def make_tables(self) -> None:
+        """Compute the derived grammar tables, if the grammar has changed
+        since they were last computed. The parser does this itself as it
+        starts a parse."""
+        if self.ruleschanged:
+            self.computeNull()
+            self.newrules = {}
+            self.new2old = {}
+            self.makeNewRules()
+            self.ruleschanged = False
+            self.edges, self.cores = {}, {}
+            self.states = {0: self.makeState0()}
+            self.makeState(0, self._BOF)
+            self.tables_key = None
+
+    def checkpoint(self):
+        """Record the grammar as it stands now, so that rules added after
+        this, for example by customize_grammar_rules(), can be dropped
+        by rollback().
+        """
+        # Compute the derived tables now, so that after a rollback
+        # we are ready to parse without recomputing them.
+        self.make_tables()
+        # Customized grammars start out from the parse states of this one,
+        # so build them all now.
+        grammar_cache.complete_states(self)
+
+        # For each symbol, the parse states that have an item with the
+        # symbol right after the dot, and for each kernel state with
+        # predicted items, the state holding those.
+        after = {}
+        for n, state in self.states.items():
+            for (_, rhs), pos in state.items:
+                if pos < len(rhs):
+                    after.setdefault(rhs[pos], []).append(n)
+        nonkernel = {k: nk for (k, sym), nk in self.edges.items() if sym is None}
+
+        self.grammar_checkpoint = {
+            "rules": {lhs: tuple(rules) for lhs, rules in self.rules.items()},
+            "rule2func": dict(self.rule2func),
+            "rule2name": dict(self.rule2name),
+            "optional_nt": frozenset(self.optional_nt),
+            "list_like_nt": frozenset(self.list_like_nt),
+            "nullable": self.nullable,
+            "newrules": self.newrules,
+            "new2old": self.new2old,
+            "edges": dict(self.edges),
+            "cores": dict(self.cores),
+            "states": dict(self.states),
+            "after": after,
+            "nonkernel": nonkernel,
+            "rhs_symbols": frozenset(
+                sym for rules in self.rules.values() for _, rhs in rules for sym in rhs
+            ),
+            "attrs": {
+                attr: copy(getattr(self, attr))
+                for attr in self.checkpoint_attrs
+                if hasattr(self, attr)
+            },
+        }
+        self.rule_priority.update(
+            (rule, self.priority(rule)) for rule in self.new2old
+        )
+        # Grammar tables for customized grammars, keyed by the rules added
+        # since the checkpoint. The most recently used come last.
+        self.overlay_tables = {}
+        # For the code objects whose rules are overlaid on the checkpointed
+        # grammar, outermost first, the nested_code_keys() of each, and a
+        # grammar_mark() taken before its rules were added.
+        self.overlay_stack = []
+        # The tables of overlay_tables that are installed, if any.
+        self.overlay_entry = None
+        self.tables_key = ()
+        self.pruned_tables = {}
+
+    def rollback(self):
+        """Restore the grammar saved by the last checkpoint()."""
+        self.keep_overlay_states()
+        saved = self.grammar_checkpoint
+        if self.ruleschanged or self.newrules is not saved["newrules"]:
+            self.rules = {lhs: list(rules) for lhs, rules in saved["rules"].items()}
+            self.rule2func = dict(saved["rule2func"])
+            self.rule2name = dict(saved["rule2name"])
+            self.optional_nt = set(saved["optional_nt"])
+            self.list_like_nt = set(saved["list_like_nt"])
+            self.nullable = saved["nullable"]
+            self.newrules = saved["newrules"]
+            self.new2old = saved["new2old"]
+            self.ruleschanged = False
+            self.edges = dict(saved["edges"])
+            self.cores = dict(saved["cores"])
+            self.states = dict(saved["states"])
+        # Otherwise, parse states built since the checkpoint are still
+        # good, so we keep them.
+
+        for attr in self.checkpoint_attrs:
+            if attr in saved["attrs"]:
+                setattr(self, attr, copy(saved["attrs"][attr]))
+            elif hasattr(self, attr):
+                delattr(self, attr)
+        self.overlay_stack = []
+        self.tables_key = ()
+
+    def grammar_mark(self) -> dict:
+        """Record enough of the grammar to drop rules added after this
+        with restore_mark(). Unlike checkpoint() this is cheap, but
+        it relies on rules present now not being removed."""
+        return {
+            "lengths": {lhs: len(rules) for lhs, rules in self.rules.items()},
+            "last": {lhs: rules[-1] for lhs, rules in self.rules.items() if rules},
+            "optional_nt": set(self.optional_nt),
+            "list_like_nt": set(self.list_like_nt),
+            "attrs": {
+                attr: copy(getattr(self, attr))
+                for attr in self.checkpoint_attrs
+                if hasattr(self, attr)
+            },
+        }
+
+    def restore_mark(self, mark: dict) -> bool:
+        """Drop the rules added since *mark* was taken. If any rule
+        that was there at the time has been removed, nothing is done and
+        False is returned."""
+        lengths, last = mark["lengths"], mark["last"]
+        rules = self.rules
+        for lhs, lhs_rules in rules.items():
+            n = lengths.get(lhs, 0)
+            if len(lhs_rules) < n or (n and lhs_rules[n - 1] != last[lhs]):
+                return False
+
+        for lhs in list(rules.keys()):
+            n = lengths.get(lhs)
+            lhs_rules = rules[lhs]
+            if n is None:
+                del rules[lhs]
+            elif len(lhs_rules) > n:
+                lhs_rules, rules[lhs] = lhs_rules[n:], lhs_rules[:n]
+            else:
+                continue
+            for rule in lhs_rules:
+                del self.rule2func[rule]
+                del self.rule2name[rule]
+            self.ruleschanged = True
+        self.optional_nt = mark["optional_nt"]
+        self.list_like_nt = mark["list_like_nt"]
+        for attr, value in mark["attrs"].items():
+            setattr(self, attr, value)
+        return True
+
+    def push_overlay(self, code) -> None:
+        """Get ready to add the rules for *code*.
+
+        The rules of the code objects that *code* is nested in stay, since
+        those rules can be needed to parse it; for example, the rules for
+        an "async for" generator expression come from GET_AITER, which is
+        only found in the enclosing code. The rules of any other code
+        objects are dropped.
+        """
+        key = code_key(code)
+        while self.overlay_stack and key not in self.overlay_stack[-1][0]:
+            self.pop_overlay()
+        self.overlay_stack.append((nested_code_keys(code), self.grammar_mark()))
+
+    def pop_overlay(self) -> None:
+        """Drop the rules of the innermost code object."""
+        _, mark = self.overlay_stack.pop()
+        if not self.restore_mark(mark):
+            # Customization removed some rule we can't get back
+            # without starting over.
+            self.rollback()
+
+    # How many customized grammars we keep tables for. Only what differs
+    # from the tables of the checkpointed grammar is kept.
+    max_overlay_tables = 256
+
+    def install_overlay(self) -> None:
+        """Set up the derived grammar tables for the grammar as customized
+        since the last checkpoint(), starting from those of the checkpointed
+        grammar. If rules of the checkpointed grammar were removed, nothing
+        is done and the parser recomputes its tables from scratch.
+        """
+        if not self.ruleschanged:
+            return
+        self.keep_overlay_states()
+        self.tables_key = None
+        base_rules = self.grammar_checkpoint["rules"]
+        overlay = []
+        for lhs, rules in self.rules.items():
+            base = base_rules.get(lhs, ())
+            n = len(base)
+            if len(rules) < n or (n and rules[n - 1] != base[-1]):
+                return
+            overlay.extend(rules[n:])
+        overlay = tuple(overlay)
+
+        tables = self.overlay_tables.pop(overlay, None)
+        if tables is None:
+            tables = self.make_overlay_tables(overlay)
+            if tables is None:
+                return
+            if len(self.overlay_tables) >= self.max_overlay_tables:
+                del self.overlay_tables[next(iter(self.overlay_tables))]
+        self.overlay_tables[overlay] = tables
+        self.use_overlay_tables(tables)
+        self.ruleschanged = False
+        self.tables_key = overlay
+
+    def make_overlay_tables(self, overlay: tuple):
+        """Return how the nullable symbols, epsilon-free rules and parse
+        states of the checkpointed grammar change when the rules in
+        *overlay* are added.
+
+        Adding rules can only make more symbols nullable. As long as none
+        of those appear in the rules of the checkpointed grammar, its
+        epsilon-free rules are unchanged, and we just need to work out
+        those of the added rules, merging them in the order that
+        makeNewRules() would have produced them. Otherwise, None is
+        returned.
+
+        A parse state only changes if it predicts a nonterminal that gets
+        rules, so the others are taken from the checkpointed grammar. The
+        ones that change are left unreachable, and the parser builds new
+        ones in their place as it needs them.
+        """
+        saved = self.grammar_checkpoint
+        base_nullable = saved["nullable"]
+        nullable = dict(base_nullable)
+        rules = self.rules
+        tbd = []
+        for rule in overlay:
+            lhs, rhs = rule
+            nullable.setdefault(lhs, 0)
+            if len(rhs) == 0:
+                nullable[lhs] = 1
+            elif all(sym in rules for sym in rhs):
+                tbd.append(rule)
+        changes = True
+        while changes:
+            changes = False
+            for lhs, rhs in tbd:
+                if not nullable[lhs] and all(nullable[sym] for sym in rhs):
+                    nullable[lhs] = 1
+                    changes = True
+        rhs_symbols = saved["rhs_symbols"]
+        for lhs, _ in overlay:
+            if nullable[lhs] and not base_nullable.get(lhs) and lhs in rhs_symbols:
+                return None
+
+        # This is makeNewRules() run on just the added rules. It goes
+        # breadth-first, so within the rules for a nonterminal, those
+        # with fewer nullable symbols split out come first.
+        NULLABLE = self._NULLABLE
+        added = {}
+        new2old = {}
+        worklist = [(rule, 0, 1, rule) for rule in overlay]
+        for rule, i, candidate, oldrule in worklist:
+            lhs, rhs = rule
+            n = len(rhs)
+            while i < n:
+                sym = rhs[i]
+                if sym not in rules or not nullable.get(sym):
+                    candidate = 0
+                    i += 1
+                    continue
+                newrhs = list(rhs)
+                newrhs[i] = NULLABLE + sym
+                worklist.append(((lhs, tuple(newrhs)), i + 1, candidate, oldrule))
+                candidate = 0
+                i += 1
+            else:
+                if candidate:
+                    lhs = NULLABLE + lhs
+                    rule = (lhs, rhs)
+                added.setdefault(lhs, []).append(rule)
+                new2old[rule] = oldrule
+
+        def split_count(rule):
+            return sum(sym.startswith(NULLABLE) for sym in rule[1])
+
+        newrules = {}
+        base_newrules = saved["newrules"]
+        for lhs, lhs_rules in added.items():
+            # sort() is stable, so checkpointed rules stay ahead of
+            # added ones with the same number of nullable symbols split out.
+            merged = base_newrules.get(lhs, []) + lhs_rules
+            merged.sort(key=split_count)
+            newrules[lhs] = merged
+
+        after, nonkernel = saved["after"], saved["nonkernel"]
+        dirty = set()
+        for sym in added:
+            dirty.update(after.get(sym, ()))
+        # Kernel states that share a changed nonkernel state need a new
+        # link to the one that replaces it.
+        dirty.update([nonkernel[k] for k in dirty if k in nonkernel])
+        dirty.update([k for k, nk in nonkernel.items() if nk in dirty])
+
+        return {
+            "nullable": {lhs: nullable[lhs] for lhs, _ in overlay},
+            "newrules": newrules,
+            "new2old": new2old,
+            # Parse states are added to these as the parser builds them.
+            "states": {},
+            "edges": {
+                key: None
+                for key, n in saved["edges"].items()
+                if n in dirty or (key[0] in dirty and key[0] in OVERLAY_FRESH)
+            },
+            "cores": {},
+            "stale_cores": tuple(
+                core
+                for core, n in saved["cores"].items()
+                if n in dirty or n in OVERLAY_FRESH
+            ),
+            "size": 0,
+            "from_scratch": 0 in dirty,
+        }
+
+    def use_overlay_tables(self, tables: dict) -> None:
+        """Install the grammar tables described by *tables*, as returned by
+        make_overlay_tables()."""
+        saved = self.grammar_checkpoint
+        self.nullable = dict(saved["nullable"])
+        self.nullable.update(tables["nullable"])
+        self.newrules = dict(saved["newrules"])
+        self.newrules.update(tables["newrules"])
+        self.new2old = dict(saved["new2old"])
+        self.new2old.update(tables["new2old"])
+
+        if tables["from_scratch"]:
+            if not tables["states"]:
+                self.edges, self.cores = {}, {}
+                self.states = {0: self.makeState0()}
+                self.makeState(0, self._BOF)
+                tables["states"] = self.states
+                tables["edges"] = self.edges
+                tables["cores"] = self.cores
+            self.states, self.edges, self.cores = (
+                tables["states"],
+                tables["edges"],
+                tables["cores"],
+            )
+            return
+
+        self.states = dict(saved["states"])
+        self.states.update(tables["states"])
+        self.edges = dict(saved["edges"])
+        self.edges.update(tables["edges"])
+        self.cores = dict(saved["cores"])
+        for core in tables["stale_cores"]:
+            del self.cores[core]
+        self.cores.update(tables["cores"])
+        self.overlay_entry = tables
+        if tables["size"]:
+            return
+
+        # The parser starts out from states 1 and 2, the states after
+        # _BOF, so the first time around we build those anew in their
+        # places. New states after that are numbered from len(self.states)
+        # on, past the changed states.
+        states = self.states
+        self.states = {0: self.makeState0()}
+        self.makeState(0, self._BOF)
+        if len(self.states) != len(OVERLAY_FRESH):
+            # The states after _BOF came out differently; use only
+            # states built from scratch.
+            self.overlay_entry = None
+            tables["from_scratch"] = True
+            tables["states"] = {}
+            self.use_overlay_tables(tables)
+            return
+        states.update(self.states)
+        self.states = states
+
+    def keep_overlay_states(self) -> None:
+        """Save the parse states built since the tables of a customized
+        grammar were installed with them, so they needn't be built again
+        next time."""
+        tables = self.overlay_entry
+        self.overlay_entry = None
+        if tables is None or len(self.states) == tables["size"]:
+            return
+        saved = self.grammar_checkpoint
+        n = len(saved["states"])
+        tables["states"] = {
+            k: state
+            for k, state in self.states.items()
+            if k >= n or k in OVERLAY_FRESH
+        }
+        tables["cores"] = {
+            core: k for core, k in self.cores.items() if k >= n or k in OVERLAY_FRESH
+        }
+        base_edges = saved["edges"]
+        tables["edges"] = {
+            key: k for key, k in self.edges.items() if base_edges.get(key, -1) != k
+        }
+        tables["size"] = len(self.states)
+
+    # Whether parse() prunes the grammar down to the rules that can
+    # match the tokens being parsed. That is faster, but it is off
+    # unless asked for: where the grammar is ambiguous, spark settles
+    # on a parse by the order it finds Earley items in, and a smaller
+    # grammar finds them in another order, so the tree can differ from
+    # the one the whole grammar gives.
+    prune_grammar = False
+
+    # Whether a checkpointed parser overlays the rules of each code object
+    # on its checkpointed grammar, and drops them for code that isn't
+    # nested in it; see parse(). Otherwise, custom rules pile up in the
+    # grammar until rollback().
+    overlay_grammar = True
+
+    # Whether parse() tries reducing straight-line code without the
+    # Earley parser first; see straight_line.
+    straight_line_fast_path = True
+
+    # Whether parse() builds expressions before handing the tokens to
+    # the Earley parser; see expr_builder.
+    build_expressions = True
+
+    # The rules a rule profile has seen used, if the parser was given
+    # one; see get_python_parser() and parse_tokens().
+    hot_rules = None
+
+    # How many pruned grammars we keep tables for.
+    max_pruned_tables = 64
+
+    def prune(self, tokens: list, hot: bool = False):
+        """Switch to tables for the grammar less the rules that can't
+        match *tokens*, because they need an instruction that isn't
+        there, or a nonterminal that is left without rules. Earley
+        prediction then only works over rules that can be used. If *hot*
+        is set, rules not in hot_rules are left out too.
+
+        The tables that were in place are returned, for unprune().
+        None is returned if the grammar is left as it is.
+        """
+        self.make_tables()
+        kinds = frozenset(t.kind for t in tokens)
+        key = (self.tables_key, kinds, hot) if self.tables_key is not None else None
+        tables = self.pruned_tables.pop(key, None) if key else None
+        if tables is None:
+            newrules = self.pruned_rules(
+                kinds | {self._BOF}, self.hot_rules if hot else None
+            )
+            if self._START not in newrules:
+                return None
+            states = {}
+            tables = (newrules, {}, {}, states)
+            saved = self.newrules, self.edges, self.cores, self.states
+            self.newrules, self.edges, self.cores, self.states = tables
+            states[0] = self.makeState0()
+            self.makeState(0, self._BOF)
+        else:
+            saved = self.newrules, self.edges, self.cores, self.states
+            self.newrules, self.edges, self.cores, self.states = tables
+        if key:
+            if len(self.pruned_tables) >= self.max_pruned_tables:
+                del self.pruned_tables[next(iter(self.pruned_tables))]
+            self.pruned_tables[key] = tables
+        return saved
+
+    def unprune(self, saved: tuple) -> None:
+        """Switch back to the tables in place before prune()."""
+        self.newrules, self.edges, self.cores, self.states = saved
+
+    def pruned_rules(self, kinds: frozenset, keep=None) -> dict:
+        """Return the epsilon-free rules that can match a sequence of
+        tokens whose kinds are all in *kinds*. If *keep* is given, only
+        rules that come from one in it are returned, besides the start
+        rule that no tree is ever built with."""
+        newrules = self.newrules
+        new2old = self.new2old
+        NULLABLE = self._NULLABLE
+        START = self._START
+
+        # For each rule, how many of the nonterminals in it are still not
+        # known to derive anything, and for each nonterminal, the rules it
+        # occurs in.
+        waiting = {}
+        occurs_in = {}
+        ready = []
+        for lhs_rules in newrules.values():
+            for rule in lhs_rules:
+                if keep is not None and rule[0] != START and new2old[rule] not in keep:
+                    continue
+                # Nonterminals are counted once however often they occur:
+                # a rule for a huge literal has "expr" thousands of times.
+                needs = set()
+                for sym in rule[1]:
+                    if sym in newrules:
+                        needs.add(sym)
+                    elif sym not in kinds and not sym.startswith(NULLABLE):
+                        break
+                else:
+                    if needs:
+                        waiting[rule] = len(needs)
+                        for sym in needs:
+                            occurs_in.setdefault(sym, []).append(rule)
+                    else:
+                        ready.append(rule)
+
+        usable = set()
+        productive = set()
+        while ready:
+            rule = ready.pop()
+            usable.add(rule)
+            lhs = rule[0]
+            if lhs in productive:
+                continue
+            productive.add(lhs)
+            for user in occurs_in.get(lhs, ()):
+                count = waiting.get(user)
+                if count is not None:
+                    if count == 1:
+                        del waiting[user]
+                        ready.append(user)
+                    else:
+                        waiting[user] = count - 1
+
+        return {
+            lhs: [rule for rule in lhs_rules if rule in usable]
+            for lhs, lhs_rules in newrules.items()
+            if lhs in productive
+        }
+
     def ast_first_offset(self, ast):
         if hasattr(ast, "offset"):
             return ast.offset
         else:
             return self.ast_first_offset(ast[0])
 
+    @logged_for_customize_cache
     def add_unique_rule(
         self, rule, opname: str, arg_count: int, customize: dict
     ) -> None:
@@ -144,6 +878,13 @@ class PythonLambdaParser(GenericASTBuilder):
         self.add_unique_rules(rules, customize)
         return
 
+    def customize_signature(self, tokens, customize):
+        """Return a key that determines the rules that
+        customize_grammar_rules() adds for *tokens* and *customize*, along
+        with each token's part in it; see customize_cache. None means
+        that customization can't be memoized."""
+        return None
+
     def cleanup(self):
         """
         Remove recursive references to allow garbage
@@ -161,12 +902,7 @@ class PythonLambdaParser(GenericASTBuilder):
         """
 
         def fix(c):
-            s = str(c)
-            last_token_pos = s.find("_")
-            if last_token_pos == -1:
-                return s
-            else:
-                return s[:last_token_pos]
+            return str(off2int(c, prefer_last=False))
 
         prefix = ""
         if parent and tokens:
@@ -186,29 +922,35 @@ class PythonLambdaParser(GenericASTBuilder):
 
         print("%s%s ::= %s (%d)" % (prefix, rule[0], " ".join(rule[1]), last_token_pos))
 
+    # Whether the ParserErrors that error() raises carry what is needed
+    # to show the instructions around the failure.
+    show_error_context = True
+
+    # What errorstack() kept for the ParserError that error() raises next.
+    pending_errorstack = None
+
+    def errorstack(self, tokens, i, full=False):
+        """Keep what is needed to show the stacks of completed symbols;
+        see ParserError.format_errorstack(). The edges table can grow in
+        later parses, so its states are copied."""
+        self.pending_errorstack = (self.states, list(self.edges.values()), full)
+
     def error(self, instructions, index):
-        # Find the last line boundary
-        start, finish = -1, -1
-        for start in range(index, -1, -1):
-            if instructions[start].linestart:
-                break
-            pass
-        for finish in range(index + 1, len(instructions)):
-            if instructions[finish].linestart:
-                break
-            pass
-        if start > 0:
-            err_token = instructions[index]
-            print("Instruction context:")
-            for i in range(start, finish):
-                if i != index:
-                    indent = "   "
-                else:
-                    indent = "-> "
-                print("%s%s" % (indent, instructions[i]))
-            raise ParserError(err_token, err_token.offset, self.debug["reduce"])
-        else:
-            raise ParserError(None, -1, self.debug["reduce"])
+        errorstack, self.pending_errorstack = self.pending_errorstack, None
+        if TRACK_ERROR_INDEX and instructions and self.last_set is not None:
+            # What spark_parser 1.8 passes: the last token it had a
+            # chart set for, or the one before the last if it got to
+            # the end.
+            index = min(self.last_set, len(instructions) - 2)
+        if index is None or not after_first_line(instructions, index):
+            raise ParserError(None, -1, self.debug["reduce"], None, errorstack)
+        err_token = instructions[index]
+        if err_token.kind in expr_builder.PRE_REDUCED_KINDS:
+            err_token = expr_builder.first_token(err_token.attr)
+        context = (instructions, index) if self.show_error_context else None
+        raise ParserError(
+            err_token, err_token.offset, self.debug["reduce"], context, errorstack
+        )
 
     def get_pos_kw(self, token):
         """Return then the number of positional parameters and
@@ -219,7 +961,82 @@ class PythonLambdaParser(GenericASTBuilder):
         args_kw = (token.attr >> 8) & 0xFF
         return args_pos, args_kw
 
+    def start_budgets(self, budgets) -> None:
+        """Start counting against *budgets* for a new code object, or for
+        another try at parsing it. This is a dictionary giving a limit for
+        some of the keys of BUDGETS, or None for no limits. Tree nodes
+        include those built for reduce checks."""
+        self.budgets = budgets or None
+        budgets = self.budgets or {}
+        self.items_left = budgets.get("items")
+        self.reductions_left = budgets.get("reductions")
+        self.nodes_left = budgets.get("nodes")
+        seconds = budgets.get("seconds")
+        self.deadline = None if seconds is None else perf_counter() + seconds
+        if self.budgets is None and self.chart_sizes is None and not TRACK_ERROR_INDEX:
+            # Use spark's makeSet() again.
+            self.__dict__.pop("makeSet", None)
+        else:
+            self.makeSet = self.counting_makeSet
+
+    def over_budget(self, budget: str, i: int):
+        tokens = self.tokens
+        token = tokens[i] if i < len(tokens) else None
+        return ParserBudgetExceeded(budget, self.budgets[budget], token)
+
+    def counting_makeSet(self, tokens, sets, i):
+        """spark's makeSet(), keeping count of the work done against the
+        budgets, and of the chart sizes if they are profiled. The last
+        token index is kept for error()."""
+        self.last_set = i
+        GenericASTBuilder.makeSet(self, tokens, sets, i)
+        # Nothing more is added to set i.
+        items = sets[i]
+        if self.chart_sizes is not None:
+            # Each entry stands for all the Earley items of a parse state.
+            states = self.states
+            self.chart_sizes.append(
+                sum(len(states[state].items) for state, _ in items)
+            )
+        if self.items_left is not None:
+            self.items_left -= len(items)
+            if self.items_left < 0:
+                raise self.over_budget("items", i)
+        if self.reductions_left is not None:
+            states = self.states
+            for state, parent in items:
+                if parent != i:
+                    self.reductions_left -= len(states[state].complete)
+            if self.reductions_left < 0:
+                raise self.over_budget("reductions", i)
+        if self.deadline is not None and perf_counter() > self.deadline:
+            raise self.over_budget("seconds", i)
+
+    def preprocess(self, rule, func):
+        lhs = rule[0]
+        grammar = type(self).__name__
+
+        def build(args):
+            if rule_profile.profile.data is not None:
+                rule_profile.record(rule)
+            if grammar_coverage.profile.data is not None:
+                grammar_coverage.record(grammar, rule)
+            return self.buildASTNode(args, lhs)
+
+        return rule, build
+
+    def terminal(self, token):
+        # A pre-reduced token stands for the tree of an expression built
+        # before parsing; see expr_builder.
+        if token.kind in expr_builder.PRE_REDUCED_KINDS:
+            return token.attr
+        return token
+
     def nonterminal(self, nt, args):
+        if self.nodes_left is not None:
+            self.nodes_left -= 1
+            if self.nodes_left < 0:
+                raise ParserBudgetExceeded("nodes", self.budgets["nodes"])
         n = len(args)
 
         # # Use this to find lots of singleton rule
@@ -261,10 +1078,46 @@ class PythonLambdaParser(GenericASTBuilder):
         offset = token.off2int(prefer_last=False)
         return self.insts[self.offset2inst_index[offset]]
 
-    def __ambiguity(self, children):
-        # only for debugging! to be removed hG/2000-10-15
-        print(children)
-        return GenericASTBuilder.ambiguity(self, children)
+    # How many ambiguities were settled in the current parse; see parse().
+    ambiguities = 0
+
+    def priority(self, rule: tuple) -> tuple:
+        """Return what ambiguity() goes by for the epsilon-free *rule*:
+        the length of its right-hand side, then the name of the method
+        the rule comes from."""
+        return len(rule[1]), self.rule2name[self.new2old[rule]]
+
+    def ambiguity(self, rules):
+        """Settle between *rules*, which complete at the same point.
+
+        This gives what spark's ambiguity() with our resolve() gives:
+        the rule with the highest priority() wins, unless resolve()
+        makes an exception for the method names involved. If several
+        rules have the winning name, the last of them is taken. The
+        priorities come from rule_priority instead of being worked out
+        and sorted for each ambiguity.
+        """
+        self.ambiguities += 1
+        if type(self).resolve is not PythonLambdaParser.resolve:
+            return GenericASTBuilder.ambiguity(self, rules)
+        rule_priority = self.rule_priority
+        best = None
+        names = set()
+        for rule in rules:
+            priority = rule_priority.get(rule)
+            if priority is None:
+                priority = rule_priority[rule] = self.priority(rule)
+            if best is None or priority < best:
+                best = priority
+            names.add(priority[1])
+        name = best[1]
+        if len(rules) == 2 and names == {"function_def", "assign"}:
+            name = "function_def"
+        elif "grammar" in names and "expr" in names:
+            name = "expr"
+        for rule in reversed(rules):
+            if rule_priority[rule][1] == name:
+                return rule
 
     def resolve(self, list):
         if len(list) == 2 and "function_def" in list and "assign" in list:
@@ -349,8 +1202,9 @@ class PythonParser(PythonLambdaParser):
         self.singleton = frozenset(
             ("str", "store", "_stmts", "suite_stmts_opt", "inplace_op")
         )
-        # Instructions filled in from scanner
+        # Instructions and their control-flow graph filled in from scanner
         self.insts = []
+        self.cfg = None
 
         # true if we are parsing inside a lambda expression.
         # because a lambda expression are wrtten on a single line, certain line-oriented
@@ -358,18 +1212,181 @@ class PythonParser(PythonLambdaParser):
         self.is_lambda = False
 
 
-def parse(p, tokens, customize, is_lambda):
+def code_key(code):
+    """Return what we go by to tell whether *code* is nested in another
+    code object. *code* can be a code object or a scanner Code, which
+    copies the code object attributes."""
+    if code is None:
+        return None
+    return (code.co_name, code.co_firstlineno, code.co_code)
+
+
+def nested_code_keys(code) -> frozenset:
+    """Return the code_key()s of the code objects defined directly
+    inside *code*."""
+    if code is None:
+        return frozenset()
+    return frozenset(code_key(const) for const in code.co_consts if iscode(const))
+
+
+def parse(p, tokens, customize, is_lambda, code=None, chunks=(), budgets=None):
+    """Customize the grammar of *p* for *tokens* and parse them.
+    Straight-line code is reduced without the Earley parser if it can
+    be; see straight_line. Otherwise, expressions are built before the
+    Earley parser sees the tokens; see expr_builder.
+
+    *chunks*, if given, are indices at which *tokens*, a statement list,
+    can be split into chunks that are parsed separately; see
+    parse_chunks().
+
+    *budgets*, if given, limits the work done; see
+    PythonLambdaParser.start_budgets(). ParserBudgetExceeded is raised
+    when a limit is passed. Each Earley parse starts on the full
+    budgets: a chunk, the tokens as a whole when chunks didn't work out,
+    and the parse with all rules when the rule profile's didn't.
+
+    Afterwards, p.ambiguities tells how many ambiguities the parser had
+    to settle; see ambiguity_profile. If chart sizes are profiled,
+    p.chart_sizes has the number of Earley items at each position; see
+    chart_profile.
+    """
+    p.chart_sizes = [] if chart_profile.profile.data is not None else None
+    p.start_budgets(budgets)
+    p.ambiguities = 0
+    if grammar_coverage.profile.data is not None:
+        grammar_coverage.add_grammar(p)
     was_lambda = p.is_lambda
     p.is_lambda = is_lambda
-    p.customize_grammar_rules(tokens, customize)
-    ast = p.parse(tokens)
-    p.is_lambda = was_lambda
+    # A checkpointed parser gets the rules for *code* as an overlay on its
+    # checkpointed grammar and on the rules of the code *code* is nested
+    # in. Otherwise, custom rules pile up in the grammar.
+    overlay = p.overlay_grammar and hasattr(p, "grammar_checkpoint")
+    if overlay:
+        p.push_overlay(code)
+    try:
+        customize_cache.customize_grammar_rules(p, tokens, customize)
+        ast = None
+        if p.straight_line_fast_path:
+            ast = straight_line.parse(p, tokens)
+        if ast is None:
+            if p.build_expressions:
+                tokens, chunks = expr_builder.reduce_expressions(p, tokens, chunks)
+            if overlay:
+                p.install_overlay()
+            ast = parse_chunks(p, tokens, chunks) if chunks else None
+            if ast is None:
+                ast = parse_tokens(p, tokens)
+    except BaseException:
+        if overlay:
+            p.pop_overlay()
+        raise
+    finally:
+        p.is_lambda = was_lambda
+        if ambiguity_profile.profile.data is not None:
+            ambiguity_profile.record(code, p.ambiguities)
+        if p.chart_sizes is not None:
+            chart_profile.record(code, p.chart_sizes)
     #  p.cleanup()
     return ast
 
 
+def after_first_line(instructions, index: int) -> bool:
+    """Return whether the instruction at *index* of *instructions* is
+    past the line the first instruction starts. Pre-reduced tokens count
+    as the instructions they stand for, of which the one at *index* is
+    its first."""
+    for i in range(index, -1, -1):
+        token = instructions[i]
+        if token.kind in expr_builder.PRE_REDUCED_KINDS:
+            tokens = expr_builder.leaves(token.attr)
+            if i == index:
+                tokens = tokens[:1]
+            for j in range(len(tokens) - 1, -1, -1):
+                if tokens[j].linestart:
+                    return i > 0 or j > 0
+        elif token.linestart:
+            return i > 0
+    return False
+
+
+def parse_tokens(p, tokens):
+    """Parse *tokens* with the grammar of *p* as it has been customized.
+
+    If *p* was given a rule profile, the tokens are parsed with just the
+    rules that the profile has seen used first. Only if that fails are
+    they parsed again with all of them. The grammar is pruned for that
+    first try even if prune_grammar isn't set. Each try starts on the
+    full budgets p.start_budgets() was given.
+    """
+    budgets = p.budgets
+    if p.hot_rules is not None:
+        saved = p.prune(tokens, hot=True)
+        if saved is not None:
+            p.start_budgets(budgets)
+            show_error_context = p.show_error_context
+            p.show_error_context = False
+            try:
+                ast = parse_and_unprune(p, tokens, saved)
+            except (ParserError, AssertionError, IndexError):
+                rule_profile.stats["fallbacks"] += 1
+            else:
+                rule_profile.stats["hot"] += 1
+                return ast
+            finally:
+                p.show_error_context = show_error_context
+    saved = p.prune(tokens) if p.prune_grammar else None
+    p.start_budgets(budgets)
+    return parse_and_unprune(p, tokens, saved)
+
+
+def parse_and_unprune(p, tokens, saved):
+    """Parse *tokens* with the grammar tables in place, then go back to
+    *saved*, the tables prune() returned, if there are any."""
+    p.reduce_memo.clear()
+    try:
+        return p.parse(tokens)
+    finally:
+        p.reduce_memo.clear()
+        if saved is not None:
+            p.unprune(saved)
+
+
+def parse_chunks(p, tokens, chunks):
+    """Parse the statement list *tokens* a chunk at a time, splitting it
+    before each index in *chunks*, and join the statement lists that come
+    out. Earley parsing time and memory grow faster than the number of
+    tokens, so this helps with long module bodies.
+
+    None is returned if some chunk doesn't parse as a statement list by
+    itself. That means that it wasn't safe to split there after all, and
+    the tokens have to be parsed as a whole.
+    """
+    ast = None
+    show_error_context = p.show_error_context
+    p.show_error_context = False
+    try:
+        for start, end in zip((0,) + tuple(chunks), tuple(chunks) + (len(tokens),)):
+            try:
+                chunk_ast = parse_tokens(p, tokens[start:end])
+            except (ParserError, AssertionError, IndexError):
+                return None
+            if chunk_ast.kind != "stmts":
+                return None
+            if ast is None:
+                ast = chunk_ast
+            else:
+                ast.data.extend(chunk_ast.data)
+    finally:
+        p.show_error_context = show_error_context
+    return ast
+
+
 def get_python_parser(
-    version, debug_parser=PARSER_DEFAULT_DEBUG, compile_mode="exec", is_pypy=False
+    version,
+    debug_parser=PARSER_DEFAULT_DEBUG,
+    compile_mode="exec",
+    is_pypy=False,
+    profile=None,
 ):
     """Returns parser object for Python version 3.7, 3.8,
     etc., depending on the parameters passed.  *compile_mode* is either
@@ -381,6 +1398,9 @@ def get_python_parser(
     For the others, see https://docs.python.org/3/library/functions.html#compile for an
     explanation of the different modes.
 
+    *profile*, if given, is a rule profile or the name of a file holding
+    one; see rule_profile. The parser tries the rules the profile has
+    seen used before the rest.
     """
 
     # FIXME: there has to be a better way...
@@ -425,6 +1445,10 @@ def get_python_parser(
         )
 
     p.version = version
+    if profile is not None:
+        if isinstance(profile, str):
+            profile = rule_profile.read(profile)
+        p.hot_rules = rule_profile.used_rules(profile)
     # p.dump_grammar() # debug
     return p
 
@@ -491,6 +1515,7 @@ def python_parser(
     # modularity is broken here
     p.insts = scanner.insts
     p.offset2inst_index = scanner.offset2inst_index
+    p.cfg = scanner.cfg
     p.opc = scanner.opc
 
     return parse(p, tokens, customize, is_lambda)
@@ -2,8 +2,12 @@
 """
 Python 3.7 base code. We keep non-custom-generated grammar rules out of this file.
 """
+from time import perf_counter
+
+from decompyle3.parsers import expr_builder, reduce_memo, reduce_profile, rule_profile
 from decompyle3.parsers.main import PythonParser, nop_func, ParserError
 from decompyle3.parsers.treenode import SyntaxTree
+from decompyle3.scanners.tok import offset2str
 from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 from spark_parser.spark import rule2str
 
@@ -11,6 +15,8 @@ from decompyle3.parsers.reducecheck import (
     and_check,
     and_cond_check,
     and_not_check,
+    annotate_tuple_check,
+    aug_assign_check,
     c_tryelsestmt,
     if_and_stmt,
     if_and_elsestmt,
@@ -18,6 +24,7 @@ from decompyle3.parsers.reducecheck import (
     iflaststmt,
     ifstmt,
     ifstmts_jump,
+    import_from37_check,
     lastc_stmt,
     list_if_not,
     not_or_check,
@@ -31,6 +38,74 @@ from decompyle3.parsers.reducecheck import (
 )
 
 
+# For a rough break out on the first word in customize_grammar_rules().
+# This may include instructions that don't need customization,
+# but we'll do a finer check after the rough breakout.
+CUSTOMIZE_INSTRUCTION_BASENAMES = frozenset(
+    (
+        "BEFORE",
+        "BUILD",
+        "CALL",
+        "CONTINUE",
+        "DELETE",
+        "FORMAT",
+        "GET",
+        "JUMP",
+        "LOAD",
+        "LOOKUP",
+        "MAKE",
+        "RETURN",
+        "RAISE",
+        "SETUP",
+        "UNPACK",
+        "WITH",
+    )
+)
+
+# Instructions whose rules depend on the instruction argument.
+CUSTOMIZE_ARG_BASENAMES = frozenset(("BUILD", "CALL", "MAKE", "UNPACK"))
+
+# Of the remaining instructions that make it past the rough breakout,
+# those that customize_grammar_rules() does something for.
+CUSTOMIZED_OPS = frozenset(
+    (
+        "BEFORE_ASYNC_WITH",
+        "CONTINUE_LOOP",
+        "DELETE_ATTR",
+        "DELETE_DEREF",
+        "DELETE_SUBSCR",
+        "FORMAT_VALUE",
+        "FORMAT_VALUE_ATTR",
+        "GET_AITER",
+        "GET_ITER",
+        "JUMP_IF_NOT_DEBUG",
+        "LOAD_ASSERT",
+        "LOAD_ATTR",
+        "LOAD_BUILD_CLASS",
+        "LOAD_CLASSDEREF",
+        "LOAD_CLASSNAME",
+        "LOAD_DICTCOMP",
+        "LOAD_LISTCOMP",
+        "LOAD_NAME",
+        "LOAD_SETCOMP",
+        "LOOKUP_METHOD",
+        "RAISE_VARARGS_0",
+        "RAISE_VARARGS_1",
+        "RAISE_VARARGS_2",
+        "RETURN_VALUE_LAMBDA",
+        "SETUP_EXCEPT",
+        "SETUP_WITH",
+        "WITH_CLEANUP_START",
+    )
+)
+
+# Instructions that MAKE_FUNCTION and MAKE_CLOSURE rules look for
+# two instructions back.
+MAKE_FUNCTION_LOADS = frozenset(
+    ("LOAD_DICTCOMP", "LOAD_LAMBDA", "LOAD_LISTCOMP", "LOAD_SETCOMP")
+)
+
+
 class Python37BaseParser(PythonParser):
     def __init__(self, debug_parser=PARSER_DEFAULT_DEBUG, compile_mode="exec"):
 
@@ -111,6 +186,113 @@ class Python37BaseParser(PythonParser):
         self.addRule(rule, nop_func)
         return
 
+    def customize_signature(self, tokens, customize):
+        """Return the parts of *tokens* and *customize* that
+        customize_grammar_rules() bases its rules on. This is a pair: a
+        hashable key, and a list giving for each token its part in that
+        key, or None if the token doesn't get rules.
+
+        Two token streams with the same key get the same rules, in the
+        same order. If you change what customize_grammar_rules() looks
+        at, change this too.
+        """
+        has_get_iter_call_function1, customized = self.classify_tokens(tokens)
+        n = len(tokens)
+
+        token_keys = [None] * n
+        # Token keys in the order that they first appear.
+        seen_keys = {}
+        for i in customized:
+            token = tokens[i]
+            opname = token.kind
+            basename = opname[: opname.find("_")]
+            attr = token.attr if basename in CUSTOMIZE_ARG_BASENAMES else None
+            if isinstance(attr, list):
+                # MAKE_FUNCTION flags
+                attr = tuple(attr)
+            context = None
+            if opname == "LOAD_NAME":
+                if token.attr != "__annotations__":
+                    continue
+            elif opname == "LOAD_BUILD_CLASS":
+                call_fn_tok = self.build_class_call(i, tokens)
+                if call_fn_tok is None:
+                    return None
+                context = (call_fn_tok.kind, call_fn_tok.attr)
+            elif basename == "MAKE":
+                if i >= 2 and tokens[i - 2].kind in MAKE_FUNCTION_LOADS:
+                    context = tokens[i - 2].kind
+            elif basename == "CALL":
+                if i + 1 < n:
+                    next_token = tokens[i + 1]
+                    context = next_token == "CALL_FUNCTION" and next_token.attr == 1
+            elif opname[: opname.rfind("_")] == "BUILD_TUPLE":
+                # Is this the tuple of a "load_closure"?
+                context = all(
+                    tokens[i - j - 1].kind == "LOAD_CLOSURE" for j in range(attr)
+                )
+
+            token_key = (opname, attr, context)
+            token_keys[i] = token_key
+            seen_keys[token_key] = True
+
+        key = (
+            self.version,
+            "PyPy" in customize,
+            self.seen_ops,
+            has_get_iter_call_function1,
+            tuple(seen_keys),
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key, token_keys
+
+    def classify_tokens(self, tokens):
+        """Sort out *tokens* for customize_grammar_rules() and
+        customize_signature(), so that they agree on which tokens matter:
+        set self.seen_ops and self.seen_op_basenames, and return whether
+        a GET_ITER is followed by CALL_FUNCTION_1, along with the indices
+        of the tokens that may get rules."""
+        self.seen_ops = frozenset([t.kind for t in tokens])
+        self.seen_op_basenames = frozenset(
+            [opname[: opname.rfind("_")] for opname in self.seen_ops]
+        )
+        n = len(tokens)
+
+        has_get_iter_call_function1 = False
+        customized = []
+        for i, token in enumerate(tokens):
+            opname = token.kind
+            if (
+                opname == "GET_ITER"
+                and i < n - 2
+                and self.call_fn_name(tokens[i + 1]) == "CALL_FUNCTION_1"
+            ):
+                has_get_iter_call_function1 = True
+            basename = opname[: opname.find("_")]
+            if basename in CUSTOMIZE_INSTRUCTION_BASENAMES and (
+                basename in CUSTOMIZE_ARG_BASENAMES or opname in CUSTOMIZED_OPS
+            ):
+                customized.append(i)
+        return has_get_iter_call_function1, customized
+
+    @staticmethod
+    def build_class_call(i, tokens):
+        """Return the CALL_FUNCTION token of the LOAD_BUILD_CLASS at
+        tokens[i], as custom_build_class_rule() finds it, or None if
+        it can't find one."""
+        for i in range(i + 1, len(tokens)):
+            if tokens[i].kind.startswith(("MAKE_FUNCTION", "MAKE_CLOSURE")):
+                break
+        if i + 1 >= len(tokens) or tokens[i + 1].kind != "LOAD_STR":
+            return None
+        for i in range(i, len(tokens)):
+            if tokens[i].kind.startswith("CALL_FUNCTION"):
+                return tokens[i]
+        return None
+
     # FIXME FIXME FIXME: The below is an utter mess. Come up with a better
     # organization for this. For example, arrange organize by opcode base?
 
@@ -118,30 +300,6 @@ class Python37BaseParser(PythonParser):
 
         is_pypy = False
 
-        # For a rough break out on the first word. This may
-        # include instructions that don't need customization,
-        # but we'll do a finer check after the rough breakout.
-        customize_instruction_basenames = frozenset(
-            (
-                "BEFORE",
-                "BUILD",
-                "CALL",
-                "CONTINUE",
-                "DELETE",
-                "FORMAT",
-                "GET",
-                "JUMP",
-                "LOAD",
-                "LOOKUP",
-                "MAKE",
-                "RETURN",
-                "RAISE",
-                "SETUP",
-                "UNPACK",
-                "WITH",
-            )
-        )
-
         # Opcode names in the custom_ops_processed set have rules that get added
         # unconditionally and the rules are constant. So they need to be done
         # only once and if we see the opcode a second we don't have to consider
@@ -152,13 +310,11 @@ class Python37BaseParser(PythonParser):
         # the start.
         custom_ops_processed = set(("BUILD_TUPLE_UNPACK_WITH_CALL",))
 
-        # A set of instruction operation names that exist in the token stream.
-        # We use this customize the grammar that we create.
-        # 2.6-compatible set comprehensions
-        self.seen_ops = frozenset([t.kind for t in tokens])
-        self.seen_op_basenames = frozenset(
-            [opname[: opname.rfind("_")] for opname in self.seen_ops]
-        )
+        # The set of instruction operation names that exist in the token
+        # stream, which we use to customize the grammar that we create,
+        # whether we have an iteration CALL_FUNCTION_1, and the tokens
+        # that may get rules.
+        has_get_iter_call_function1, customized = self.classify_tokens(tokens)
 
         # Loop over instructions adding custom grammar rules based on
         # a specific instruction seen.
@@ -177,25 +333,13 @@ class Python37BaseParser(PythonParser):
 
         n = len(tokens)
 
-        # Determine if we have an iteration CALL_FUNCTION_1.
-        has_get_iter_call_function1 = False
-        for i, token in enumerate(tokens):
-            if (
-                token == "GET_ITER"
-                and i < n - 2
-                and self.call_fn_name(tokens[i + 1]) == "CALL_FUNCTION_1"
-            ):
-                has_get_iter_call_function1 = True
-
-        for i, token in enumerate(tokens):
+        for i in customized:
+            token = tokens[i]
             opname = token.kind
 
             # Do a quick breakout before testing potentially
             # each of the dozen or so instruction in if elif.
-            if (
-                opname[: opname.find("_")] not in customize_instruction_basenames
-                or opname in custom_ops_processed
-            ):
+            if opname in custom_ops_processed:
                 continue
 
             opname_base = opname[: opname.rfind("_")]
@@ -1188,6 +1332,9 @@ class Python37BaseParser(PythonParser):
             "and": and_check,
             "and_cond": and_cond_check,
             "and_not": and_not_check,
+            "annotate_tuple": annotate_tuple_check,
+            "aug_assign1": aug_assign_check,
+            "aug_assign2": aug_assign_check,
             "if_and_stmt": if_and_stmt,
             "if_and_elsestmtc": if_and_elsestmt,
             "ifelsestmt": ifelsestmt,
@@ -1196,6 +1343,7 @@ class Python37BaseParser(PythonParser):
             "iflaststmtc": iflaststmt,
             "ifstmt": ifstmt,
             "ifstmtc": ifstmt,
+            "import_from37": import_from37_check,
             "lastc_stmt": lastc_stmt,
             "list_if_not": list_if_not,
             "not_or": not_or_check,
@@ -1320,36 +1468,88 @@ class Python37BaseParser(PythonParser):
                     )
                     self.add_unique_rule(rule, token.kind, uniq_param, customize)
 
+    # Nonterminals whose check in reduce_check_table is given the index
+    # just past the reduction even when that is past the last token.
+    reduce_checks_past_end = frozenset()
+
+    # Nonterminals whose check in reduce_check_table looks at the tree
+    # it is given, but whose verdict still depends only on the rule, the
+    # tokens and the span reduced; see reduce_memo. Checks that are given
+    # no tree, "tokens" in check_reduce, are like that anyway.
+    #
+    # These are the checks that the Earley parser offers the same
+    # reduction more than once, from parse states that complete the
+    # same rule, and the tree it builds for them is the same each time.
+    # Running test/bytecode_3.7, test/bytecode_3.8 and the 3.7 and 3.8
+    # standard libraries with reduce_memo.check set bears that out.
+    pure_reduce_checks = frozenset(
+        ("ifelsestmtc", "iflaststmt", "iflaststmtc", "ifstmts_jump")
+    )
+
+    def compile_reduce_checks(self):
+        """Drop nonterminals that have no function in reduce_check_table
+        from check_reduce. Spark builds a tree for the reduction and calls
+        reduce_is_invalid() for every nonterminal in check_reduce, so this
+        should be called once the grammar has been customized; the
+        customize_cache module does that, and keeps the result for when
+        it replays the customization. Also work out which checks can be
+        memoized.
+        """
+        check_reduce = self.check_reduce
+        for lhs in [lhs for lhs in check_reduce if lhs not in self.reduce_check_table]:
+            del check_reduce[lhs]
+        self.memoized_reduce_checks = self.pure_reduce_checks | frozenset(
+            lhs for lhs, kind in check_reduce.items() if kind == "tokens"
+        )
+
     def reduce_is_invalid(self, rule, ast, tokens, first, last):
+        if rule[0] not in self.memoized_reduce_checks:
+            return self.run_reduce_check(rule, ast, tokens, first, last)
+        key = (rule, first, last)
+        invalid = self.reduce_memo.get(key)
+        if invalid is None:
+            reduce_memo.stats["misses"] += 1
+            invalid = self.reduce_memo[key] = bool(
+                self.run_reduce_check(rule, ast, tokens, first, last)
+            )
+        else:
+            reduce_memo.stats["hits"] += 1
+            if reduce_memo.check:
+                assert invalid == bool(
+                    self.run_reduce_check(rule, ast, tokens, first, last)
+                ), f"remembered reduce check differs for {rule2str(rule)} at {first}..{last}"
+        return invalid
+
+    def run_reduce_check(self, rule, ast, tokens, first, last):
         lhs = rule[0]
+        fn = self.reduce_check_table[lhs]
         n = len(tokens)
-        last = min(last, n - 1)
-        fn = self.reduce_check_table.get(lhs, None)
+        if last >= n and lhs not in self.reduce_checks_past_end:
+            last = n - 1
+        if reduce_profile.profile.data is not None:
+            start = perf_counter()
+        invalid = True
         try:
-            if fn:
-                return fn(self, lhs, n, rule, ast, tokens, first, last)
+            invalid = fn(self, lhs, n, rule, ast, tokens, first, last)
         except:
             import sys, traceback
 
             print(
                 f"Exception in {fn.__name__} {sys.exc_info()[1]}\n"
                 + f"rule: {rule2str(rule)}\n"
-                + f"offsets {tokens[first].offset} .. {tokens[last].offset}"
+                + f"offsets {offset2str(tokens[first].offset)} .. "
+                + f"{offset2str(tokens[last].offset)}"
             )
             print(traceback.print_tb(sys.exc_info()[2], -1))
-            raise ParserError(tokens[last], tokens[last].off2int(), self.debug["rules"])
-
-        if lhs in ("aug_assign1", "aug_assign2") and ast[0][0] == "and":
-            return True
-        elif lhs == "annotate_tuple":
-            return not isinstance(tokens[first].attr, tuple)
-        elif lhs == "import_from37":
-            importlist37 = ast[3]
-            alias37 = importlist37[0]
-            if importlist37 == "importlist37" and alias37 == "alias37":
-                store = alias37[1]
-                assert store == "store"
-                return alias37[0].attr != store[0].attr
-            return False
-
-        return False
+            token = tokens[last]
+            if token.kind in expr_builder.PRE_REDUCED_KINDS:
+                token = expr_builder.first_token(token.attr)
+            raise ParserError(
+                token, token.off2int(prefer_last=False), self.debug["rules"]
+            )
+        finally:
+            if reduce_profile.profile.data is not None:
+                reduce_profile.record(rule, invalid, perf_counter() - start)
+        if invalid and rule_profile.profile.data is not None:
+            rule_profile.record(rule, rejected=True)
+        return invalid
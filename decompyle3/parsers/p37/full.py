@@ -141,6 +141,7 @@ class Python37Parser(Python37LambdaParser):
         stmt ::= call_stmt
 
         call_stmt ::= call
+        call_stmt ::= EXPR_CALL
 
         stmt ::= ifstmt
         stmt ::= if_or_stmt
@@ -555,6 +556,8 @@ class Python37Parser(Python37LambdaParser):
         # Other definitions are in a custom rule
         build_class ::= LOAD_BUILD_CLASS mkfunc expr call CALL_FUNCTION_3
         build_class ::= LOAD_BUILD_CLASS mkfunc expr call expr CALL_FUNCTION_4
+        build_class ::= LOAD_BUILD_CLASS mkfunc expr EXPR_CALL CALL_FUNCTION_3
+        build_class ::= LOAD_BUILD_CLASS mkfunc expr EXPR_CALL expr CALL_FUNCTION_4
 
         stmt ::= classdefdeco
         classdefdeco ::= classdefdeco1 store
@@ -19,7 +19,7 @@ Python 3.7 lambda grammar for the spark Earley-algorithm parser.
 from decompyle3.parsers.main import nop_func
 from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 from decompyle3.parsers.p37.base import Python37BaseParser
-from decompyle3.scanners.tok import Token
+from decompyle3.parsers.reducecheck import call_kw_check
 
 
 class Python37LambdaParser(Python37BaseParser):
@@ -365,6 +365,15 @@ class Python37LambdaParser(Python37BaseParser):
         call           ::= expr CALL_METHOD_0
         """
 
+    def p_pre_reduced(self, args):
+        """
+        # Expressions built before parsing; see expr_builder.
+        expr       ::= EXPR
+        expr       ::= EXPR_CALL
+        expr       ::= EXPR_COMPARE
+        c_compare  ::= EXPR_COMPARE
+        """
+
     def p_list_comprehension(self, args):
         """
         expr ::= list_comp
@@ -507,16 +516,15 @@ class Python37LambdaParser(Python37BaseParser):
 
     def p_store(self, args):
         """
-        # Note. The below is right-recursive:
-        designList ::= store store
-        designList ::= store DUP_TOP designList
-
-        ## Can we replace with left-recursive, and redo with:
-        ##
-        ##   designList  ::= designLists store store
-        ##   designLists ::= designLists store DUP_TOP
-        ##   designLists ::=
-        ## Will need to redo semantic actiion
+        # Chained assignments like "a = b = c = x". These are
+        # left-recursive rather than "designList ::= store DUP_TOP
+        # designList": in an Earley parser, right recursion leaves items
+        # behind for each store still open, and those add up
+        # quadratically in the length of the chain.
+        designList  ::= store store
+        designList  ::= designLists store store
+        designLists ::= store DUP_TOP
+        designLists ::= designLists store DUP_TOP
 
         store           ::= STORE_FAST
         store           ::= STORE_NAME
@@ -530,6 +538,7 @@ class Python37LambdaParser(Python37BaseParser):
     def customize_grammar_rules(self, tokens, customize):
         super(Python37LambdaParser, self).customize_grammar_rules(tokens, customize)
         self.check_reduce["call_kw"] = "AST"
+        self.reduce_check_table["call_kw"] = call_kw_check
 
         for i, token in enumerate(tokens):
             opname = token.kind
@@ -780,23 +789,6 @@ class Python37LambdaParser(Python37BaseParser):
                 opname, token, customize, next_token
             )
 
-    def reduce_is_invalid(self, rule, ast, tokens, first, last):
-        invalid = super(Python37LambdaParser, self).reduce_is_invalid(
-            rule, ast, tokens, first, last
-        )
-        if invalid:
-            return invalid
-        if rule[0] == "call_kw":
-            # Make sure we don't derive call_kw
-            nt = ast[0]
-            while not isinstance(nt, Token):
-                if nt[0] == "call_kw":
-                    return True
-                nt = nt[0]
-                pass
-            pass
-        return False
-
 
 if __name__ == "__main__":
     # Check grammar
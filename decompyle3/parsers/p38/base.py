@@ -16,14 +16,29 @@
 from decompyle3.parsers.main import PythonParserSingle
 from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 from decompyle3.parsers.p38.full import Python38FullParser
-from decompyle3.parsers.reducecheck import break_check, for38_check, pop_return_check
+from decompyle3.parsers.reducecheck import (
+    break_check,
+    for38_check,
+    pop_return_check,
+    whilestmt38_check,
+)
 
 
 class Python38Parser(Python38FullParser):
+    reduce_checks_past_end = frozenset(("whileTruestmt38", "whilestmt38"))
+
     def __init__(self, debug_parser=PARSER_DEFAULT_DEBUG, compile_mode="exec"):
         super(Python38Parser, self).__init__(debug_parser, compile_mode=compile_mode)
         self.customized = {}
 
+    def checkpoint(self):
+        # customize_grammar_rules() removes these after adding its rules.
+        # Removing them before the checkpoint as well keeps them out of
+        # the grammar that custom rules are overlaid on, and removing them
+        # again afterwards leaves that grammar as it is.
+        self.remove_rules_38()
+        super(Python38Parser, self).checkpoint()
+
     def remove_rules_38(self):
         self.remove_rules(
             """
@@ -104,25 +119,8 @@ class Python38Parser(Python38FullParser):
         self.reduce_check_table["break"] = break_check
         self.reduce_check_table["for38"] = for38_check
         self.reduce_check_table["pop_return"] = pop_return_check
-
-    def reduce_is_invalid(self, rule, ast, tokens, first, last):
-        invalid = super(Python38Parser, self).reduce_is_invalid(
-            rule, ast, tokens, first, last
-        )
-        if invalid:
-            return invalid
-        lhs = rule[0]
-        if lhs in ("whileTruestmt38", "whilestmt38"):
-            jb_index = last - 1
-            while jb_index > 0 and tokens[jb_index].kind.startswith("COME_FROM"):
-                jb_index -= 1
-            t = tokens[jb_index]
-            if t.kind != "JUMP_BACK":
-                return True
-            return t.attr != tokens[first].off2int()
-            pass
-
-        return False
+        self.reduce_check_table["whileTruestmt38"] = whilestmt38_check
+        self.reduce_check_table["whilestmt38"] = whilestmt38_check
 
 
 class Python38ParserSingle(Python38Parser, PythonParserSingle):
@@ -0,0 +1,111 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A pool of warm parsers, so that decompiling many files in one process
+doesn't build a new parser for each file.
+
+A parser is checkpointed when it is created. When it is given back to
+the pool, the grammar rules that were added for the file it parsed are
+rolled back, so the next user gets a parser that behaves just like a
+freshly built one.
+"""
+
+from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
+
+from decompyle3.parsers import rule_profile
+from decompyle3.parsers.main import get_python_parser
+
+
+class ParserPool:
+    def __init__(self, max_idle: int = 2, profile=None):
+        # Idle parsers keyed by (version, compile mode, is_pypy).
+        self.idle = {}
+        # The most idle parsers we keep for any one key. Parsers are
+        # handed out once per file, so there are usually only as many
+        # in use as there are nested decompilations.
+        self.max_idle = max_idle
+        # The rule profile new parsers are given; see get_python_parser().
+        self.profile = profile
+
+    def acquire(
+        self,
+        version: tuple,
+        debug_parser=PARSER_DEFAULT_DEBUG,
+        compile_mode: str = "exec",
+        is_pypy: bool = False,
+    ):
+        """Return a parser for *version* and *compile_mode*, reusing
+        an idle one if we have it. Give it back with release() when done.
+        """
+        key = (version[:2], compile_mode, is_pypy)
+        idle = self.idle.get(key)
+        if idle:
+            p = idle.pop()
+            # Hand it out as a new parser would be: with the debug options
+            # asked for, no budgets, and nothing the last user left for
+            # error reports or profiling.
+            p.debug = debug_parser
+            p.__dict__.pop("show_error_context", None)
+            p.pending_errorstack = None
+            p.last_set = None
+            p.chart_sizes = None
+            p.ambiguities = 0
+            p.start_budgets(None)
+        else:
+            p = get_python_parser(
+                version, debug_parser, compile_mode, is_pypy, self.profile
+            )
+            p.pool_key = key
+            p.pool_profile = self.profile
+            p.checkpoint()
+        return p
+
+    def release(self, p) -> None:
+        """Roll back grammar changes in *p* and make it available for reuse."""
+        p.rollback()
+        if p.pool_profile is not self.profile:
+            return
+        idle = self.idle.setdefault(p.pool_key, [])
+        if len(idle) < self.max_idle:
+            idle.append(p)
+
+    def clear(self) -> None:
+        """Drop all idle parsers."""
+        self.idle.clear()
+
+    def use_profile(self, profile) -> None:
+        """Give parsers handed out from now on the rule profile *profile*,
+        or none if it is None."""
+        if isinstance(profile, str):
+            profile = rule_profile.read(profile)
+        self.profile = profile
+        self.clear()
+
+
+# The pool used by the decompiler.
+parser_pool = ParserPool()
+
+
+def acquire_parser(
+    version: tuple,
+    debug_parser=PARSER_DEFAULT_DEBUG,
+    compile_mode: str = "exec",
+    is_pypy: bool = False,
+):
+    return parser_pool.acquire(version, debug_parser, compile_mode, is_pypy)
+
+
+def release_parser(p) -> None:
+    parser_pool.release(p)
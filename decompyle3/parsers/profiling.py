@@ -0,0 +1,83 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+What the parser profiles have in common.
+
+Each of reduce_profile, rule_profile, ambiguity_profile, chart_profile
+and grammar_coverage keeps a Profile: counts under some key, recorded
+while it is turned on. The modules say what is recorded and how it is
+shown. Turning recording on and off, and copying and adding up what was
+recorded, so that worker processes can send theirs to the parent, is
+done here.
+"""
+
+from typing import Callable, Dict, Optional
+
+
+def add_columns(counts: list, more: list) -> None:
+    """Add the counts *more* to *counts*, column by column."""
+    for i, count in enumerate(more):
+        counts[i] += count
+
+
+class Profile:
+    """Counts recorded per key.
+
+    *data* is a dictionary from key to counts while recording, and None
+    otherwise, so the parser needs only one test to see whether to
+    record. merge() combines the counts for a key with *add*, by default
+    adding them column by column, and snapshot() copies them with *copy*.
+    """
+
+    def __init__(
+        self,
+        add: Callable[[object, object], None] = add_columns,
+        copy: Callable[[object], object] = list,
+    ):
+        self.data: Optional[Dict[object, object]] = None
+        self.add = add
+        self.copy = copy
+
+    def enable(self) -> None:
+        """Start recording, keeping anything recorded so far."""
+        if self.data is None:
+            self.data = {}
+
+    def disable(self) -> None:
+        """Stop recording and drop what was recorded."""
+        self.data = None
+
+    def reset(self) -> None:
+        """Drop what has been recorded, if we are recording."""
+        if self.data is not None:
+            self.data.clear()
+
+    def snapshot(self) -> dict:
+        """Return a copy of what has been recorded so far."""
+        if self.data is None:
+            return {}
+        return {key: self.copy(counts) for key, counts in self.data.items()}
+
+    def merge(self, data: dict) -> None:
+        """Add *data*, a snapshot() from another process or what was read
+        from a file say, into what has been recorded here. Recording is
+        turned on if it wasn't."""
+        self.enable()
+        for key, more in data.items():
+            counts = self.data.get(key)
+            if counts is None:
+                self.data[key] = self.copy(more)
+            else:
+                self.add(counts, more)
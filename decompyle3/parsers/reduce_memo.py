@@ -0,0 +1,47 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Memoization of reduce checks within a parse.
+
+The Earley parser can offer the same reduction, that is the same rule
+over the same span of tokens, to reduce_is_invalid() more than once in a
+parse: the rule is completed in several parse states, or the span has
+more than one derivation. For a check whose verdict is decided by the
+rule, the span and the tokens alone, the first verdict is remembered and
+given again. Checks that aren't given a tree, "tokens" in the parser's
+check_reduce table, are like that. Checks that are given one are
+memoized only if their nonterminal is in the parser's pure_reduce_checks:
+the tree can differ from one derivation of the span to another.
+
+Setting *check* runs the check again on each remembered verdict and
+raises an AssertionError if it comes out differently.
+"""
+
+# Run the check anyway and compare with the remembered verdict.
+check = False
+
+# How often a remembered verdict was found, or not.
+stats = {"hits": 0, "misses": 0}
+
+
+def hit_rate() -> float:
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+
+def clear() -> None:
+    """Reset the counters."""
+    for name in stats:
+        stats[name] = 0
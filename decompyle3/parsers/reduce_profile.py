@@ -0,0 +1,104 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Profiling of reduce checks.
+
+When the parser is about to reduce by a rule whose nonterminal is in
+its check_reduce table, it calls reduce_is_invalid() to see whether the
+reduction should be vetoed. Those checks are run a great many times, so
+they can account for a good part of parse time. When profiling is turned
+on with profile.enable(), each call is counted per rule along with
+whether the reduction was rejected and how long the check took.
+
+The data is a dictionary from rule to [calls, rejects, seconds].
+format_table() gives totals for each nonterminal with its rules
+underneath.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from spark_parser.spark import rule2str
+
+from decompyle3.parsers.profiling import Profile
+
+# Per-rule [calls, rejects, seconds].
+profile = Profile()
+
+
+def record(rule: tuple, invalid: bool, seconds: float) -> None:
+    rules = profile.data
+    counts = rules.get(rule)
+    if counts is None:
+        counts = rules[rule] = [0, 0, 0.0]
+    counts[0] += 1
+    if invalid:
+        counts[1] += 1
+    counts[2] += seconds
+
+
+def by_lhs(data: Optional[Dict[tuple, list]] = None) -> Dict[str, list]:
+    """Return [calls, rejects, seconds] totals for each nonterminal
+    in *data*, or in what has been recorded here."""
+    if data is None:
+        data = profile.snapshot()
+    totals = {}
+    for (lhs, _), (calls, rejects, seconds) in data.items():
+        counts = totals.setdefault(lhs, [0, 0, 0.0])
+        counts[0] += calls
+        counts[1] += rejects
+        counts[2] += seconds
+    return totals
+
+
+def format_table(data: Optional[Dict[tuple, list]] = None) -> str:
+    """Return a table of reduce-check counts and times for each
+    nonterminal, slowest first, with its rules listed underneath."""
+    if data is None:
+        data = profile.snapshot()
+    header = "%10s %10s %10s %10s  %s" % (
+        "calls",
+        "accepts",
+        "rejects",
+        "time (ms)",
+        "nonterminal / rule",
+    )
+    lines = [header, "-" * len(header)]
+
+    def line(counts: list, name: str) -> str:
+        calls, rejects, seconds = counts
+        return "%10d %10d %10d %10.1f  %s" % (
+            calls,
+            calls - rejects,
+            rejects,
+            1000 * seconds,
+            name,
+        )
+
+    def slowest(item: Tuple[object, list]):
+        return -item[1][2]
+
+    totals = [0, 0, 0.0]
+    lhs_rules = {}
+    for rule, counts in data.items():
+        lhs_rules.setdefault(rule[0], []).append((rule, counts))
+    for lhs, counts in sorted(by_lhs(data).items(), key=slowest):
+        lines.append(line(counts, lhs))
+        for rule, rule_counts in sorted(lhs_rules[lhs], key=slowest):
+            lines.append(line(rule_counts, "    " + rule2str(rule)))
+        for i in range(3):
+            totals[i] += counts[i]
+    lines.append("-" * len(header))
+    lines.append(line(totals, "total"))
+    return "\n".join(lines)
@@ -1,13 +1,17 @@
 from decompyle3.parsers.reducecheck.and_check import *
 from decompyle3.parsers.reducecheck.and_cond_check import *
 from decompyle3.parsers.reducecheck.and_not_check import *
+from decompyle3.parsers.reducecheck.annotate_tuple import *
+from decompyle3.parsers.reducecheck.aug_assign import *
 from decompyle3.parsers.reducecheck.break38 import *
+from decompyle3.parsers.reducecheck.call_kw import *
 from decompyle3.parsers.reducecheck.if_and_stmt import *
 from decompyle3.parsers.reducecheck.if_and_elsestmt import *
 from decompyle3.parsers.reducecheck.ifelsestmt import *
 from decompyle3.parsers.reducecheck.iflaststmt import *
 from decompyle3.parsers.reducecheck.ifstmt import *
 from decompyle3.parsers.reducecheck.ifstmts_jump import *
+from decompyle3.parsers.reducecheck.import_from37 import *
 from decompyle3.parsers.reducecheck.for38 import *
 from decompyle3.parsers.reducecheck.lastc_stmt import *
 from decompyle3.parsers.reducecheck.list_if_not import *
@@ -21,3 +25,4 @@ from decompyle3.parsers.reducecheck.tryexcept import *
 from decompyle3.parsers.reducecheck.while1elsestmt import *
 from decompyle3.parsers.reducecheck.while1stmt import *
 from decompyle3.parsers.reducecheck.whilestmt import *
+from decompyle3.parsers.reducecheck.whilestmt38 import *
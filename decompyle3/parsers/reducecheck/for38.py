@@ -30,40 +30,39 @@ def for38_check(
     start = self.offset2inst_index[first_offset]
     end = off2int(self.offset2inst_index[last_offset], prefer_last=True)
 
-    # In the loop below we expect the first "FOR_ITER" to
-    # be before any jumps that go to the end of it (in the case of "for")
-    # or beyond it (in the case of "for else").
+    # We expect the first "FOR_ITER" to be before any jumps that go to
+    # the end of it (in the case of "for") or beyond it (in the case of
+    # "for else").
+    for_iter_index = self.cfg.first_op(self.opc.FOR_ITER, start, end)
+    if for_iter_index is None:
+        return False
+    inst = self.insts[for_iter_index]
 
-    for_body_end_offset = None
-    for i in range(start, end):
-        inst = self.insts[i]
+    # Hack alert for magic number 2's below:  in Python 3.8+ instructions are 2 bytes
+    # inst.argval - 2 is the offset of the instruction *before* inst.argval and
+    # +2 for the instruction that follows.
 
-        # Hack alert for magic number 2's below:  in Python 3.8+ instructions are 2 bytes
-        # inst.argval - 2 is the offset of the instruction *before* inst.argval and
-        # +2 for the instruction that follows.
+    # There can be some slop in "last" as to where the body ends. If the rule
+    # end in "JUMP_BACK", then "last" doesn't need adjusting.
+    for_body_end_offset = inst.argval if rule[1][-1] == "JUMP_BACK" else inst.argval - 2
+    if self.insts[end].has_extended_arg:
+        last_offset += 2
+    if last_offset < for_body_end_offset:
+        # "for" body isn't big enough
+        return True
 
-        if not for_body_end_offset and inst.opname == "FOR_ITER":
-            # There can be some slop in "last" as to where the body ends. If the rule
-            # end in "JUMP_BACK", then "last" doesn't need adjusting.
-            for_body_end_offset = inst.argval if rule[1][-1] == "JUMP_BACK" else inst.argval - 2
-            if self.insts[end].has_extended_arg:
-                last_offset += 2
-            if last_offset < for_body_end_offset:
-                # "for" body isn't big enough
-                return True
-            continue
-        if for_body_end_offset and inst.is_jump() and inst.argval > for_body_end_offset:
-            # Another weird case. Guard against misclassifying things like:
-            #   if a:
-            #     for n in l:
-            #       if b: break # jumps past "else" which is after the end of the "for"
-            #       elif c:
-            #         r = 2
-            #   else:
-            #        r = 3
-            # The way we distinguish this is to check if the instruction after the body end
-            # starts with a jump (the start of the encompassing if/else. The "else" part
-            # of a "for/else" never starts with a jump.
-            body_end_next_inst = self.insts[self.offset2inst_index[for_body_end_offset + 2]]
-            return not body_end_next_inst.is_jump()
+    if self.cfg.max_jump_target(for_iter_index + 1, end) > for_body_end_offset:
+        # Another weird case. Guard against misclassifying things like:
+        #   if a:
+        #     for n in l:
+        #       if b: break # jumps past "else" which is after the end of the "for"
+        #       elif c:
+        #         r = 2
+        #   else:
+        #        r = 3
+        # The way we distinguish this is to check if the instruction after the body end
+        # starts with a jump (the start of the encompassing if/else. The "else" part
+        # of a "for/else" never starts with a jump.
+        body_end_next_inst = self.insts[self.offset2inst_index[for_body_end_offset + 2]]
+        return not body_end_next_inst.is_jump()
     return False
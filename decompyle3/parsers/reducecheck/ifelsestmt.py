@@ -121,13 +121,10 @@ def ifelsestmt(
 
         then_start_offset = ast[1].first_child().off2int(prefer_last=False)
 
-        i = self.offset2inst_index[then_start_offset]
-        inst = self.insts[i]
-        while inst.offset < else_start_offset:
-            if inst.is_jump() and inst.argval == else_start_offset:
-                return True
-            i += 1
-            inst = self.insts[i]
+        if self.cfg.has_jump_to(
+            else_start_offset, then_start_offset, else_start_offset
+        ):
+            return True
 
         last_offset = tokens[last].off2int(prefer_last=False)
         if last_offset == -1:
@@ -75,10 +75,8 @@ def iflaststmt(
         #        if testexpr
         # from:
         #     while testexpr
-        for i in range(test_inst_offset, inst_offset):
-            inst = self.insts[i]
-            if inst.is_jump() and inst.argval > last_offset:
-                return True
+        if self.cfg.max_jump_target(test_inst_offset, inst_offset) > last_offset:
+            return True
 
         testexpr_last_inst = self.insts[inst_offset - 1]
         if testexpr_last_inst.is_jump():
@@ -95,14 +93,10 @@ def iflaststmt(
                 # else:
                 #    ...
                 # we are going to hack this my looking for another jump to the same target. Sigh.
-                i = inst_offset
-                inst = self.insts[i]
-                while inst.offset < target_offset:
-                    if inst.is_jump() and inst.argval == target_offset:
-                        return False
-                    i += 1
-                    inst = self.insts[i]
-                    pass
+                if self.cfg.has_jump_to(
+                    target_offset, self.insts[inst_offset].offset, target_offset
+                ):
+                    return False
                 last_index = self.offset2inst_index[last_offset]
                 last_inst = self.insts[last_index]
                 # Jumping beyond last_offset is okay since this may be the
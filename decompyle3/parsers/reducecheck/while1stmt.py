@@ -29,7 +29,7 @@ def while1stmt(
         last += 1
     if last == n:
         last -= 1
-    offset = tokens[last].off2int()
+    offset = tokens[last].off2int(prefer_last=False)
     assert tokens[first] == "SETUP_LOOP"
 
     # Scan for jumps out of the loop. Skip the initial "SETUP_LOOP" instruction.
@@ -0,0 +1,27 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+def whilestmt38_check(
+    self, lhs: str, n: int, rule, ast, tokens: list, first: int, last: int
+) -> bool:
+    # The loop has to end in a JUMP_BACK to its start.
+    jb_index = last - 1
+    while jb_index > 0 and tokens[jb_index].kind.startswith("COME_FROM"):
+        jb_index -= 1
+    t = tokens[jb_index]
+    if t.kind != "JUMP_BACK":
+        return True
+    return t.attr != tokens[first].off2int()
@@ -0,0 +1,107 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Grammar rule profiles.
+
+Only a fraction of the grammar rules are ever used on the kind of code
+a given deployment decompiles. When recording is turned on with
+profile.enable(), each rule is counted every time a tree node is built
+with it, which includes the trees built for reduce checks, and every
+time a reduce check rejects a reduction by it.
+
+A profile is a dictionary from rule to [reductions, rejects], like the
+one profile.snapshot() returns. It can be written to a file with write()
+and read back with read(). The file is plain text, one rule per line,
+sorted, so that profiles can be kept under version control and diffed:
+
+    # decompyle3 rule profile, format 1
+    # reductions rejects rule
+    1204 0 expr ::= LOAD_FAST
+    ...
+
+get_python_parser() takes a profile. The parser then parses with the
+rules the profile has seen used first, and with the whole grammar only
+if that fails; see parse_tokens(). Beware that the parser settles
+ambiguities using the rules that can complete together at a point, so
+with fewer rules it can settle some of them differently, even with a
+profile recorded on the very code being decompiled. Use a profile where
+throughput matters more than matching the output of a full parse.
+"""
+
+from typing import Dict, Optional
+
+from spark_parser.spark import rule2str
+
+from decompyle3.parsers.profiling import Profile
+
+HEADER = "# decompyle3 rule profile, format 1"
+
+# Per-rule [reductions, rejects].
+profile = Profile()
+
+# How many parses with the rules of a profile worked, and how many had
+# to be done again with the whole grammar.
+stats = {"hot": 0, "fallbacks": 0}
+
+
+def record(rule: tuple, rejected: bool = False) -> None:
+    rules = profile.data
+    counts = rules.get(rule)
+    if counts is None:
+        counts = rules[rule] = [0, 0]
+    counts[rejected] += 1
+
+
+def used_rules(data: Dict[tuple, list], min_reductions: int = 1) -> frozenset:
+    """Return the rules that *data* has seen used at least
+    *min_reductions* times."""
+    return frozenset(
+        rule for rule, (reductions, _) in data.items() if reductions >= min_reductions
+    )
+
+
+def format_profile(data: Dict[tuple, list]) -> str:
+    lines = [HEADER, "# reductions rejects rule"]
+    for rule, (reductions, rejects) in sorted(data.items()):
+        lines.append("%d %d %s" % (reductions, rejects, rule2str(rule)))
+    return "\n".join(lines) + "\n"
+
+
+def parse_profile(text: str) -> Dict[tuple, list]:
+    lines = text.splitlines()
+    if not lines or lines[0] != HEADER:
+        raise ValueError("not a rule profile, or not one in a format we know")
+    data = {}
+    for line in lines[1:]:
+        if not line or line.startswith("#"):
+            continue
+        reductions, rejects, rule = line.split(" ", 2)
+        lhs, _, rhs = rule.partition(" ::=")
+        data[(lhs, tuple(rhs.split()))] = [int(reductions), int(rejects)]
+    return data
+
+
+def write(path: str, data: Optional[Dict[tuple, list]] = None) -> None:
+    """Write *data*, or what has been recorded here, to the file *path*."""
+    if data is None:
+        data = profile.snapshot()
+    with open(path, "w") as fp:
+        fp.write(format_profile(data))
+
+
+def read(path: str) -> Dict[tuple, list]:
+    """Return the profile in the file *path*."""
+    with open(path) as fp:
+        return parse_profile(fp.read())
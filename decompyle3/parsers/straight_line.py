@@ -0,0 +1,389 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+A fast path for parsing straight-line code.
+
+When no instruction of a code object jumps, and nothing is jumped to,
+its statements follow one another and each expression is evaluated on
+the stack in the order its instructions appear. The tokens can then be
+reduced deterministically, as a stack machine would, without going
+through the Earley parser.
+
+The reductions are made with the rules of the parser's grammar and the
+functions that go with them, so the tree built is the one the Earley
+parser builds. Anything that isn't understood here: an instruction that
+isn't handled, a rule that isn't in the customized grammar, or a
+nonterminal that has a reduce check, makes parse() return None, and the
+tokens are then left to the Earley parser.
+
+Setting *check* parses the tokens with the Earley parser as well and
+raises an AssertionError if the trees differ.
+"""
+
+from decompyle3.parsers import expr_builder
+from decompyle3.parsers.expr_builder import ExpressionBuilder, NotReduced
+from decompyle3.scanners.tok import Token
+
+# Parse with the Earley parser as well and compare the trees.
+check = False
+
+# How many token lists were offered, how many of those had no jumps,
+# and how many of those were parsed here.
+stats = {"parses": 0, "straight": 0, "hits": 0}
+
+# Instructions that are left as they are until we see what they are
+# used for. Besides the loads that can be an "expr", there are those
+# that are parts of definitions.
+LOADS = expr_builder.LOADS | {
+    "LOAD_BUILD_CLASS",
+    "LOAD_CLOSURE",
+    "LOAD_CODE",
+    "LOAD_LAMBDA",
+}
+
+# Statements made by storing something other than an expression.
+DEFINITIONS = {"build_class": "classdef", "mkfunc": "function_def"}
+
+
+class ImportName:
+    """What an IMPORT_NAME leaves on the stack until the import is
+    complete: the "alias"es of a "from" import so far, and the
+    IMPORT_FROM waiting for its store, if any."""
+
+    def __init__(self, token):
+        self.token = token
+        self.aliases = []
+        self.import_from = None
+
+
+def hit_rate() -> float:
+    return stats["hits"] / stats["parses"] if stats["parses"] else 0.0
+
+
+def clear() -> None:
+    """Reset the counters."""
+    for name in stats:
+        stats[name] = 0
+
+
+def is_straight_line(tokens, opc) -> bool:
+    """Return True if no token in *tokens* is a jump or is jumped to."""
+    jumps = opc.JUMP_OPS
+    for token in tokens:
+        if token.op in jumps or token.kind.startswith("COME_FROM"):
+            return False
+    return True
+
+
+def parse(p, tokens):
+    """Return the tree that parser *p* builds for the statement list
+    *tokens*, or None if *tokens* have to be parsed by the Earley
+    parser. The grammar of *p* should have been customized for *tokens*.
+    """
+    stats["parses"] += 1
+    if (
+        p.start_symbol != "stmts"
+        or not tokens
+        or p.debug.get("reduce")
+        or not is_straight_line(tokens, tokens[0].opc)
+    ):
+        return None
+    stats["straight"] += 1
+    try:
+        ast = StraightLineReducer(p).reduce_tokens(tokens)
+    except NotReduced:
+        return None
+    stats["hits"] += 1
+    if check:
+        if p.overlay_grammar and hasattr(p, "grammar_checkpoint"):
+            p.install_overlay()
+        earley_ast = p.parse(tokens)
+        assert str(ast) == str(earley_ast), "%s\n!=\n%s" % (ast, earley_ast)
+    return ast
+
+
+class StraightLineReducer(ExpressionBuilder):
+    """Reduce the tokens of straight-line code, statements as well as
+    expressions, with the rules of a parser's grammar. Besides tokens and
+    "expr" trees, the stack can have definitions not yet stored.
+    """
+
+    def __init__(self, p):
+        super().__init__(p)
+        # Unpacks whose stores we are still collecting: the token, the
+        # stores so far and, for an outermost unpack, the value unpacked.
+        self.unpacks = []
+        # The statements reduced so far.
+        self.stmts = None
+
+    def reduce_tokens(self, tokens):
+        for token in tokens:
+            kind = token.kind
+            if kind in LOADS:
+                self.stack.append(token)
+                continue
+            method, count = self.method(kind)
+            if method is None:
+                raise NotReduced
+            if count is None:
+                method(self, token)
+            else:
+                method(self, token, count)
+        if self.stack or self.unpacks or self.stmts is None:
+            raise NotReduced
+        return self.stmts
+
+    def pop_node(self, kind: str):
+        if not self.stack:
+            raise NotReduced
+        node = self.stack.pop()
+        if isinstance(node, (Token, ImportName)) or node.kind != kind:
+            raise NotReduced
+        return node
+
+    def pop_import(self):
+        """Pop an IMPORT_NAME and the LOAD_CONSTs for its level and from
+        list, which come before it."""
+        if not self.stack or not isinstance(self.stack[-1], ImportName):
+            raise NotReduced
+        import_name = self.stack.pop()
+        fromlist = self.pop_token("LOAD_CONST")
+        level = self.pop_token("LOAD_CONST")
+        return level, fromlist, import_name
+
+    def add_stmt(self, node) -> None:
+        """Add statement *node*, which ends what is on the stack."""
+        if self.stack or self.unpacks:
+            raise NotReduced
+        stmt = self.reduce("stmt", [node])
+        sstmt = self.reduce("sstmt", [stmt], ("stmt",))
+        if self.stmts is None:
+            self.stmts = self.reduce("stmts", [sstmt], ("sstmt",))
+        else:
+            self.stmts = self.reduce("stmts", [self.stmts, sstmt], ("stmts", "sstmt"))
+
+    def add_store(self, store) -> None:
+        """Use *store* for the innermost unpack still missing some, or
+        else assign to it what is on the stack."""
+        if self.unpacks:
+            token, stores, value = self.unpacks[-1]
+            stores.append(store)
+            if len(stores) < token.attr:
+                return
+            self.unpacks.pop()
+            unpack = self.reduce("unpack", [token] + stores)
+            store = self.reduce("store", [unpack])
+            if value is None:
+                self.add_store(store)
+                return
+            self.stack.append(value)
+        if not self.stack:
+            raise NotReduced
+        value = self.stack[-1]
+        if isinstance(value, ImportName):
+            if value.import_from is not None:
+                # A name of a "from" import.
+                alias = self.reduce("alias", [value.import_from, store])
+                value.aliases.append(alias)
+                value.import_from = None
+                return
+            if value.aliases:
+                raise NotReduced
+            # Imports one after the other can be an "importmultiple"
+            # instead, and which of them the Earley parser takes depends
+            # on more than the two imports.
+            if self.stmts is not None and self.stmts[-1].kind == "import":
+                raise NotReduced
+            level, fromlist, import_name = self.pop_import()
+            alias = self.reduce("alias", [import_name.token, store])
+            self.add_stmt(self.reduce("import", [level, fromlist, alias]))
+            return
+        self.stack.pop()
+        if not isinstance(value, Token) and value.kind in DEFINITIONS:
+            self.add_stmt(self.reduce(DEFINITIONS[value.kind], [value, store]))
+        else:
+            self.add_stmt(self.reduce("assign", [self.expr(value), store]))
+
+    # Instructions without a count.
+
+    def import_name(self, token) -> None:
+        self.stack.append(ImportName(token))
+
+    def import_from(self, token) -> None:
+        if not self.stack or not isinstance(self.stack[-1], ImportName):
+            raise NotReduced
+        import_name = self.stack[-1]
+        if import_name.import_from is not None:
+            raise NotReduced
+        import_name.import_from = token
+
+    def import_star(self, token) -> None:
+        level, fromlist, import_name = self.pop_import()
+        if import_name.aliases or import_name.import_from is not None:
+            raise NotReduced
+        self.add_stmt(
+            self.reduce(
+                "import_from_star", [level, fromlist, import_name.token, token]
+            )
+        )
+
+    def store_name(self, token) -> None:
+        self.add_store(self.reduce("store", [token]))
+
+    def store_attr(self, token) -> None:
+        self.add_store(self.reduce("store", [self.pop_expr(), token]))
+
+    def store_subscript(self, token) -> None:
+        index = self.pop_expr()
+        node = self.reduce("store_subscript", [self.pop_expr(), index, token])
+        self.add_store(self.reduce("store", [node]))
+
+    def delete_name(self, token) -> None:
+        self.add_stmt(self.reduce("delete", [token]))
+
+    def delete_attr(self, token) -> None:
+        self.add_stmt(self.reduce("delete", [self.pop_expr(), token]))
+
+    def pop_top(self, token) -> None:
+        if self.stack and isinstance(self.stack[-1], ImportName):
+            level, fromlist, import_name = self.pop_import()
+            if not import_name.aliases or import_name.import_from is not None:
+                raise NotReduced
+            importlist = None
+            for alias in import_name.aliases:
+                if importlist is None:
+                    importlist = self.reduce("importlist", [alias])
+                else:
+                    importlist = self.reduce("importlist", [importlist, alias])
+            self.add_stmt(
+                self.reduce(
+                    "import_from",
+                    [level, fromlist, import_name.token, importlist, token],
+                )
+            )
+            return
+        self.add_stmt(self.reduce("expr_stmt", [self.pop_expr(), token]))
+
+    def return_value(self, token) -> None:
+        ret_expr = self.reduce("ret_expr", [self.pop_expr()])
+        self.add_stmt(self.reduce("return", [ret_expr, token]))
+
+    def return_last(self, token) -> None:
+        if self.stmts is None or self.stack or self.unpacks:
+            raise NotReduced
+        # Take the last statement back out of the statement list.
+        sstmt = self.stmts.pop()
+        sstmt = self.reduce("sstmt", [sstmt, token], ("sstmt", "RETURN_LAST"))
+        if len(self.stmts):
+            self.stmts.append(sstmt)
+        else:
+            self.stmts = self.reduce("stmts", [sstmt], ("sstmt",))
+
+    # Instructions with a count.
+
+    def call(self, token, count: int) -> None:
+        if token.attr != count or count >= len(self.stack):
+            raise NotReduced
+        function = self.stack[-count - 1]
+        if isinstance(function, Token) and function.kind == "LOAD_BUILD_CLASS":
+            self.build_class(token, count)
+            return
+        super().call(token, count)
+
+    def build_class(self, token, count: int) -> None:
+        # There is a "class" rule with a "call" in place of an "expr" for
+        # the base classes; we don't say which of them applies.
+        bases = self.pop_exprs(count - 1)
+        if any(base[0].kind == "call" for base in bases):
+            raise NotReduced
+        mkfunc = self.pop_node("mkfunc")
+        build_class = self.pop_token("LOAD_BUILD_CLASS")
+        self.stack.append(
+            self.reduce("build_class", [build_class, mkfunc] + bases + [token])
+        )
+
+    def build_collection(self, token, count: int) -> None:
+        if (
+            token.kind.startswith("BUILD_TUPLE_")
+            and count
+            and count <= len(self.stack)
+            and all(
+                isinstance(item, Token) and item.kind == "LOAD_CLOSURE"
+                for item in self.stack[-count:]
+            )
+        ):
+            # The free variables of a closure.
+            closure = self.stack[-count:]
+            del self.stack[-count:]
+            self.stack.append(self.reduce("load_closure", closure + [token]))
+            return
+        super().build_collection(token, count)
+
+    def unpack_sequence(self, token, count: int) -> None:
+        if token.attr != count:
+            raise NotReduced
+        # An outermost unpack takes the value to unpack off the stack; one
+        # nested in another unpacks what the enclosing one handed it.
+        value = None if self.unpacks else self.pop_expr()
+        self.unpacks.append((token, [], value))
+
+    def make_function(self, token, flags: int) -> None:
+        name = self.pop_token("LOAD_STR")
+        if not self.stack or not isinstance(self.stack[-1], Token):
+            raise NotReduced
+        code = self.stack.pop()
+        args = [code, name, token]
+        if flags & 8:
+            args.insert(0, self.pop_node("load_closure"))
+        # Defaults, keyword defaults and annotations come before that.
+        args[:0] = self.pop_exprs(bin(flags & 7).count("1"))
+        if code.kind == "LOAD_CODE":
+            self.stack.append(self.reduce("mkfunc", args))
+        elif code.kind == "LOAD_LAMBDA":
+            self.push_expr(self.reduce("mklambda", args))
+        else:
+            raise NotReduced
+
+    SIMPLE = dict(
+        ExpressionBuilder.SIMPLE,
+        DELETE_ATTR=delete_attr,
+        DELETE_FAST=delete_name,
+        DELETE_GLOBAL=delete_name,
+        DELETE_NAME=delete_name,
+        IMPORT_FROM=import_from,
+        IMPORT_NAME=import_name,
+        IMPORT_NAME_ATTR=import_name,
+        IMPORT_STAR=import_star,
+        POP_TOP=pop_top,
+        RETURN_LAST=return_last,
+        RETURN_VALUE=return_value,
+        STORE_ATTR=store_attr,
+        STORE_DEREF=store_name,
+        STORE_FAST=store_name,
+        STORE_GLOBAL=store_name,
+        STORE_NAME=store_name,
+        STORE_SUBSCR=store_subscript,
+    )
+
+    COUNTED = dict(
+        ExpressionBuilder.COUNTED,
+        BUILD_LIST=build_collection,
+        BUILD_SET=build_collection,
+        BUILD_TUPLE=build_collection,
+        CALL_FUNCTION=call,
+        CALL_METHOD=call,
+        MAKE_FUNCTION=make_function,
+        UNPACK_SEQUENCE=unpack_sequence,
+    )
@@ -22,6 +22,7 @@ scanners, e.g. for Python 3.7 or 3.8.
 """
 
 import xdis
+from bisect import bisect_left, bisect_right
 from typing import Optional
 from array import array
 from collections import namedtuple
@@ -29,8 +30,6 @@ from xdis.version_info import IS_PYPY, version_tuple_to_str
 from xdis import (
     Bytecode,
     canonic_python_version,
-    code2num,
-    extended_arg_val,
     instruction_size,
     next_offset,
 )
@@ -48,11 +47,112 @@ CANONIC2VERSION = dict(
 
 L65536 = 65536
 
+# What Scanner.lines gives for an offset: the line number the offset
+# is on, and the offset where the next line starts.
+LineTuple = namedtuple("LineTuple", ["l_no", "next"])
+
 
 def long(num):
     return num
 
 
+def find_offsets(index: dict, instr, start: int, end: int) -> list:
+    """Return, in order, the offsets from *start* up to but not including
+    *end* of the opcodes in *instr*, going by *index*, which maps an
+    opcode to the sorted offsets it is at."""
+    found = []
+    for op in instr:
+        offsets = index.get(op)
+        if offsets:
+            found += offsets[bisect_left(offsets, start) : bisect_left(offsets, end)]
+    if len(instr) > 1:
+        found = sorted(set(found))
+    return found
+
+
+class LineIndex:
+    """
+    The line number of each offset in the code, and the offset where
+    the following line starts, as a sequence of LineTuples indexed by
+    offset.
+
+    Only the offsets where lines start are kept, and an offset is
+    looked up among them by bisection. A list with a LineTuple for
+    each byte of the code would take millions of objects for a large
+    module.
+    """
+
+    __slots__ = ("starts", "line_numbers", "codelen")
+
+    def __init__(self, linestarts: list, codelen: int):
+        # As with the linestarts, the first line covers the offsets
+        # from 0 on.
+        self.starts = array("l", [0])
+        self.line_numbers = array("l", [linestarts[0][1]])
+        for start_offset, line_no in linestarts[1:]:
+            self.starts.append(start_offset)
+            self.line_numbers.append(line_no)
+        self.codelen = codelen
+
+    def __len__(self) -> int:
+        return self.codelen
+
+    def __getitem__(self, offset: int) -> LineTuple:
+        if offset < 0:
+            offset += self.codelen
+        if not 0 <= offset < self.codelen:
+            raise IndexError("offset %d is not in the code" % offset)
+        starts = self.starts
+        i = bisect_right(starts, offset)
+        next_start = starts[i] if i < len(starts) else self.codelen
+        return LineTuple(self.line_numbers[i - 1], next_start)
+
+
+class JumpTargets:
+    """
+    For each jump target offset, the offsets of the instructions that
+    jump there, in increasing order.
+
+    The jumps are kept in compressed sparse row form: one array of
+    the jumping offsets grouped by target, and for each target the
+    index its group starts at. Building a list per target by copying
+    it with one more offset each time was quadratic in the number of
+    jumps to a target, such as the end of a loop with thousands of
+    "break"s.
+    """
+
+    __slots__ = ("rows", "starts", "sources")
+
+    def __init__(self, labels: array, sources: array):
+        # *labels* and *sources* are the target and the jumping offset
+        # of each jump, in increasing order of jumping offset. A
+        # stable sort on target keeps that order within each group.
+        order = sorted(range(len(labels)), key=labels.__getitem__)
+        self.rows = {}
+        self.starts = array("l")
+        self.sources = array("l")
+        for i in order:
+            label = labels[i]
+            if label not in self.rows:
+                self.rows[label] = len(self.starts)
+                self.starts.append(len(self.sources))
+            self.sources.append(sources[i])
+        self.starts.append(len(self.sources))
+
+    def __contains__(self, target: int) -> bool:
+        return target in self.rows
+
+    def __getitem__(self, target: int) -> array:
+        row = self.rows[target]
+        return self.sources[self.starts[row] : self.starts[row + 1]]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
 class Code(object):
     """
     Class for representing code-objects.
@@ -69,6 +169,10 @@ class Code(object):
 
 
 class Scanner(object):
+    # If true, ingest() gives a TokenList, which keeps the tokens as
+    # arrays of their attributes, instead of a list of Tokens.
+    token_arrays = False
+
     def __init__(self, version: tuple, show_asm=None, is_pypy=False):
         self.version = version
         self.show_asm = show_asm
@@ -108,6 +212,20 @@ class Scanner(object):
         for i, inst in enumerate(self.insts):
             self.offset2inst_index[inst.offset] = i
 
+        # For each opcode, the offsets where it is, in self.code for
+        # first_instr(), last_instr() and all_instr(), and in self.insts
+        # for inst_matches(). Those get called over and over on the same
+        # code, so they look their opcodes up here rather than go through
+        # the code each time.
+        self.code_op_offsets = {}
+        code = self.code
+        for offset in self.op_range(0, len(code)):
+            self.code_op_offsets.setdefault(code[offset], []).append(offset)
+        self.inst_offsets = [inst.offset for inst in self.insts]
+        self.inst_op_offsets = {}
+        for inst in self.insts:
+            self.inst_op_offsets.setdefault(inst.opcode, []).append(inst.offset)
+
         return bytecode
 
     def build_lines_data(self, code_obj):
@@ -123,29 +241,9 @@ class Scanner(object):
             linestarts = [[0, 1]]
         self.linestarts = dict(linestarts)
 
-        # 'List-map' which shows line number of current op and offset of
-        # first op on following line, given offset of op as index
-        lines = []
-        LineTuple = namedtuple("LineTuple", ["l_no", "next"])
-
-        # Iterate through available linestarts, and fill
-        # the data for all code offsets encountered until
-        # last linestart offset
-        _, prev_line_no = linestarts[0]
-        offset = 0
-        for start_offset, line_no in linestarts[1:]:
-            while offset < start_offset:
-                lines.append(LineTuple(prev_line_no, start_offset))
-                offset += 1
-            prev_line_no = line_no
-
-        # Fill remaining offsets with reference to last line number
-        # and code length as start offset of following non-existing line
-        codelen = len(self.code)
-        while offset < codelen:
-            lines.append(LineTuple(prev_line_no, codelen))
-            offset += 1
-        return lines
+        # Line number of the op at an offset, and offset of the first op
+        # on the following line, given the offset.
+        return LineIndex(linestarts, len(self.code))
 
     def build_prev_op(self):
         """
@@ -235,21 +333,21 @@ class Scanner(object):
         if not isinstance(instr, list):
             instr = [instr]
 
+        offsets = find_offsets(self.code_op_offsets, instr, start, end)
+        if target is None:
+            return offsets[0] if offsets else None
+
         result_offset = None
         current_distance = len(code)
-        for offset in self.op_range(start, end):
-            op = code[offset]
-            if op in instr:
-                if target is None:
-                    return offset
-                dest = self.get_target(offset)
-                if dest == target:
-                    return offset
-                elif not exact:
-                    new_distance = abs(target - dest)
-                    if new_distance < current_distance:
-                        current_distance = new_distance
-                        result_offset = offset
+        for offset in offsets:
+            dest = self.get_target(offset)
+            if dest == target:
+                return offset
+            elif not exact:
+                new_distance = abs(target - dest)
+                if new_distance < current_distance:
+                    current_distance = new_distance
+                    result_offset = offset
         return result_offset
 
     def last_instr(
@@ -275,36 +373,30 @@ class Scanner(object):
         if not isinstance(instr, list):
             instr = [instr]
 
+        # EXTENDED_ARGs are part of the instruction that follows them.
+        instr = [op for op in instr if op != self.opc.EXTENDED_ARG]
+        offsets = find_offsets(self.code_op_offsets, instr, start, end)
+        if target is None:
+            return offsets[-1] if offsets else None
+
+        # Go backwards: an exact match beats any other, and the last one
+        # is usually near the end. Of the closest other ones, the last
+        # one wins.
         result_offset = None
         current_distance = self.insts[-1].offset - self.insts[0].offset
-        extended_arg = 0
-        # FIXME: use self.insts rather than code[]
-        for offset in self.op_range(start, end):
-            op = code[offset]
-
-            if op == self.opc.EXTENDED_ARG:
-                arg = code2num(code, offset + 1) | extended_arg
-                extended_arg = extended_arg_val(self.opc, arg)
-                continue
-
-            if op in instr:
-                if target is None:
+        for offset in reversed(offsets):
+            dest = self.get_target(offset)
+            if dest == target:
+                return offset
+            elif not exact:
+                new_distance = abs(target - dest)
+                if new_distance < current_distance or (
+                    result_offset is None and new_distance == current_distance
+                ):
+                    current_distance = new_distance
                     result_offset = offset
-                else:
-                    dest = self.get_target(offset, extended_arg)
-                    if dest == target:
-                        current_distance = 0
-                        result_offset = offset
-                    elif not exact:
-                        new_distance = abs(target - dest)
-                        if new_distance <= current_distance:
-                            current_distance = new_distance
-                            result_offset = offset
-                            pass
-                        pass
                     pass
                 pass
-            extended_arg = 0
             pass
         return result_offset
 
@@ -323,22 +415,26 @@ class Scanner(object):
             instr = [instr]
 
         first = self.offset2inst_index[start]
+        # The instructions looked at run up to and including the first
+        # one at or after "end".
+        inst_offsets = self.inst_offsets
+        last = max(first, bisect_left(inst_offsets, end))
+        if last == len(inst_offsets):
+            last -= 1
+        offsets = find_offsets(
+            self.inst_op_offsets, instr, start, inst_offsets[last] + 1
+        )
+        if target is None:
+            return offsets
+
         result = []
-        for inst in self.insts[first:]:
-            if inst.opcode in instr:
-                if target is None:
-                    result.append(inst.offset)
-                else:
-                    t = self.get_target(inst.offset)
-                    if include_beyond_target and t >= target:
-                        result.append(inst.offset)
-                    elif t == target:
-                        result.append(inst.offset)
-                        pass
-                    pass
+        for offset in offsets:
+            t = self.get_target(offset)
+            if include_beyond_target and t >= target:
+                result.append(offset)
+            elif t == target:
+                result.append(offset)
                 pass
-            if inst.offset >= end:
-                break
             pass
 
         # FIXME: put in a test
@@ -368,30 +464,20 @@ class Scanner(object):
         if not isinstance(instr, list):
             instr = [instr]
 
-        result = []
-        extended_arg = 0
-        for offset in self.op_range(start, end):
+        # EXTENDED_ARGs are part of the instruction that follows them.
+        instr = [op for op in instr if op != self.opc.EXTENDED_ARG]
+        offsets = find_offsets(self.code_op_offsets, instr, start, end)
+        if target is None:
+            return offsets
 
-            op = code[offset]
-
-            if op == self.opc.EXTENDED_ARG:
-                arg = code2num(code, offset + 1) | extended_arg
-                extended_arg = extended_arg_val(self.opc, arg)
-                continue
-
-            if op in instr:
-                if target is None:
-                    result.append(offset)
-                else:
-                    t = self.get_target(offset, extended_arg)
-                    if include_beyond_target and t >= target:
-                        result.append(offset)
-                    elif t == target:
-                        result.append(offset)
-                        pass
-                    pass
+        result = []
+        for offset in offsets:
+            t = self.get_target(offset)
+            if include_beyond_target and t >= target:
+                result.append(offset)
+            elif t == target:
+                result.append(offset)
                 pass
-            extended_arg = 0
             pass
 
         return result
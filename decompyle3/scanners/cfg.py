@@ -0,0 +1,91 @@
+#  Copyright (c) 2021 Rocky Bernstein
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Jump index of a code object.
+
+The scanner builds one of these in ingest() from its instruction list
+and hands it to the parser, so that reduce checks can ask which
+instructions jump where, and where an opcode is, without walking the
+instructions between two offsets each time they are called.
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+
+class ControlFlowGraph:
+    def __init__(self, insts: list, offset2inst_index: Dict[int, int]):
+        self.insts = insts
+        self.offset2inst_index = offset2inst_index
+        n = len(insts)
+
+        # Jump index: for each jump target offset, the sorted offsets of
+        # the instructions that jump there, and for each opcode the
+        # instruction indices it is at.
+        self.jumps_to = {}  # type: Dict[int, List[int]]
+        self.op_indices = {}  # type: Dict[int, List[int]]
+
+        # Segment tree over instruction indices of jump targets, -1 for
+        # instructions that don't jump; see max_jump_target().
+        tree = array("l", [-1]) * (2 * n)
+
+        for i, inst in enumerate(insts):
+            self.op_indices.setdefault(inst.opcode, []).append(i)
+            if inst.is_jump() and isinstance(inst.argval, int):
+                self.jumps_to.setdefault(inst.argval, []).append(inst.offset)
+                tree[n + i] = inst.argval
+        for i in range(n - 1, 0, -1):
+            tree[i] = max(tree[2 * i], tree[2 * i + 1])
+        self.jump_target_tree = tree
+
+    def has_jump_to(self, target: int, start: int, end: int) -> bool:
+        """Is there an instruction from offset *start* up to but not
+        including *end* that jumps to *target*?"""
+        sources = self.jumps_to.get(target)
+        if not sources:
+            return False
+        i = bisect_left(sources, start)
+        return i < len(sources) and sources[i] < end
+
+    def max_jump_target(self, first: int, last: int) -> int:
+        """The furthest offset jumped to by an instruction whose index
+        is from *first* up to but not including *last*, or -1 if none
+        of them jump."""
+        tree = self.jump_target_tree
+        n = len(self.insts)
+        result = -1
+        lo, hi = max(first, 0) + n, min(last, n) + n
+        while lo < hi:
+            if lo & 1:
+                result = max(result, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                result = max(result, tree[hi])
+            lo >>= 1
+            hi >>= 1
+        return result
+
+    def first_op(self, opcode: int, first: int, last: int) -> Optional[int]:
+        """The index of the first instruction with *opcode* from index
+        *first* up to but not including *last*, or None."""
+        indices = self.op_indices.get(opcode)
+        if not indices:
+            return None
+        i = bisect_left(indices, first)
+        if i < len(indices) and indices[i] < last:
+            return indices[i]
+        return None
@@ -29,18 +29,21 @@ For example:
 Finally we save token information.
 """
 
+from array import array
 from typing import Any, Dict, List, Set
 
 from xdis import iscode, instruction_size, Instruction
 from xdis.bytecode import _get_const_info
 
 from decompyle3.scanner import Token
+from decompyle3.scanners.tok import TokenList, pair_offset
+from decompyle3.scanners.cfg import ControlFlowGraph
 import xdis
 
 # Get all the opcodes into globals
 import xdis.opcodes.opcode_37 as op3
 
-from decompyle3.scanner import Scanner
+from decompyle3.scanner import JumpTargets, Scanner
 
 import sys
 
@@ -213,6 +216,9 @@ class Scanner37Base(Scanner):
 
         bytecode = self.build_instructions(co)
 
+        # The parser's reduce checks ask this about jumps and opcodes.
+        self.cfg = ControlFlowGraph(self.insts, self.offset2inst_index)
+
         # show_asm = 'both'
         if show_asm in ("both", "before"):
             for instr in bytecode.get_instructions(co):
@@ -230,7 +236,7 @@ class Scanner37Base(Scanner):
         self.load_asserts = set()
 
         # list of tokens/instructions
-        tokens = []
+        tokens = TokenList(self.opc) if self.token_arrays else []
         self.offset2tok_index = {}
 
         n = len(self.insts)
@@ -291,7 +297,7 @@ class Scanner37Base(Scanner):
                     )
 
         # Get jump targets
-        # Format: {target offset: [jump offsets]}
+        # Format: JumpTargets, {target offset: [jump offsets]}
         jump_targets = self.find_jump_targets(show_asm)
         # print("XXX2", jump_targets)
 
@@ -313,11 +319,11 @@ class Scanner37Base(Scanner):
                 jump_idx = 0
                 # We want to process COME_FROMs to the same offset to be in *descending*
                 # offset order so we have the larger range or biggest instruction interval
-                # last. (I think they are sorted in increasing order, but for safety
-                # we sort them). That way, specific COME_FROM tags will match up
-                # properly. For example, a "loop" with an "if" nested in it should have the
-                # "loop" tag last so the grammar rule matches that properly.
-                for jump_offset in sorted(jump_targets[inst.offset], reverse=True):
+                # last. (JumpTargets keeps them in increasing order.) That way, specific
+                # COME_FROM tags will match up properly. For example, a "loop" with an
+                # "if" nested in it should have the "loop" tag last so the grammar rule
+                # matches that properly.
+                for jump_offset in reversed(jump_targets[inst.offset]):
                     come_from_name = "COME_FROM"
 
                     opname = self.opname_for_offset(jump_offset)
@@ -337,7 +343,7 @@ class Scanner37Base(Scanner):
                             come_from_name,
                             jump_offset,
                             repr(jump_offset),
-                            offset="%s_%s" % (inst.offset, jump_idx),
+                            offset=pair_offset(inst.offset, jump_idx),
                             has_arg=True,
                             opc=self.opc,
                             has_extended_arg=False,
@@ -530,7 +536,7 @@ class Scanner37Base(Scanner):
             print()
         return tokens, customize
 
-    def find_jump_targets(self, debug: str) -> dict:
+    def find_jump_targets(self, debug: str) -> JumpTargets:
         """
         Detect all offsets in a byte code which are jump targets
         where we might insert a COME_FROM instruction.
@@ -559,7 +565,9 @@ class Scanner37Base(Scanner):
         self.setup_loop_targets = {}  # target given setup_loop offset
         self.setup_loops = {}  # setup_loop offset given target
 
-        targets = {}
+        # The target and the jumping offset of each jump, in order.
+        labels = array("l")
+        sources = array("l")
         for i, inst in enumerate(self.insts):
             offset = inst.offset
             op = inst.opcode
@@ -567,7 +575,7 @@ class Scanner37Base(Scanner):
             # FIXME: this code is going to get removed.
             # Determine structures and fix jumps in Python versions
             # since 2.3
-            self.detect_control_flow(offset, targets, i)
+            self.detect_control_flow(offset, i)
 
             if inst.has_arg:
                 # FIXME: fix grammar so we don't have to exclude FOR_ITER
@@ -577,10 +585,11 @@ class Scanner37Base(Scanner):
                     label = self.fixed_jumps.get(offset)
 
                 if label is not None and label != -1:
-                    targets[label] = targets.get(label, []) + [offset]
+                    labels.append(label)
+                    sources.append(offset)
             elif op == self.opc.END_FINALLY and offset in self.fixed_jumps:
-                label = self.fixed_jumps[offset]
-                targets[label] = targets.get(label, []) + [offset]
+                labels.append(self.fixed_jumps[offset])
+                sources.append(offset)
                 pass
 
             pass  # for loop
@@ -591,7 +600,7 @@ class Scanner37Base(Scanner):
 
             pp.pprint(self.structs)
 
-        return targets
+        return JumpTargets(labels, sources)
 
     def build_statement_indices(self):
         code = self.code
@@ -683,9 +692,48 @@ class Scanner37Base(Scanner):
         # Finish filling the list for last statement
         slist += [codelen] * (codelen - len(slist))
 
-    def detect_control_flow(
-        self, offset: int, targets: Dict[Any, Any], inst_index: int
-    ):
+    def statement_chunks(self, tokens: list, chunk_size: int) -> List[int]:
+        """Return indices in *tokens*, the module-level tokens that come
+        from ingest(), at which they can be split into chunks of at least
+        *chunk_size* tokens that parse on their own.
+
+        A chunk starts at a line that begins a statement, right after an
+        instruction that ends one, and where no jump from before the split
+        goes to or past it.
+        """
+        spans = sorted(
+            (min(inst.offset, inst.argval), max(inst.offset, inst.argval))
+            for inst in self.insts
+            if inst.optype in ("jabs", "jrel")
+        )
+        n = len(spans)
+        i = 0
+        # How far the jumps seen so far go.
+        reach = -1
+        chunks = []
+        start = 0
+        ends_stmt = False
+        for j, token in enumerate(tokens):
+            if token.kind.startswith("COME_FROM"):
+                ends_stmt = False
+                continue
+            # With EXTENDED_ARGs, this is where they start.
+            offset = token.off2int(prefer_last=False)
+            while i < n and spans[i][0] < offset:
+                reach = max(reach, spans[i][1])
+                i += 1
+            if (
+                ends_stmt
+                and j - start >= chunk_size
+                and token.linestart
+                and reach < offset
+            ):
+                chunks.append(j)
+                start = j
+            ends_stmt = offset in self.stmts or token.off2int() in self.stmts
+        return chunks
+
+    def detect_control_flow(self, offset: int, inst_index: int):
         """
         Detect type of block structures and their boundaries to fix optimized jumps
         in python2.3+
@@ -695,23 +743,11 @@ class Scanner37Base(Scanner):
         inst = self.insts[inst_index]
         op = inst.opcode
 
-        # Detect parent structure
-        parent: Dict[str, Any] = self.structs[0]
-        start: int = parent["start"]
-        end: int = parent["end"]
-
-        # Pick inner-most parent for our offset
-        for struct in self.structs:
-            current_start = struct["start"]
-            current_end = struct["end"]
-            if (current_start <= offset < current_end) and (
-                current_start >= start and current_end <= end
-            ):
-                start = current_start
-                end = current_end
-                parent = struct
-
         if self.version < (3, 8) and op == self.opc.SETUP_LOOP:
+            parent = self.parent_struct(offset)
+            start: int = parent["start"]
+            end: int = parent["end"]
+
             # We categorize loop types: 'for', 'while', 'while 1' with
             # possibly suffixes '-loop' and '-else'
             # Try to find the jump_back instruction of the loop.
@@ -825,7 +861,7 @@ class Scanner37Base(Scanner):
 
         elif self.version < (3, 8) and op == self.opc.SETUP_EXCEPT:
             target = self.get_target(offset)
-            end = self.restrict_to_parent(target, parent)
+            end = self.restrict_to_parent(target, self.parent_struct(offset))
             self.fixed_jumps[offset] = end
         elif self.version < (3, 8) and op == self.opc.POP_EXCEPT:
             next_offset = xdis.next_offset(op, self.opc, offset)
@@ -842,7 +878,7 @@ class Scanner37Base(Scanner):
 
         elif op == self.opc.SETUP_FINALLY:
             target = self.get_target(offset)
-            end = self.restrict_to_parent(target, parent)
+            end = self.restrict_to_parent(target, self.parent_struct(offset))
             self.fixed_jumps[offset] = end
         elif op in self.jump_if_pop:
             target = self.get_target(offset)
@@ -853,7 +889,9 @@ class Scanner37Base(Scanner):
                 if unop_target and code[unop_target + 3] != self.opc.ROT_TWO:
                     self.fixed_jumps[offset] = unop_target
                 else:
-                    self.fixed_jumps[offset] = self.restrict_to_parent(target, parent)
+                    self.fixed_jumps[offset] = self.restrict_to_parent(
+                        target, self.parent_struct(offset)
+                    )
                     pass
                 pass
         else:
@@ -888,6 +926,25 @@ class Scanner37Base(Scanner):
                 pass
         return
 
+    def parent_struct(self, offset: int) -> Dict[str, Any]:
+        """Return the inner-most of the structures found so far that
+        *offset* is in. Only a few kinds of instructions need it, so
+        detect_control_flow() asks for it just for those."""
+        parent: Dict[str, Any] = self.structs[0]
+        start: int = parent["start"]
+        end: int = parent["end"]
+
+        for struct in self.structs:
+            current_start = struct["start"]
+            current_end = struct["end"]
+            if (current_start <= offset < current_end) and (
+                current_start >= start and current_end <= end
+            ):
+                start = current_start
+                end = current_end
+                parent = struct
+        return parent
+
     def next_except_jump(self, start):
         """
         Return the next jump that was generated by an except SomeException:
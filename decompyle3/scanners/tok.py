@@ -16,19 +16,40 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import re, sys
+from array import array
+
+# Some tokens have a pair of numbers for an offset, shown as "%d_%d":
+# a COME_FROM has its instruction's offset and a count of the COME_FROMs
+# before it there, and a token whose instruction has an EXTENDED_ARG has
+# the offsets of the two. The pair is packed into one int with the
+# OFFSET_PAIR bit set, so that it is never equal to a plain offset: the
+# first number above OFFSET_SHIFT and the second below.
+OFFSET_PAIR = 1 << 62
+OFFSET_SHIFT = 31
+OFFSET_MASK = (1 << OFFSET_SHIFT) - 1
+
+
+def pair_offset(offset_1: int, offset_2: int) -> int:
+    return OFFSET_PAIR | (offset_1 << OFFSET_SHIFT) | offset_2
+
+
+def is_offset_pair(offset: int) -> bool:
+    return offset >= OFFSET_PAIR
+
+
+def offset2str(offset: int) -> str:
+    """The printable form of a token offset."""
+    if offset >= OFFSET_PAIR:
+        return "%d_%d" % ((offset ^ OFFSET_PAIR) >> OFFSET_SHIFT, offset & OFFSET_MASK)
+    return str(offset)
 
 
 def off2int(offset: int, prefer_last=True) -> int:
-    if isinstance(offset, int):
+    if offset < OFFSET_PAIR:
         return offset
     else:
-        assert isinstance(offset, str)
-        offsets = list(map(int, offset.split("_")))
-        if len(offsets) == 1:
-            return offsets[0]
-        else:
-            assert len(offsets) == 2
-            offset_1, offset_2 = offsets
+        offset_1 = (offset ^ OFFSET_PAIR) >> OFFSET_SHIFT
+        offset_2 = offset & OFFSET_MASK
         if offset_1 + 2 == offset_2:
             # This is an instruction with an extended arg.
             # For things that compare against offsets, we generally want the
@@ -40,6 +61,33 @@ def off2int(offset: int, prefer_last=True) -> int:
             return offset_1
 
 
+# The opcode module of the Python we are running under, for tokens
+# made without a scanner's. It is looked up on first use rather than
+# by each such token.
+_std_opc = None
+
+
+def std_opc():
+    global _std_opc
+    if _std_opc is None:
+        try:
+            from xdis.std import _std_api
+        except KeyError as e:
+            print(f"I don't know about Python version {e} yet.")
+            try:
+                version_tuple = tuple(int(i) for i in str(e)[1:-1].split("."))
+            except:
+                pass
+            else:
+                if version_tuple > (3, 9):
+                    print(f"Python versions 3.9 and greater are not supported.")
+                else:
+                    print(f"xdis might need to be informed about version {e}")
+            return None
+        _std_opc = _std_api.opc
+    return _std_opc
+
+
 class Token:
     """
     Class representing a byte-code instruction.
@@ -48,6 +96,23 @@ class Token:
     the contents of one line as output by dis.dis().
     """
 
+    # There is a token for every instruction, so they don't get a
+    # __dict__. "parent", "start" and "finish" are set by the
+    # fragments deparser only.
+    __slots__ = (
+        "kind",
+        "has_arg",
+        "attr",
+        "pattr",
+        "offset",
+        "linestart",
+        "opc",
+        "op",
+        "parent",
+        "start",
+        "finish",
+    )
+
     # FIXME: match Python 3.4's terms:
     #    linestart = starts_line
     #    attr = argval
@@ -73,31 +138,17 @@ class Token:
         self.has_arg = has_arg
         self.attr = attr
         self.pattr = pattr
-        self.offset = f"{offset}_{offset+2}" if has_extended_arg else offset
+        self.offset = pair_offset(offset, offset + 2) if has_extended_arg else offset
         self.linestart = linestart
         if has_arg is False:
             self.attr = None
             self.pattr = None
 
         if opc is None:
-            try:
-                from xdis.std import _std_api
-            except KeyError as e:
-                print(f"I don't know about Python version {e} yet.")
-                try:
-                    version_tuple = tuple(int(i) for i in str(e)[1:-1].split("."))
-                except:
-                    pass
-                else:
-                    if version_tuple > (3, 9):
-                        print(f"Python versions 3.9 and greater are not supported.")
-                    else:
-                        print(f"xdis might need to be informed about version {e}")
+            opc = std_opc()
+            if opc is None:
                 return
-
-            self.opc = _std_api.opc
-        else:
-            self.opc = opc
+        self.opc = opc
         if op is None:
             self.op = self.opc.opmap.get(self.kind, None)
         else:
@@ -143,7 +194,7 @@ class Token:
                 if self.linestart
                 else (" " * (9 + len(line_prefix)))
             )
-        offset_opname = "%8s  %-17s" % (self.offset, self.kind)
+        offset_opname = "%8s  %-17s" % (offset2str(self.offset), self.kind)
 
         if not self.has_arg:
             return "%s%s" % (prefix, offset_opname)
@@ -205,10 +256,118 @@ class Token:
     def off2int(self, prefer_last=True) -> int:
         """
         Return an offset for this token. Note that the
-        token type can sometimes be a string when the token
+        token offset can be a pair when the token
         encompasses one or more EXTENDED_ARG instructions.
         """
         return off2int(self.offset, prefer_last)
 
 
+def token_column(name: str):
+    """A TokenView attribute kept in the TokenList column *name*."""
+
+    def get(self):
+        return getattr(self.tokens, name)[self.index]
+
+    def set(self, value):
+        getattr(self.tokens, name)[self.index] = value
+
+    return property(get, set)
+
+
+class TokenView(Token):
+    """
+    The token at *index* in a TokenList. Its attributes are read from
+    and written to the list, so a view is just the two slots below and
+    any number can be made for the same token.
+    """
+
+    __slots__ = ("tokens", "index")
+
+    def __init__(self, tokens, index: int):
+        self.tokens = tokens
+        self.index = index
+
+    kind = token_column("kinds")
+    has_arg = token_column("has_args")
+    attr = token_column("attrs")
+    pattr = token_column("pattrs")
+    offset = token_column("offsets")
+    linestart = token_column("linestarts")
+    op = token_column("ops")
+
+    @property
+    def opc(self):
+        return self.tokens.opc
+
+
+class TokenList:
+    """
+    A list of tokens kept as parallel arrays of their attributes rather
+    than as Token objects. Indexing it gives a TokenView of the token
+    there; appending a Token copies its attributes in.
+
+    The tokens of a code object share its scanner's opcode module.
+    """
+
+    __slots__ = (
+        "opc",
+        "kinds",
+        "has_args",
+        "attrs",
+        "pattrs",
+        "offsets",
+        "linestarts",
+        "ops",
+    )
+
+    def __init__(self, opc, tokens=()):
+        self.opc = opc
+        self.kinds = []
+        self.has_args = []
+        self.attrs = []
+        self.pattrs = []
+        self.offsets = array("q")
+        self.linestarts = []
+        self.ops = []
+        for token in tokens:
+            self.append(token)
+
+    def append(self, token: Token) -> None:
+        self.kinds.append(token.kind)
+        self.has_args.append(token.has_arg)
+        self.attrs.append(token.attr)
+        self.pattrs.append(token.pattr)
+        self.offsets.append(token.offset)
+        self.linestarts.append(token.linestart)
+        self.ops.append(token.op)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [TokenView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("token index out of range")
+        return TokenView(self, i)
+
+    def __delitem__(self, i: int) -> None:
+        for column in (
+            self.kinds,
+            self.has_args,
+            self.attrs,
+            self.pattrs,
+            self.offsets,
+            self.linestarts,
+            self.ops,
+        ):
+            del column[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield TokenView(self, i)
+
+
 NoneToken = Token("LOAD_CONST", offset=-1, attr=None, pattr=None)
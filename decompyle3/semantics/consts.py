@@ -245,7 +245,8 @@ TABLE_DIRECT = {
     # which we don't use here.
     "aug_assign1": ("%|%c %c %c\n", 0, 2, 1),
     "aug_assign2": ("%|%c.%[2]{pattr} %c %c\n", 0, -3, -4),
-    "designList": ("%c = %c", 0, -1),
+    "designList": ("%C", (0, maxint, " = ")),
+    "designLists": ("%C", (0, -1, " = ")),
     "and": (
         "%c and %c",
         (0, ("and_parts", "expr", "expr_pjif", "expr_jifop_cfs", "not")),
@@ -68,6 +68,7 @@ import re
 import decompyle3.parsers.main as python_parser
 from decompyle3.semantics import pysource
 from decompyle3.scanner import Token, Code, get_scanner
+from decompyle3.scanners.tok import is_offset_pair, offset2str
 from decompyle3.semantics.check_ast import checker
 
 from decompyle3.show import maybe_show_asm, maybe_show_tree
@@ -87,6 +88,7 @@ from decompyle3.semantics.consts import (
 )
 
 from decompyle3.semantics.customize import customize_for_version
+from decompyle3.semantics.helper import NodeNamespace
 from decompyle3.semantics.make_function36 import make_function36
 
 from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
@@ -194,6 +196,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
         self.p.insts = scanner.insts
         self.p.opc = scanner.opc
         self.p.offset2inst_index = scanner.offset2inst_index
+        self.p.cfg = scanner.cfg
 
         # FIXME: is there a better way?
         global MAP_DIRECT_FRAGMENT
@@ -1149,15 +1152,18 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     t.kind = "RETURN_END_IF_LAMBDA"
                 elif t.kind == "RETURN_VALUE":
                     t.kind = "RETURN_VALUE_LAMBDA"
-            tokens.append(Token("LAMBDA_MARKER"))
+            tokens.append(Token("LAMBDA_MARKER", opc=self.scanner.opc))
             try:
                 # FIXME: have p.insts update in a better way
                 # modularity is broken here
                 p_insts = self.p.insts
                 self.p.insts = self.scanner.insts
                 self.p.offset2inst_index = self.scanner.offset2inst_index
+                self.p.cfg = self.scanner.cfg
                 self.p.opc = self.scanner.opc
-                ast = python_parser.parse(self.p, tokens, customize, is_lambda)
+                ast = python_parser.parse(
+                    self.p, tokens, customize, is_lambda, budgets=self.budgets
+                )
                 self.p.insts = p_insts
             except (python_parser.ParserError, AssertionError) as e:
                 raise ParserError(e, tokens, self.debug_parser.get("reduce", False))
@@ -1188,9 +1194,9 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     if isTopLevel or tokens[-2].pattr is None:
                         del tokens[-2:]
                     else:
-                        tokens.append(Token("RETURN_LAST"))
+                        tokens.append(Token("RETURN_LAST", opc=self.scanner.opc))
                 else:
-                    tokens.append(Token("RETURN_LAST"))
+                    tokens.append(Token("RETURN_LAST", opc=self.scanner.opc))
         if len(tokens) == 0:
             return PASS
 
@@ -1200,7 +1206,15 @@ class FragmentsWalker(pysource.SourceWalker, object):
             # modularity is broken here
             p_insts = self.p.insts
             self.p.insts = self.scanner.insts
-            ast = python_parser.parse(self.p, tokens, customize, is_lambda=is_lambda)
+            self.p.cfg = self.scanner.cfg
+            ast = python_parser.parse(
+                self.p,
+                tokens,
+                customize,
+                is_lambda=is_lambda,
+                code=code,
+                budgets=self.budgets,
+            )
             self.p.insts = p_insts
         except (python_parser.ParserError, AssertionError) as e:
             raise ParserError(e, tokens, self.debug_parser.get("reduce", False))
@@ -1680,7 +1694,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                     node = node[int(m.group("child"))]
                     node.parent = startnode
             except:
-                print(node.__dict__)
+                print(getattr(node, "__dict__", node))
                 raise
 
             if typ == "%":
@@ -1797,7 +1811,6 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 arg += 1
 
             elif typ == "{":
-                d = node.__dict__
                 expr = m.group("expr")
 
                 # Line mapping stuff
@@ -1810,7 +1823,7 @@ class FragmentsWalker(pysource.SourceWalker, object):
                 # Additional fragment-position stuff
                 try:
                     start = len(self.f.getvalue())
-                    self.write(eval(expr, d, d))
+                    self.write(eval(expr, {}, NodeNamespace(node)))
                     self.set_pos_info(node, start, len(self.f.getvalue()))
                 except:
                     print(node)
@@ -1886,6 +1899,7 @@ def code_deparse(
     compile_mode="exec",
     is_pypy=None,
     walker=FragmentsWalker,
+    budgets=None,
 ):
     """
     Convert the code object co into a python source fragment.
@@ -1902,6 +1916,8 @@ def code_deparse(
                   grammar reduction rules.
        If value is a file-like object, output that object's write method will
        be used rather than sys.stdout
+    :param budgets:         Limits on parsing each code object, see
+                            decompyle3.parsers.main.BUDGETS.
 
     :return: The deparsed source fragment.
     """
@@ -1939,51 +1955,63 @@ def code_deparse(
         compile_mode=compile_mode,
         is_pypy=is_pypy,
     )
+    deparsed.budgets = budgets
 
-    isTopLevel = co.co_name == "<module>"
-    deparsed.ast = deparsed.build_ast(tokens, customize, co, isTopLevel=isTopLevel)
-
-    assert deparsed.ast == "stmts", "Should have parsed grammar start"
-
-    # save memory
-    del tokens
-
-    # convert leading '__doc__ = "..." into doc string
-    assert deparsed.ast == "stmts"
-
-    (deparsed.mod_globs, nonlocals) = pysource.find_globals_and_nonlocals(
-        deparsed.ast, set(), set(), co, version
-    )
-
-    # Just when you think we've forgotten about what we
-    # were supposed to to: Generate source from the Syntax ree!
-    deparsed.gen_source(deparsed.ast, co.co_name, customize)
-
-    deparsed.set_pos_info(deparsed.ast, 0, len(deparsed.text))
-    deparsed.fixup_parents(deparsed.ast, None)
+    try:
+        isTopLevel = co.co_name == "<module>"
+        deparsed.ast = deparsed.build_ast(tokens, customize, co, isTopLevel=isTopLevel)
 
-    for g in sorted(deparsed.mod_globs):
-        deparsed.write("# global %s ## Warning: Unused global\n" % g)
+        assert deparsed.ast == "stmts", "Should have parsed grammar start"
 
-    if deparsed.ast_errors:
-        deparsed.write("# NOTE: have decompilation errors.\n")
-        deparsed.write("# Use -t option to show full context.")
-        for err in deparsed.ast_errors:
-            deparsed.write(err)
-        deparsed.ERROR = True
+        # save memory
+        del tokens
 
-    if deparsed.ERROR:
-        raise deparsed.ERROR
+        # convert leading '__doc__ = "..." into doc string
+        assert deparsed.ast == "stmts"
 
-    # To keep the API consistent with previous releases, convert
-    # deparse.offset values into NodeInfo items
-    for tup, node in deparsed.offsets.items():
-        deparsed.offsets[tup] = NodeInfo(
-            node=node, start=node.start, finish=node.finish
+        (deparsed.mod_globs, nonlocals) = pysource.find_globals_and_nonlocals(
+            deparsed.ast, set(), set(), co, version
         )
 
-    deparsed.scanner = scanner
-    return deparsed
+        # Just when you think we've forgotten about what we
+        # were supposed to to: Generate source from the Syntax ree!
+        deparsed.gen_source(deparsed.ast, co.co_name, customize)
+
+        deparsed.set_pos_info(deparsed.ast, 0, len(deparsed.text))
+        deparsed.fixup_parents(deparsed.ast, None)
+
+        for g in sorted(deparsed.mod_globs):
+            deparsed.write("# global %s ## Warning: Unused global\n" % g)
+
+        if deparsed.ast_errors:
+            deparsed.write("# NOTE: have decompilation errors.\n")
+            deparsed.write("# Use -t option to show full context.")
+            for err in deparsed.ast_errors:
+                deparsed.write(err)
+            deparsed.ERROR = True
+
+        if deparsed.ERROR:
+            raise deparsed.ERROR
+
+        # To keep the API consistent with previous releases, convert
+        # deparse.offset values into NodeInfo items, and paired offsets
+        # back into their "%d_%d" strings.
+        offsets = {}
+        for (name, offset), node in deparsed.offsets.items():
+            if is_offset_pair(offset):
+                offset = offset2str(offset)
+            offsets[name, offset] = NodeInfo(
+                node=node, start=node.start, finish=node.finish
+            )
+        deparsed.offsets = offsets
+
+        deparsed.scanner = scanner
+        return deparsed
+    except BaseException:
+        # The parsers go back to the pool now; a walker that is returned
+        # gives them back when it is done with.
+        deparsed.release_parser()
+        raise
 
 
 from bisect import bisect_right
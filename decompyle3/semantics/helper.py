@@ -134,6 +134,22 @@ def strip_quotes(s: str) -> str:
     return s
 
 
+class NodeNamespace:
+    """The attributes of *node* as a mapping, to evaluate the expression
+    in a "%{...}" template specifier in. Tokens have no __dict__."""
+
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def __getitem__(self, name: str):
+        try:
+            return getattr(self.node, name)
+        except AttributeError:
+            raise KeyError(name)
+
+
 def print_docstring(self, indent, docstring):
     quote = '"""'
     if docstring.find(quote) >= 0:
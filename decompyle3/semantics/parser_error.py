@@ -22,10 +22,32 @@ class ParserError(python_parser.ParserError):
         self.debug = debug
 
     def __str__(self):
+        return self.format(self.debug)
+
+    def format(self, verbose: bool) -> str:
         lines = ["--- This code section failed: ---"]
-        if self.debug:
+        if verbose:
             lines.extend([t.format(token_num=i + 1) for i, t in enumerate(self.tokens)])
         else:
             lines.extend([t.format() for t in self.tokens])
-        lines.extend(["", str(self.error)])
+        if verbose and hasattr(self.error, "verbose"):
+            lines.extend(["", self.error.verbose()])
+        else:
+            lines.extend(["", str(self.error)])
         return "\n".join(lines)
+
+    def verbose(self) -> str:
+        return self.format(True)
+
+    # The diagnostics below are those of the parse error we wrap, if it
+    # has any.
+
+    def format_context(self) -> str:
+        if hasattr(self.error, "format_context"):
+            return self.error.format_context()
+        return ""
+
+    def format_errorstack(self) -> str:
+        if hasattr(self.error, "format_errorstack"):
+            return self.error.format_errorstack()
+        return ""
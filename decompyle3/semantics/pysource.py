@@ -138,7 +138,7 @@ from xdis import COMPILER_FLAG_BIT, iscode
 from xdis.version_info import PYTHON_VERSION_TRIPLE
 
 import decompyle3.parsers.main as python_parser
-from decompyle3.parsers.main import get_python_parser
+from decompyle3.parsers.pool import acquire_parser, release_parser
 from decompyle3.parsers.treenode import SyntaxTree
 from spark_parser import GenericASTTraversal, DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
 from decompyle3.scanner import Code, get_scanner
@@ -147,6 +147,7 @@ from decompyle3.semantics.parser_error import ParserError
 from decompyle3.semantics.check_ast import checker
 from decompyle3.semantics.customize import customize_for_version
 from decompyle3.semantics.helper import (
+    NodeNamespace,
     find_globals_and_nonlocals,
     flatten_list,
 )
@@ -190,6 +191,15 @@ class SourceWalkerError(Exception):
 class SourceWalker(GenericASTTraversal, object):
     stacked_params = ("f", "indent", "is_lambda", "_globals")
 
+    # Module bodies longer than this many tokens are parsed in chunks of
+    # at least chunk_tokens tokens, split between statements.
+    # None parses them whole.
+    chunk_min_tokens = 4000
+    chunk_tokens = 1000
+
+    # Limits on parsing each code object; see python_parser.BUDGETS.
+    budgets = None
+
     def __init__(
         self,
         version,
@@ -230,7 +240,7 @@ class SourceWalker(GenericASTTraversal, object):
         self.scanner = scanner
         params = {"f": out, "indent": ""}
         self.version = version
-        self.p = get_python_parser(
+        self.p = acquire_parser(
             version,
             debug_parser=dict(debug_parser),
             compile_mode=compile_mode,
@@ -240,7 +250,9 @@ class SourceWalker(GenericASTTraversal, object):
         # Initialize p_lambda on demand
         self.p_lambda = None
 
-        self.treeTransform = TreeTransform(version=self.version, show_ast=showast)
+        self.treeTransform = TreeTransform(
+            version=self.version, show_ast=showast, opc=scanner.opc
+        )
         self.debug_parser = dict(debug_parser)
         self.showast = showast
         self.params = params
@@ -258,6 +270,7 @@ class SourceWalker(GenericASTTraversal, object):
         # FIXME: have p.insts update in a better way
         # modularity is broken here
         self.p.insts = scanner.insts
+        self.p.cfg = scanner.cfg
         self.offset2inst_index = scanner.offset2inst_index
 
         # This is in Python 2.6 on. It changes the way
@@ -1900,9 +1913,8 @@ class SourceWalker(GenericASTTraversal, object):
                     self.template_engine((expr, index), node)
                     arg += 1
                 else:
-                    d = node.__dict__
                     try:
-                        self.write(eval(expr, d, d))
+                        self.write(eval(expr, {}, NodeNamespace(node)))
                     except:
                         raise
             m = escape.search(fmt, i)
@@ -2128,19 +2140,23 @@ class SourceWalker(GenericASTTraversal, object):
                     t.kind = "RETURN_END_IF_LAMBDA"
                 elif t.kind == "RETURN_VALUE":
                     t.kind = "RETURN_VALUE_LAMBDA"
-            tokens.append(Token("LAMBDA_MARKER"))
+            tokens.append(Token("LAMBDA_MARKER", opc=self.scanner.opc))
             try:
                 if self.p_lambda is None:
-                    self.p_lambda = get_python_parser(
+                    self.p_lambda = acquire_parser(
                         self.version,
-                        self.debug_parser,
+                        debug_parser=dict(self.debug_parser),
                         compile_mode="lambda",
                         is_pypy=self.is_pypy,
                     )
                 p = self.p_lambda
                 p.insts = self.scanner.insts
                 p.offset2inst_index = self.scanner.offset2inst_index
-                ast = python_parser.parse(p, tokens, customize, is_lambda)
+                p.cfg = self.scanner.cfg
+                p.opc = self.scanner.opc
+                ast = python_parser.parse(
+                    p, tokens, customize, is_lambda, code=code, budgets=self.budgets
+                )
                 self.customize(customize)
             except (python_parser.ParserError, AssertionError) as e:
                 raise ParserError(e, tokens, self.p.debug["reduce"])
@@ -2162,9 +2178,9 @@ class SourceWalker(GenericASTTraversal, object):
                         if isTopLevel or tokens[-2].pattr is None:
                             del tokens[-2:]
                         else:
-                            tokens.append(Token("RETURN_LAST"))
+                            tokens.append(Token("RETURN_LAST", opc=self.scanner.opc))
                     else:
-                        tokens.append(Token("RETURN_LAST"))
+                        tokens.append(Token("RETURN_LAST", opc=self.scanner.opc))
             if len(tokens) == 0:
                 return PASS
 
@@ -2175,8 +2191,24 @@ class SourceWalker(GenericASTTraversal, object):
             p_insts = self.p.insts
             self.p.insts = self.scanner.insts
             self.p.offset2inst_index = self.scanner.offset2inst_index
+            self.p.cfg = self.scanner.cfg
             self.p.opc = self.scanner.opc
-            ast = python_parser.parse(self.p, tokens, customize, is_lambda=is_lambda)
+            chunks = ()
+            if (
+                isTopLevel
+                and self.chunk_min_tokens is not None
+                and len(tokens) > self.chunk_min_tokens
+            ):
+                chunks = self.scanner.statement_chunks(tokens, self.chunk_tokens)
+            ast = python_parser.parse(
+                self.p,
+                tokens,
+                customize,
+                is_lambda=is_lambda,
+                code=code,
+                chunks=chunks,
+                budgets=self.budgets,
+            )
             self.p.insts = p_insts
         except (python_parser.ParserError, AssertionError) as e:
             raise ParserError(e, tokens, self.p.debug["reduce"])
@@ -2191,6 +2223,16 @@ class SourceWalker(GenericASTTraversal, object):
         del ast  # Save memory
         return transform_ast
 
+    def release_parser(self):
+        """Give our parsers back to the parser pool. This walker should
+        not build any more syntax trees after this."""
+        if self.p is not None:
+            release_parser(self.p)
+            self.p = None
+        if self.p_lambda is not None:
+            release_parser(self.p_lambda)
+            self.p_lambda = None
+
     @classmethod
     def _get_mapping(cls, node):
         return MAP.get(node, MAP_DIRECT)
@@ -2205,10 +2247,19 @@ def code_deparse(
     compile_mode="exec",
     is_pypy=IS_PYPY,
     walker=SourceWalker,
+    budgets=None,
 ):
     """
     ingests and deparses a given code block 'co'. If version is None,
     we will use the current Python interpreter version.
+
+    `budgets` limits the work done in parsing each code object; see
+    decompyle3.parsers.main.BUDGETS. ParserBudgetExceeded is raised when
+    a limit is passed.
+
+    The walker returned keeps its parser in `p`. Call its release_parser()
+    when done with it so the parser can be reused; otherwise that happens
+    when the walker is garbage collected.
     """
 
     assert iscode(co)
@@ -2240,52 +2291,60 @@ def code_deparse(
         is_pypy=is_pypy,
         linestarts=linestarts,
     )
+    deparsed.budgets = budgets
 
-    isTopLevel = co.co_name == "<module>"
-    if compile_mode == "eval":
-        deparsed.hide_internal = False
-    deparsed.ast = deparsed.build_ast(tokens, customize, co, isTopLevel=isTopLevel)
+    try:
+        isTopLevel = co.co_name == "<module>"
+        if compile_mode == "eval":
+            deparsed.hide_internal = False
+        deparsed.ast = deparsed.build_ast(tokens, customize, co, isTopLevel=isTopLevel)
 
-    #### XXX workaround for profiling
-    if deparsed.ast is None:
-        return None
+        #### XXX workaround for profiling
+        if deparsed.ast is None:
+            return None
 
-    if compile_mode != "eval":
-        assert deparsed.ast == "stmts", "Should have parsed grammar start"
-    else:
-        assert deparsed.ast == "eval_expr", "Should have parsed grammar start"
+        if compile_mode != "eval":
+            assert deparsed.ast == "stmts", "Should have parsed grammar start"
+        else:
+            assert deparsed.ast == "eval_expr", "Should have parsed grammar start"
 
-    # save memory
-    del tokens
+        # save memory
+        del tokens
 
-    deparsed.mod_globs, nonlocals = find_globals_and_nonlocals(
-        deparsed.ast, set(), set(), co, version
-    )
+        deparsed.mod_globs, nonlocals = find_globals_and_nonlocals(
+            deparsed.ast, set(), set(), co, version
+        )
 
-    assert not nonlocals
+        assert not nonlocals
 
-    deparsed.FUTURE_UNICODE_LITERALS = (
-        COMPILER_FLAG_BIT["FUTURE_UNICODE_LITERALS"] & co.co_flags != 0
-    )
+        deparsed.FUTURE_UNICODE_LITERALS = (
+            COMPILER_FLAG_BIT["FUTURE_UNICODE_LITERALS"] & co.co_flags != 0
+        )
 
-    # What we've been waiting for: Generate source from Syntax Tree!
-    deparsed.gen_source(
-        deparsed.ast, name=co.co_name, customize=customize, debug_opts=debug_opts
-    )
+        # What we've been waiting for: Generate source from Syntax Tree!
+        deparsed.gen_source(
+            deparsed.ast, name=co.co_name, customize=customize, debug_opts=debug_opts
+        )
 
-    for g in sorted(deparsed.mod_globs):
-        deparsed.write("# global %s ## Warning: Unused global\n" % g)
+        for g in sorted(deparsed.mod_globs):
+            deparsed.write("# global %s ## Warning: Unused global\n" % g)
 
-    if deparsed.ast_errors:
-        deparsed.write("# NOTE: have internal decompilation grammar errors.\n")
-        deparsed.write("# Use -t option to show full context.")
-        for err in deparsed.ast_errors:
-            deparsed.write(err)
-        raise SourceWalkerError("Deparsing hit an internal grammar-rule bug")
+        if deparsed.ast_errors:
+            deparsed.write("# NOTE: have internal decompilation grammar errors.\n")
+            deparsed.write("# Use -t option to show full context.")
+            for err in deparsed.ast_errors:
+                deparsed.write(err)
+            raise SourceWalkerError("Deparsing hit an internal grammar-rule bug")
 
-    if deparsed.ERROR:
-        raise SourceWalkerError("Deparsing stopped due to parse error")
-    return deparsed
+        if deparsed.ERROR:
+            raise SourceWalkerError("Deparsing stopped due to parse error")
+        return deparsed
+    except BaseException:
+        # The rules added for this code are rolled back, and the parser
+        # is made available to decompile the next file. A walker that
+        # is returned keeps its parser until it is done with.
+        deparsed.release_parser()
+        raise
 
 
 def deparse_code2str(
@@ -2301,7 +2360,7 @@ def deparse_code2str(
     """Return the deparsed text for a Python code object. `out` is where any intermediate
     output for assembly or tree output will be sent.
     """
-    return code_deparse(
+    deparsed = code_deparse(
         code,
         out,
         version,
@@ -2310,7 +2369,9 @@ def deparse_code2str(
         compile_mode=compile_mode,
         is_pypy=is_pypy,
         walker=walker,
-    ).text
+    )
+    deparsed.release_parser()
+    return deparsed.text
 
 
 if __name__ == "__main__":
@@ -43,9 +43,11 @@ def is_not_docstring(call_stmt_node) -> bool:
 
 
 class TreeTransform(GenericASTTraversal, object):
-    def __init__(self, version, show_ast=None):
+    def __init__(self, version, show_ast=None, opc=None):
         self.showast = show_ast
         self.version = version
+        # The scanner's opcode module, for the tokens we make.
+        self.opc = opc
         return
 
     def maybe_show_tree(self, ast):
@@ -103,7 +105,14 @@ class TreeTransform(GenericASTTraversal, object):
         ):
             docstring_node = SyntaxTree(
                 "docstring",
-                [Token("LOAD_STR", has_arg=True, pattr=code.co_consts[0])],
+                [
+                    Token(
+                        "LOAD_STR",
+                        has_arg=True,
+                        pattr=code.co_consts[0],
+                        opc=self.opc,
+                    )
+                ],
                 transformed_by="n_mkfunc",
             )
             node = SyntaxTree(
@@ -463,6 +472,7 @@ class TreeTransform(GenericASTTraversal, object):
                                 offset=0,
                                 attr=load_const.attr,
                                 pattr=load_const.pattr,
+                                opc=self.opc,
                             )
                         ],
                         transformed_by="transform",
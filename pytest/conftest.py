@@ -0,0 +1,43 @@
+import pytest
+
+from decompyle3.parsers import (
+    ambiguity_profile,
+    chart_profile,
+    grammar_coverage,
+    reduce_profile,
+    rule_profile,
+)
+
+PROFILES = (
+    reduce_profile.profile,
+    rule_profile.profile,
+    ambiguity_profile.profile,
+    chart_profile.profile,
+    grammar_coverage.profile,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_profiles():
+    # Start and end each test with nothing recorded and profiling off.
+    for profile in PROFILES:
+        profile.disable()
+    yield
+    for profile in PROFILES:
+        profile.disable()
+
+
+@pytest.fixture
+def record_profile():
+    """Return a function that calls fn() with *profile* turned on, and
+    returns what it recorded."""
+
+    def record(profile, fn) -> dict:
+        profile.enable()
+        try:
+            fn()
+            return profile.snapshot()
+        finally:
+            profile.disable()
+
+    return record
@@ -0,0 +1,39 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from spark_parser import GenericASTBuilder
+from decompyle3 import code_deparse
+from decompyle3.parsers import ambiguity_profile
+from decompyle3.parsers.main import PythonLambdaParser
+
+SOURCE = """
+def f(a, b):
+    if a and b or not a:
+        b = [y + 1 for y in a if y]
+    elif a < b <= a:
+        b = None
+    return {k: v for k, v in b.items()}
+"""
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_ambiguity(monkeypatch, record_profile) -> None:
+    ambiguity = PythonLambdaParser.ambiguity
+    calls = []
+
+    def check(self, rules):
+        rule = ambiguity(self, rules)
+        assert rule is GenericASTBuilder.ambiguity(self, rules)
+        calls.append(rule)
+        return rule
+
+    monkeypatch.setattr(PythonLambdaParser, "ambiguity", check)
+    data = record_profile(
+        ambiguity_profile.profile,
+        lambda: code_deparse(compile(SOURCE, "<test>", "exec"), out=StringIO()),
+    )
+    assert calls
+    assert sum(ambiguities for _, ambiguities in data.values()) == len(calls)
+    assert any(name.endswith(" f") for name in data)
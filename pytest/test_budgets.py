@@ -0,0 +1,82 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3 import code_deparse
+from decompyle3.main import main
+from decompyle3.parsers.main import BUDGETS, ParserBudgetExceeded
+from decompyle3.semantics.pysource import SourceWalker
+
+SOURCE = """
+def f(a, b):
+    for x in a:
+        if x and b:
+            return [y + 1 for y in x]
+    return {k: v for k, v in b.items()}
+"""
+
+
+def deparse(budgets=None, source=SOURCE) -> str:
+    out = StringIO()
+    code_deparse(compile(source, "<test>", "exec"), out=out, budgets=budgets)
+    return out.getvalue()
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_budgets() -> None:
+    source = deparse()
+    assert deparse({"items": 10 ** 6, "nodes": 10 ** 6, "seconds": 60}) == source
+    for budget in ("items", "reductions", "nodes"):
+        with pytest.raises(ParserBudgetExceeded) as e:
+            deparse({budget: 20})
+        assert e.value.budget == budget
+        assert BUDGETS[budget] in str(e.value)
+    # The parser pool hands out parsers that are still usable.
+    assert deparse() == source
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_budgets_per_chunk(monkeypatch) -> None:
+    # A chunk can't start where a jump lands, so the loop is followed by
+    # a statement of its own.
+    statement = "for x in a:\n    if x and b:\n        f(x)\ny = x\n"
+
+    def parses(items: int, source: str) -> bool:
+        try:
+            deparse({"items": items}, source)
+        except ParserBudgetExceeded:
+            return False
+        return True
+
+    # The fewest Earley items the statement parses in.
+    low, high = 1, 10 ** 5
+    while low < high:
+        middle = (low + high) // 2
+        if parses(middle, statement):
+            high = middle
+        else:
+            low = middle + 1
+
+    # Split a statement at a time, each chunk is parsed on the full budget.
+    assert not parses(low, statement * 4)
+    monkeypatch.setattr(SourceWalker, "chunk_min_tokens", 1)
+    monkeypatch.setattr(SourceWalker, "chunk_tokens", 1)
+    assert parses(low, statement * 4)
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_main_over_budget(tmp_path) -> None:
+    source_path = tmp_path / "f.py"
+    source_path.write_text(SOURCE)
+    counts = main(str(tmp_path), str(tmp_path), [], [str(source_path)])
+    assert counts == (1, 1, 0, 0) and counts.over_budget == 0
+    # Files that go over budget are counted apart from failed ones.
+    counts = main(
+        str(tmp_path), str(tmp_path), [], [str(source_path)], budgets={"items": 20}
+    )
+    assert counts == (1, 0, 0, 0) and counts.over_budget == 1
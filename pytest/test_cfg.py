@@ -0,0 +1,50 @@
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3.scanner import get_scanner
+
+
+def sample(a, b):
+    for x in a:
+        if x and b:
+            while b:
+                b -= 1
+                if b == 3:
+                    break
+            continue
+        try:
+            a = b[x]
+        except KeyError:
+            return None
+    return a or b
+
+
+def test_cfg() -> None:
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+    scanner.ingest(sample.__code__)
+    cfg = scanner.cfg
+    insts = scanner.insts
+    n = len(insts)
+    jumps = [(inst.offset, inst.argval) for inst in insts if inst.is_jump()]
+
+    # Queries answer what walking the instructions would.
+    for first in range(n):
+        for last in range(first, n + 1):
+            targets = [inst.argval for inst in insts[first:last] if inst.is_jump()]
+            assert cfg.max_jump_target(first, last) == max(targets, default=-1)
+    offsets = [inst.offset for inst in insts]
+    for target in set(argval for _, argval in jumps):
+        for start in offsets:
+            for end in offsets:
+                assert cfg.has_jump_to(target, start, end) == any(
+                    start <= offset < end and argval == target
+                    for offset, argval in jumps
+                )
+
+    # Opcode lookups find the first instruction with the opcode.
+    for opcode in set(inst.opcode for inst in insts):
+        for first in range(n):
+            for last in range(first, n + 1):
+                found = [i for i in range(first, last) if insts[i].opcode == opcode]
+                assert cfg.first_op(opcode, first, last) == (
+                    found[0] if found else None
+                )
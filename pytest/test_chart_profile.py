@@ -0,0 +1,85 @@
+import os.path as osp
+from glob import glob
+from io import StringIO
+
+import pytest
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3 import code_deparse
+from decompyle3.main import decompile_file
+from decompyle3.parsers import chart_profile
+from decompyle3.parsers.main import PythonLambdaParser
+from decompyle3.parsers.p38.base import Python38Parser
+from decompyle3.parsers.pool import parser_pool
+
+BYTECODE_37 = osp.join(osp.dirname(__file__), "..", "test", "bytecode_3.7")
+
+# Earley items over all of BYTECODE_37, with the grammar pruned for each
+# code object, as measured with spark-parser 1.8.9 and xdis 6.0.5. Other
+# versions in the range __pkginfo__ allows can scan or expand rules a
+# little differently, so the test leaves some slack. Grammar changes that
+# add items there should come with a reason to; ones that take items
+# away can lower this.
+ITEMS_37 = 144203
+ITEMS_SLACK = 1.02
+
+
+def test_items(monkeypatch, record_profile) -> None:
+    monkeypatch.setattr(PythonLambdaParser, "prune_grammar", True)
+
+    def decompile_all():
+        for path in sorted(glob(osp.join(BYTECODE_37, "*.pyc"))):
+            decompile_file(path, StringIO())
+
+    data = record_profile(chart_profile.profile, decompile_all)
+    assert any(name.endswith(" <module>") for name in data)
+    for parses, positions, items, peak in data.values():
+        assert parses and positions <= items and peak <= items
+    assert chart_profile.total_items(data) <= ITEMS_37 * ITEMS_SLACK
+
+
+def test_chained_assignment(monkeypatch, record_profile) -> None:
+    # Make the Earley parser do the assignments.
+    monkeypatch.setattr(PythonLambdaParser, "build_expressions", False)
+    monkeypatch.setattr(PythonLambdaParser, "straight_line_fast_path", False)
+    monkeypatch.setattr(PythonLambdaParser, "prune_grammar", True)
+    if PYTHON_VERSION_TRIPLE >= (3, 8):
+        # 3.8's "named_expr ::= expr DUP_TOP store" also reads the
+        # assignments as nested walrus ops, each adding items for all the
+        # targets after it. Leave it out to see what the rest of the
+        # grammar does.
+        checkpoint = Python38Parser.checkpoint
+
+        def checkpoint_without_walrus(self):
+            self.remove_rules(
+                """
+                expr       ::= named_expr
+                named_expr ::= expr DUP_TOP store
+                """
+            )
+            checkpoint(self)
+
+        monkeypatch.setattr(Python38Parser, "checkpoint", checkpoint_without_walrus)
+    parser_pool.clear()
+
+    def items(n: int) -> int:
+        source = " = ".join("a%d" % i for i in range(n)) + " = x"
+        out = StringIO()
+        data = record_profile(
+            chart_profile.profile,
+            lambda: code_deparse(compile(source, "<test>", "exec"), out=out),
+        )
+        assert source in out.getvalue()
+        return chart_profile.total_items(data)
+
+    # Going from 100 to 200 targets adds twice the items going from 50 to
+    # 100 did when each target adds the same few, and four times when
+    # they grow with the number of targets, as right-recursive designList
+    # rules made them.
+    try:
+        small, medium, large = items(50), items(100), items(200)
+    finally:
+        parser_pool.clear()
+    growth = (large - medium) / (medium - small)
+    assert growth <= 2.1
+    assert large - medium <= 8 * 100
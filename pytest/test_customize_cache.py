@@ -0,0 +1,105 @@
+import pytest
+from xdis import iscode
+
+from decompyle3 import PYTHON_VERSION_TRIPLE, IS_PYPY
+from decompyle3.parsers import customize_cache
+from decompyle3.parsers.main import get_python_parser, nop_func
+from decompyle3.scanner import get_scanner
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+SOURCE = """
+class C(B, metaclass=M):
+    x: int = 1
+    def m(self, a, *args, b=1, **kw):
+        return f(a, *args, b=b, **kw)
+    def n(self, a, *args, b=1, **kw):
+        return g(a, *args, b=b, **kw)
+
+def f(a):
+    return [x for x in a if x], {x: 1 for x in a}, {1, 2}, lambda y: y + a
+
+def g(a):
+    return [y for y in a if y], {y: 2 for y in a}, {3, 4}, lambda z: z + a
+
+def h(a):
+    with open(a) as fp:
+        return (a, fp), [*a], a[1:2], f"{a!r:>{a}}"
+"""
+
+
+def code_objects(co):
+    yield co
+    for c in co.co_consts:
+        if iscode(c):
+            yield from code_objects(c)
+
+
+def customized(p, tokens, customize):
+    return (
+        {lhs: list(rules) for lhs, rules in p.rules.items()},
+        set(p.new_rules),
+        dict(customize),
+        [t.kind for t in tokens],
+        dict(p.check_reduce),
+        dict(p.reduce_check_table),
+        p.memoized_reduce_checks,
+    )
+
+
+def test_customize_cache():
+    customize_cache.clear()
+    scanner = get_scanner(version_tuple, IS_PYPY)
+    co = compile(SOURCE, "<test>", "exec")
+    for i in range(2):
+        # Customizing each code object from scratch and through the cache
+        # must give the same grammar, both when one parser handles a
+        # sequence of code objects and on a new parser.
+        expect = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+        got = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+        compiled = []
+        compile_reduce_checks = got.compile_reduce_checks
+
+        def counted_compile_reduce_checks():
+            compiled.append(True)
+            compile_reduce_checks()
+
+        got.compile_reduce_checks = counted_compile_reduce_checks
+        for code in code_objects(co):
+            tokens, customize = scanner.ingest(code)
+            expect.customize_grammar_rules(tokens, customize)
+            expect.compile_reduce_checks()
+            want = customized(expect, tokens, customize)
+            tokens, customize = scanner.ingest(code)
+            customize_cache.customize_grammar_rules(got, tokens, customize)
+            assert customized(got, tokens, customize) == want
+
+        # Replayed customizations come with their checks compiled.
+        assert len(compiled) == (0 if i else customize_cache.stats["misses"])
+
+    # f() and g(), and m() and n(), have the same signature, and the
+    # second pass over the code objects should find all of them.
+    n = len(list(code_objects(co)))
+    assert customize_cache.stats["misses"] < n
+    assert customize_cache.stats["hits"] > n
+    customize_cache.clear()
+
+
+def test_record_failure():
+    # A customization that fails part way leaves the parser logging
+    # nothing, and its methods as they were.
+    p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+
+    def customize_grammar_rules(tokens, customize):
+        p.addRule("expr ::= LOAD_CONST", nop_func)
+        raise RuntimeError
+
+    p.customize_grammar_rules = customize_grammar_rules
+    with pytest.raises(RuntimeError):
+        customize_cache.record(p, [], [], {})
+    assert p.customize_log is None
+    assert "addRule" not in p.__dict__
@@ -0,0 +1,62 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3 import code_deparse
+from decompyle3.parsers import expr_builder
+from decompyle3.parsers.main import PythonLambdaParser
+
+SOURCE = """
+def f(a, b):
+    while a.x < len(b):
+        if b[a.x] == f"{a!r}:" and g(a, c=b):
+            a.x += h(b[1:2], {"k": a}, (a, b))
+        elif not a.y(b):
+            return [x + 1 for x in b]
+    return -a.y ** 2
+"""
+
+
+def deparse(build_expressions: bool, source: str = SOURCE) -> str:
+    PythonLambdaParser.build_expressions = build_expressions
+    try:
+        out = StringIO()
+        code_deparse(compile(source, "<test>", "exec"), out=out)
+    finally:
+        PythonLambdaParser.build_expressions = True
+    return out.getvalue()
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_expr_builder() -> None:
+    expr_builder.clear()
+    source = deparse(True)
+    assert expr_builder.stats["reduced"] < expr_builder.stats["tokens"]
+    assert source == deparse(False)
+    # 3.8 writes the loop as "while True:" with an "if"; the expressions
+    # come out the same on both.
+    for expr in ("a.x < len(b)", 'f"{a!r}:"', "{'k': a}", "-a.y ** 2"):
+        assert expr in source
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_huge_literals() -> None:
+    # Long lists are grouped by 1024 and 32 items in the grammar. The
+    # "if" keeps these off the straight-line fast path.
+    items = ", ".join("a%d" % i if i % 3 else str(i) for i in range(1100))
+    pairs = ", ".join("'k%d': %d" % (i, i) for i in range(300))
+    names = ", ".join("k%d: v%d" % (i, i) for i in range(260))
+    for literal, last in (
+        ("[%s]" % items, "a1099"),
+        ("{%s}" % pairs, "'k299'"),
+        ("{%s}" % names, "v259"),
+    ):
+        source = "if a:\n    x = %s\n" % literal
+        expr_builder.clear()
+        text = deparse(True, source)
+        assert expr_builder.stats["reduced"] < 10
+        assert text == deparse(False, source)
+        assert last in text
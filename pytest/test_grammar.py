@@ -29,7 +29,7 @@ def test_grammar():
     # We have custom rules that create the below
     unused_rhs = set(["mkfunc"])
 
-    expect_right_recursive = set([("designList", ("store", "DUP_TOP", "designList"))])
+    expect_right_recursive = set()
 
     expect_lhs.add("load_genexpr")
     expect_lhs.add("kv3")
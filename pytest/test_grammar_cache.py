@@ -0,0 +1,79 @@
+import os.path as osp
+
+from decompyle3 import PYTHON_VERSION_TRIPLE, IS_PYPY
+from decompyle3.parsers import grammar_cache
+from decompyle3.parsers.main import get_python_parser
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+
+def grammar_tables(p):
+    return (
+        p.rules,
+        p.rule2name,
+        set(p.rule2func.keys()),
+        p.optional_nt,
+        p.list_like_nt,
+        p.nullable,
+        p.newrules,
+        p.new2old,
+    )
+
+
+def test_grammar_cache(tmp_path, monkeypatch):
+    # A grammar built from the docstrings without any caching.
+    monkeypatch.setattr(grammar_cache, "cacheable", lambda parser: False)
+    expect = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    expect.computeNull()
+    expect.newrules = {}
+    expect.new2old = {}
+    expect.makeNewRules()
+    monkeypatch.undo()
+
+    monkeypatch.setenv("DECOMPYLE3_GRAMMAR_CACHE", str(tmp_path))
+    grammar_cache._entries.clear()
+
+    # The first parser saves its grammar...
+    p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    key = grammar_cache.grammar_key(p)
+    assert osp.exists(osp.join(str(tmp_path), key + ".pickle"))
+    assert grammar_tables(p) == grammar_tables(expect)
+
+    # ... the next one in this process gets it from memory, and the next
+    # process reads it from disk.
+    for clear in (False, True):
+        if clear:
+            grammar_cache._entries.clear()
+        p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+        assert not p.ruleschanged
+        assert grammar_tables(p) == grammar_tables(expect)
+
+    # Customizing one parser must not change the grammar of another.
+    p.addRule("expr ::= LOAD_FOO", p.rule2func[p.rules["expr"][0]])
+    p2 = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    assert ("expr", ("LOAD_FOO",)) not in p2.rules["expr"]
+    grammar_cache._entries.clear()
+
+
+def test_grammar_cache_versions(tmp_path, monkeypatch):
+    monkeypatch.setenv("DECOMPYLE3_GRAMMAR_CACHE", str(tmp_path))
+    grammar_cache._entries.clear()
+    key = grammar_cache.grammar_key(get_python_parser(version_tuple, is_pypy=IS_PYPY))
+    assert grammar_cache.read_entry(key) is not None
+
+    # A file written by other versions is not unpickled.
+    path = grammar_cache.cache_path(key)
+    with open(path, "rb") as fp:
+        fp.readline()
+        pickled = fp.read()
+    with open(path, "wb") as fp:
+        fp.write(b"decompyle3 grammar cache 2 0.0 0.0 0.0\n" + pickled)
+    loads = []
+    monkeypatch.setattr(grammar_cache.pickle, "load", loads.append)
+    assert grammar_cache.read_entry(key) is None
+    assert not loads
+    grammar_cache._entries.clear()
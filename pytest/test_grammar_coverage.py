@@ -0,0 +1,37 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3 import code_deparse
+from decompyle3.parsers import grammar_coverage
+
+SOURCE = """
+def f(a, b):
+    for x in a:
+        if x and b:
+            return [y + 1 for y in x]
+    return {k: v for k, v in b.items()}
+"""
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_grammar_coverage(tmp_path, record_profile) -> None:
+    data = record_profile(
+        grammar_coverage.profile,
+        lambda: code_deparse(compile(SOURCE, "<test>", "exec"), out=StringIO()),
+    )
+    name = "Python%d%dParser" % PYTHON_VERSION_TRIPLE[:2]
+    counts = data[name]
+    assert counts[("expr", ("LOAD_FAST",))] > 0
+    assert 0 in counts.values()
+
+    assert grammar_coverage.parse_report(grammar_coverage.format_report(data)) == data
+
+    # Reports written to the same file add up.
+    grammar_coverage.profile.merge(data)
+    path = str(tmp_path / "coverage.txt")
+    grammar_coverage.update(path)
+    grammar_coverage.update(path)
+    doubled = grammar_coverage.read(path)[name]
+    assert all(doubled[rule] == 2 * count for rule, count in counts.items())
@@ -0,0 +1,96 @@
+import re
+from io import StringIO
+
+import pytest
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3.parsers import customize_cache, expr_builder
+from decompyle3.parsers.main import ParserError, get_python_parser, parse
+from decompyle3.scanner import get_scanner
+from decompyle3.semantics.pysource import SourceWalker, SourceWalkerError, code_deparse
+from spark_parser import DEFAULT_DEBUG as PARSER_DEFAULT_DEBUG
+
+SOURCE = """
+def f(a, b):
+    x = a + b
+    if x:
+        return g(x, b)
+    return a
+"""
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_parser_error(capsys) -> None:
+    code = compile(SOURCE, "<test>", "exec").co_consts[0]
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE[:2])
+    tokens, customize = scanner.ingest(code)
+    debug = dict(PARSER_DEFAULT_DEBUG, errorstack="full")
+    p = get_python_parser(PYTHON_VERSION_TRIPLE[:2], debug)
+    with pytest.raises(ParserError) as e:
+        parse(p, tokens[: len(tokens) // 2], customize, is_lambda=False, code=code)
+
+    # Nothing is shown until asked for.
+    assert capsys.readouterr().out == ""
+    err = e.value
+    assert str(err).startswith("Parse error at or near")
+    context = err.format_context()
+    assert context.startswith("Instruction context:")
+    assert "-> " in context
+    assert "-- Stacks of completed symbols:" in err.format_errorstack()
+    assert str(err).endswith(context)
+    assert err.verbose() == str(err) + err.format_errorstack()
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_reduce_check_error(capsys) -> None:
+    code = compile(SOURCE, "<test>", "exec").co_consts[0]
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE[:2])
+    tokens, customize = scanner.ingest(code)
+    p = get_python_parser(PYTHON_VERSION_TRIPLE[:2])
+    customize_cache.customize_grammar_rules(p, tokens, customize)
+    tokens, _ = expr_builder.reduce_expressions(p, tokens, ())
+    # "a + b" is built before parsing; a reduce check that fails on it
+    # is reported at the instruction it starts with.
+    assert tokens[0].kind in expr_builder.PRE_REDUCED_KINDS
+
+    def check(self, lhs, n, rule, ast, tokens, first, last):
+        raise KeyError(lhs)
+
+    p.reduce_check_table = dict(p.reduce_check_table, assign=check)
+    with pytest.raises(ParserError) as e:
+        p.run_reduce_check(("assign", ("expr", "store")), None, tokens, 0, 0)
+    capsys.readouterr()
+    assert e.value.token.kind == "LOAD_FAST" and e.value.token.attr == "a"
+    assert e.value.offset == 0
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_nested_parser_error(monkeypatch) -> None:
+    build_ast = SourceWalker.build_ast
+
+    def truncated_build_ast(self, tokens, customize, code, *args, **kwargs):
+        # Cut the body of f short so that its parse fails.
+        if code.co_name == "f":
+            tokens = tokens[: len(tokens) // 2]
+        return build_ast(self, tokens, customize, code, *args, **kwargs)
+
+    monkeypatch.setattr(SourceWalker, "build_ast", truncated_build_ast)
+    out = StringIO()
+    with pytest.raises(SourceWalkerError):
+        code_deparse(compile(SOURCE, "<test>", "exec"), out=out)
+    lines = out.getvalue().splitlines()
+    header = [line for line in lines if line.startswith("Parse error at or near")]
+    assert len(header) == 1
+    assert "Instruction context:" in lines
+    # The arrow is at the instruction the error names.
+    arrow = [line[3:] for line in lines if line.startswith("-> ")]
+    assert len(arrow) == 1
+    kind, offset = re.match(
+        r"Parse error at or near `(\w+)' instruction at offset (\d+)", header[0]
+    ).groups()
+    assert arrow[0].split()[:2] == [offset, kind]
@@ -0,0 +1,182 @@
+import os.path as osp
+from glob import glob
+from io import StringIO
+
+from decompyle3 import PYTHON_VERSION_TRIPLE, IS_PYPY
+from decompyle3.main import decompile_file
+from decompyle3.parsers.main import PythonLambdaParser, get_python_parser
+from decompyle3.parsers.pool import ParserPool, parser_pool
+from decompyle3.scanner import get_scanner
+from decompyle3.semantics.pysource import code_deparse
+import decompyle3.parsers.main as python_parser
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+SOURCES = (
+    "x = [a for a in range(10) if a]\n",
+    "def f(a, *args, b=1, **kw):\n    return g(a, *args, b=b, **kw)\n",
+    "class C(B, metaclass=M):\n    def m(self):\n        return {1: 2, 'a': self}\n",
+    "for a in b:\n    try:\n        y = f(a)\n    except E as e:\n        y = e\n",
+)
+
+
+def grammar(p):
+    return (
+        {lhs: list(rules) for lhs, rules in p.rules.items()},
+        set(p.rule2func.keys()),
+        dict(p.rule2name),
+        dict(p.check_reduce),
+    )
+
+
+def deparse(source):
+    code = compile(source, "<test>", "exec")
+    out = StringIO()
+    code_deparse(
+        code, out=out, version=version_tuple, is_pypy=IS_PYPY
+    ).release_parser()
+    return out.getvalue()
+
+
+def parse(p, source):
+    scanner = get_scanner(version_tuple, IS_PYPY)
+    tokens, customize = scanner.ingest(compile(source, "<test>", "exec"))
+    p.insts = scanner.insts
+    p.offset2inst_index = scanner.offset2inst_index
+    p.cfg = scanner.cfg
+    p.opc = scanner.opc
+    return python_parser.parse(p, tokens, customize, is_lambda=False)
+
+
+def test_rollback():
+    pool = ParserPool()
+    p = pool.acquire(version_tuple, is_pypy=IS_PYPY)
+    start = grammar(p)
+    for source in SOURCES:
+        tokens, customize = get_scanner(version_tuple, IS_PYPY).ingest(
+            compile(source, "<test>", "exec")
+        )
+        p.customize_grammar_rules(tokens, customize)
+        assert grammar(p) != start
+        pool.release(p)
+        assert grammar(p) == start
+        assert pool.acquire(version_tuple, is_pypy=IS_PYPY) is p
+
+
+def test_overlay():
+    # A checkpointed parser drops the rules added for one code object
+    # when it goes on to parse code that isn't nested in it, but parses
+    # just like a parser whose grammar has the rules added to it for good.
+    pool = ParserPool()
+    p = pool.acquire(version_tuple, is_pypy=IS_PYPY)
+    start = grammar(p)
+    after = {}
+    for sources in (SOURCES, SOURCES[::-1]):
+        for source in sources:
+            fresh = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+            assert str(parse(p, source)) == str(parse(fresh, source))
+            assert after.setdefault(source, grammar(p)) == grammar(p)
+    pool.release(p)
+    assert grammar(p) == start
+
+
+def test_overlay_output(monkeypatch):
+    # Overlaying each code object's rules gives the same output as letting
+    # them pile up.
+    paths = sorted(
+        glob(
+            osp.join(
+                osp.dirname(__file__),
+                "..",
+                "test",
+                "bytecode_%d.%d" % version_tuple[:2],
+                "*.pyc",
+            )
+        )
+    )
+    assert paths
+
+    def decompile_all():
+        parser_pool.clear()
+        outputs = []
+        for path in paths:
+            out = StringIO()
+            try:
+                decompile_file(path, out)
+            except Exception as e:
+                out.write("%s: %s" % (type(e).__name__, e))
+            outputs.append(out.getvalue())
+        return outputs
+
+    overlaid = decompile_all()
+    monkeypatch.setattr(PythonLambdaParser, "overlay_grammar", False)
+    assert decompile_all() == overlaid
+    parser_pool.clear()
+
+
+def test_pooled_output():
+    parser_pool.clear()
+    fresh = []
+    for source in SOURCES:
+        fresh.append(deparse(source))
+        parser_pool.clear()
+    # Now the same parser is reused, in both orders.
+    assert [deparse(source) for source in SOURCES] == fresh
+    assert [deparse(source) for source in reversed(SOURCES)] == fresh[::-1]
+
+
+def test_walker_keeps_parser():
+    # The walker code_deparse() returns can still parse; its parser goes
+    # back to the pool when it is released.
+    parser_pool.clear()
+    code = compile(SOURCES[0], "<test>", "exec")
+    deparsed = code_deparse(
+        code, out=StringIO(), version=version_tuple, is_pypy=IS_PYPY
+    )
+    p = deparsed.p
+    assert p is not None
+    assert str(parse(p, SOURCES[1])) == str(
+        parse(get_python_parser(version_tuple, is_pypy=IS_PYPY), SOURCES[1])
+    )
+    key = (version_tuple[:2], "exec", IS_PYPY)
+    assert p not in parser_pool.idle.get(key, [])
+    deparsed.release_parser()
+    assert deparsed.p is None
+    assert parser_pool.idle[key][-1] is p
+
+
+def test_reacquired_parser():
+    # What one user of a parser set up doesn't carry over to the next.
+    pool = ParserPool()
+    p = pool.acquire(version_tuple, is_pypy=IS_PYPY)
+    p.start_budgets({"items": 10})
+    p.show_error_context = False
+    p.chart_sizes = [1, 2]
+    pool.release(p)
+    debug = dict(p.debug, reduce=True)
+    assert pool.acquire(version_tuple, debug, is_pypy=IS_PYPY) is p
+    assert p.debug is debug
+    assert p.budgets is None and p.items_left is None
+    assert p.show_error_context and p.chart_sizes is None
+    assert python_parser.TRACK_ERROR_INDEX or "makeSet" not in p.__dict__
+
+
+def test_pooled_lambda_parser():
+    sources = (
+        "f = lambda x, y=1: x + y if x else -y\n",
+        "g = sorted(a, key=lambda t: (t[1], t[0]))\n",
+    )
+    parser_pool.clear()
+    fresh = []
+    for source in sources:
+        fresh.append(deparse(source))
+        parser_pool.clear()
+    assert [deparse(source) for source in sources] == fresh
+    key = (version_tuple[:2], "lambda", IS_PYPY)
+    p = parser_pool.idle[key][-1]
+    assert deparse(sources[0]) == fresh[0]
+    assert parser_pool.idle[key][-1] is p
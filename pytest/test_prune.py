@@ -0,0 +1,93 @@
+import os.path as osp
+from glob import glob
+from io import StringIO
+
+from decompyle3 import PYTHON_VERSION_TRIPLE, IS_PYPY
+from decompyle3.main import decompile_file
+from decompyle3.parsers.main import PythonLambdaParser, get_python_parser
+from decompyle3.parsers.pool import parser_pool
+from decompyle3.scanner import get_scanner
+import decompyle3.parsers.main as python_parser
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+SOURCES = (
+    "x = a + b * c\n",
+    "for x in y:\n    if x:\n        z = 1\nelse:\n    z = 2\n",
+    "try:\n    f()\nexcept E as e:\n    g(e)\nfinally:\n    h()\n",
+    "with open(a) as fp, open(b):\n    x = [y for y in z] if c else {**d}\n",
+)
+
+
+def parse(p, source):
+    scanner = get_scanner(version_tuple, IS_PYPY)
+    tokens, customize = scanner.ingest(compile(source, "<test>", "exec"))
+    p.insts = scanner.insts
+    p.offset2inst_index = scanner.offset2inst_index
+    p.cfg = scanner.cfg
+    p.opc = scanner.opc
+    return tokens, python_parser.parse(p, tokens, customize, is_lambda=False)
+
+
+def test_prune():
+    pruned = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    pruned.prune_grammar = True
+    pruned.checkpoint()
+    for source in SOURCES * 2:
+        full = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+        assert not full.prune_grammar
+        tokens, tree = parse(pruned, source)
+        assert str(tree) == str(parse(full, source)[1])
+
+        # Every rule left needs only instructions that are there.
+        kinds = {t.kind for t in tokens} | {pruned._BOF}
+        saved = pruned.prune(tokens)
+        newrules = pruned.newrules
+        pruned.unprune(saved)
+        assert newrules is not pruned.newrules
+        assert len(newrules) < len(pruned.newrules)
+        for rules in newrules.values():
+            for _, rhs in rules:
+                for sym in rhs:
+                    assert (
+                        sym in kinds
+                        or sym in newrules
+                        or sym.startswith(pruned._NULLABLE)
+                    )
+
+
+def test_prune_output(monkeypatch):
+    # Over the bytecode test files, pruning gives the same output, file for
+    # file, as the whole grammar does.
+    paths = sorted(
+        glob(
+            osp.join(
+                osp.dirname(__file__),
+                "..",
+                "test",
+                "bytecode_%d.%d" % version_tuple[:2],
+                "*.pyc",
+            )
+        )
+    )
+    assert paths
+
+    def decompile(path):
+        out = StringIO()
+        try:
+            decompile_file(path, out)
+        except Exception as e:
+            out.write("%s: %s" % (type(e).__name__, e))
+        return out.getvalue()
+
+    parser_pool.clear()
+    full = [decompile(path) for path in paths]
+    monkeypatch.setattr(PythonLambdaParser, "prune_grammar", True)
+    parser_pool.clear()
+    for path, output in zip(paths, full):
+        assert decompile(path) == output, path
+    parser_pool.clear()
@@ -0,0 +1,79 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3 import code_deparse
+from decompyle3.parsers import reduce_memo
+from decompyle3.parsers.p37.base import Python37BaseParser
+
+# From test/simple_source/bug35/06_while_return.py
+SOURCE = """
+def initiate_send(a, b, c, num_sent):
+    while a and b:
+        try:
+            1 / (b - 1)
+        except ZeroDivisionError:
+            return 1
+
+        if num_sent:
+            c = 2
+        return c
+"""
+
+# From the standard library's glob._iterdir().
+PURE_SOURCE = """
+def iterdir(it, dironly):
+    for entry in it:
+        try:
+            if not dironly or entry.is_dir():
+                yield entry.name
+        except OSError:
+            pass
+"""
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_reduce_memo() -> None:
+    reduce_memo.clear()
+    reduce_memo.check = True
+    try:
+        code_deparse(compile(SOURCE, "<test>", "exec"), out=StringIO())
+    finally:
+        reduce_memo.check = False
+    assert reduce_memo.stats["hits"] > 0
+    assert 0 < reduce_memo.hit_rate() < 1
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_pure_reduce_checks(monkeypatch) -> None:
+    # "ifstmts_jump" is checked with a tree, and the parser offers one of
+    # its reductions twice. The check is run only the first time.
+    offered, run = [], []
+    reduce_is_invalid = Python37BaseParser.reduce_is_invalid
+    run_reduce_check = Python37BaseParser.run_reduce_check
+
+    def counted_reduce_is_invalid(self, rule, ast, tokens, first, last):
+        if rule[0] == "ifstmts_jump":
+            offered.append((rule, first, last))
+        return reduce_is_invalid(self, rule, ast, tokens, first, last)
+
+    def counted_run_reduce_check(self, rule, ast, tokens, first, last):
+        if rule[0] == "ifstmts_jump":
+            run.append((rule, first, last))
+        return run_reduce_check(self, rule, ast, tokens, first, last)
+
+    monkeypatch.setattr(
+        Python37BaseParser, "reduce_is_invalid", counted_reduce_is_invalid
+    )
+    monkeypatch.setattr(
+        Python37BaseParser, "run_reduce_check", counted_run_reduce_check
+    )
+    assert "ifstmts_jump" in Python37BaseParser.pure_reduce_checks
+    reduce_memo.clear()
+    code_deparse(compile(PURE_SOURCE, "<test>", "exec"), out=StringIO())
+    assert len(set(offered)) < len(offered)
+    assert sorted(run) == sorted(set(offered))
+    assert reduce_memo.stats["hits"] >= len(offered) - len(run)
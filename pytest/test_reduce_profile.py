@@ -0,0 +1,44 @@
+from decompyle3 import PYTHON_VERSION_TRIPLE, IS_PYPY
+from decompyle3.parsers import reduce_profile
+from decompyle3.parsers.main import get_python_parser
+from decompyle3.scanner import get_scanner
+import decompyle3.parsers.main as python_parser
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+SOURCE = "for x in y:\n    if x and z:\n        break\nwhile a or b:\n    f()\n"
+
+
+def test_reduce_profile(record_profile):
+    scanner = get_scanner(version_tuple, IS_PYPY)
+    tokens, customize = scanner.ingest(compile(SOURCE, "<test>", "exec"))
+    p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    p.insts = scanner.insts
+    p.offset2inst_index = scanner.offset2inst_index
+    p.cfg = scanner.cfg
+    p.opc = scanner.opc
+
+    data = record_profile(
+        reduce_profile.profile,
+        lambda: python_parser.parse(p, tokens, customize, is_lambda=False),
+    )
+    # Only nonterminals that have a check are handed to it.
+    assert set(p.check_reduce) <= set(p.reduce_check_table)
+    assert data
+    for (lhs, rhs), (calls, rejects, seconds) in data.items():
+        assert lhs in p.check_reduce
+        assert 0 <= rejects <= calls and seconds >= 0
+
+    # Merging what other processes recorded adds up the counts.
+    reduce_profile.profile.merge(data)
+    reduce_profile.profile.merge(data)
+    totals = reduce_profile.by_lhs()
+    for lhs, (calls, rejects, _) in reduce_profile.by_lhs(data).items():
+        assert totals[lhs][:2] == [2 * calls, 2 * rejects]
+    assert reduce_profile.format_table().splitlines()[-1].split()[0] == str(
+        2 * sum(calls for calls, _, _ in data.values())
+    )
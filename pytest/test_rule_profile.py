@@ -0,0 +1,52 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3 import code_deparse
+from decompyle3.parsers import rule_profile
+from decompyle3.parsers.pool import parser_pool
+
+PROFILED = """
+def f(a, b):
+    if a < b:
+        return g(a, b=1)
+    return [x for x in b]
+"""
+
+UNPROFILED = """
+def f(a):
+    with open(a) as fp:
+        x = fp.read()
+    return x
+"""
+
+
+def deparse(source: str) -> str:
+    out = StringIO()
+    code_deparse(compile(source, "<test>", "exec"), out=out)
+    return out.getvalue()
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_rule_profile(tmp_path, record_profile) -> None:
+    expected = deparse(PROFILED), deparse(UNPROFILED)
+    path = str(tmp_path / "rules.txt")
+    rule_profile.write(
+        path, record_profile(rule_profile.profile, lambda: deparse(PROFILED))
+    )
+    with open(path) as fp:
+        assert fp.readline().rstrip("\n") == rule_profile.HEADER
+    data = rule_profile.read(path)
+    assert data and ("expr", ("LOAD_FAST",)) in data
+
+    try:
+        parser_pool.use_profile(data)
+        rule_profile.stats.update(hot=0, fallbacks=0)
+        assert deparse(PROFILED) == expected[0]
+        assert rule_profile.stats["hot"] > 0
+        assert rule_profile.stats["fallbacks"] == 0
+        assert deparse(UNPROFILED) == expected[1]
+        assert rule_profile.stats["fallbacks"] > 0
+    finally:
+        parser_pool.use_profile(None)
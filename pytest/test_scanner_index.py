@@ -0,0 +1,81 @@
+from array import array
+
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3.scanner import JumpTargets, get_scanner
+
+
+def sample(a, b):
+    for x in a:
+        if x and b:
+            while b:
+                b -= 1
+                if b == 3:
+                    break
+            continue
+        try:
+            a = b[x]
+        except KeyError:
+            return None
+    return a or b
+
+
+def test_range_queries() -> None:
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+    scanner.ingest(sample.__code__)
+    opc = scanner.opc
+    insts = scanner.insts
+    offsets = [inst.offset for inst in insts]
+    jumps = [opc.JUMP_ABSOLUTE, opc.POP_JUMP_IF_FALSE, opc.JUMP_FORWARD]
+    targets = sorted(set(inst.argval for inst in insts if inst.opcode in jumps))
+
+    def scan(start, end, target=None):
+        found = []
+        for inst in insts:
+            if start <= inst.offset < end and inst.opcode in jumps:
+                if target is None or scanner.get_target(inst.offset) == target:
+                    found.append(inst.offset)
+        return found
+
+    end = len(scanner.code)
+    for start in offsets:
+        for target in [None] + targets:
+            found = scan(start, end, target)
+            assert scanner.all_instr(start, end, jumps, target) == found
+            assert scanner.first_instr(start, end, jumps, target) == (
+                found[0] if found else None
+            )
+            assert scanner.last_instr(start, end, jumps, target) == (
+                found[-1] if found else None
+            )
+            assert scanner.inst_matches(start, end, jumps, target) == found
+
+
+def test_lines() -> None:
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+    scanner.ingest(sample.__code__)
+    lines = scanner.lines
+    codelen = len(scanner.code)
+    assert len(lines) == codelen
+    starts = sorted(scanner.linestarts)
+    for offset in range(codelen):
+        start = max(s for s in starts if s <= offset)
+        later = [s for s in starts if s > offset]
+        line_no, next_line = lines[offset]
+        assert line_no == lines[offset].l_no == scanner.linestarts[start]
+        assert next_line == lines[offset].next == (later[0] if later else codelen)
+    assert lines[-1] == lines[codelen - 1]
+
+
+def test_jump_targets() -> None:
+    labels = array("l", [8, 4, 8, 12, 4, 8])
+    sources = array("l", [0, 2, 6, 10, 14, 16])
+    targets = JumpTargets(labels, sources)
+    expected = {}
+    for label, source in zip(labels, sources):
+        expected[label] = expected.get(label, []) + [source]
+    assert len(targets) == len(expected)
+    for label in expected:
+        assert label in targets
+        assert list(targets[label]) == expected[label]
+    assert 6 not in targets
@@ -0,0 +1,44 @@
+from decompyle3 import PYTHON_VERSION_TRIPLE, IS_PYPY
+from decompyle3.parsers.main import get_python_parser
+from decompyle3.scanner import get_scanner
+import decompyle3.parsers.main as python_parser
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+SOURCE = "".join(
+    "x%d = a + %d\nif x%d:\n    y = f(x%d, b)\nelse:\n    y = None\n"
+    % (i, i, i, i)
+    for i in range(60)
+)
+
+
+def parse(chunk_size=None, split_in_if=False):
+    scanner = get_scanner(version_tuple, IS_PYPY)
+    tokens, customize = scanner.ingest(compile(SOURCE, "<test>", "exec"))
+    chunks = ()
+    if chunk_size:
+        chunks = scanner.statement_chunks(tokens, chunk_size)
+        assert len(chunks) > 5
+    elif split_in_if:
+        i = next(i for i, t in enumerate(tokens) if t.kind == "POP_JUMP_IF_FALSE")
+        chunks = [i + 1]
+    p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    p.insts = scanner.insts
+    p.offset2inst_index = scanner.offset2inst_index
+    p.cfg = scanner.cfg
+    p.opc = scanner.opc
+    return str(
+        python_parser.parse(p, tokens, customize, is_lambda=False, chunks=chunks)
+    )
+
+
+def test_statement_chunks():
+    whole = parse()
+    assert parse(chunk_size=50) == whole
+
+    # Splitting inside an "if" fails, and the tokens are parsed as a whole.
+    assert parse(split_in_if=True) == whole
@@ -0,0 +1,45 @@
+import pytest
+from io import StringIO
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+from decompyle3 import code_deparse
+from decompyle3.parsers import straight_line
+
+SOURCE = """
+import os
+from os import path, sep
+x = os.path.join(a, "b")[1:2] + -c * d
+y, (z, w.q) = [{"a": x, "b": 2}, {y}]
+
+class A(B):
+    c = lambda a, b=1: (a, b)
+
+def f(a, b=1, *, c=2):
+    del a.b
+    def g():
+        return b
+    return g
+
+def h(a):
+    if a:
+        a = 1
+    return a
+"""
+
+
+@pytest.mark.skipif(
+    not (3, 7) <= PYTHON_VERSION_TRIPLE < (3, 9), reason="asssume Python 3.7 or 3.8"
+)
+def test_straight_line() -> None:
+    straight_line.clear()
+    straight_line.check = True
+    try:
+        out = StringIO()
+        code_deparse(compile(SOURCE, "<test>", "exec"), out=out)
+    finally:
+        straight_line.check = False
+    # The module, A, f and g are straight-line code; h isn't. The lambda
+    # is parsed as an expression, not as statements.
+    assert straight_line.stats["hits"] == 4
+    assert straight_line.stats["straight"] == 4
+    assert straight_line.stats["parses"] == 6
+    assert "def h(a):\n    if a:" in out.getvalue()
@@ -1,4 +1,14 @@
-from decompyle3.scanners.tok import Token
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3.scanner import get_scanner
+from decompyle3.scanners.tok import (
+    Token,
+    TokenList,
+    is_offset_pair,
+    off2int,
+    offset2str,
+    pair_offset,
+)
 
 
 def test_token():
@@ -24,5 +34,38 @@ def test_token():
     assert t.format(token_num=5) == expect, t.format(token_num=5)
 
 
+def test_offsets():
+    # An instruction with an EXTENDED_ARG before it.
+    t = Token("JUMP_ABSOLUTE", offset=10, has_extended_arg=True)
+    assert is_offset_pair(t.offset) and offset2str(t.offset) == "10_12"
+    assert t.off2int() == 12 and t.off2int(prefer_last=False) == 10
+
+    # The second of the COME_FROMs at offset 10.
+    offset = pair_offset(10, 1)
+    assert offset2str(offset) == "10_1"
+    assert off2int(offset) == off2int(offset, prefer_last=False) == 10
+    assert offset not in range(1 << 31) and not is_offset_pair(10)
+    assert pair_offset(10, 0) < offset < pair_offset(12, 0)
+
+
+def test_token_list():
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+    tokens, _ = scanner.ingest(test_token.__code__)
+    token_list = TokenList(scanner.opc, tokens)
+    assert len(token_list) == len(tokens)
+    for i, (token, view) in enumerate(zip(tokens, token_list)):
+        assert view.format(token_num=i) == token.format(token_num=i)
+        assert view.opc is scanner.opc and view.op == token.op
+    assert [t.kind for t in token_list[-3:]] == [t.kind for t in tokens[-3:]]
+
+    # Views write through to the list.
+    token_list[0].kind = "LOAD_STR"
+    assert token_list[0] == "LOAD_STR" and token_list.kinds[0] == "LOAD_STR"
+    del token_list[0]
+    assert len(token_list) == len(tokens) - 1
+    assert token_list[0].offset == tokens[1].offset
+
+
 if __name__ == "__main__":
     test_token()
+    test_token_list()
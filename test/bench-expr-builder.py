@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Mode: -*- python -*-
+#
+# Copyright (c) 2021 by Rocky Bernstein
+#
+"""
+Usage: bench-expr-builder.py [DIRECTORY] [REPEAT]
+
+Decompile the bytecode files in DIRECTORY (default bytecode_3.8, next
+to this script) with and without building expressions ahead of the
+Earley parser, taking the best of REPEAT (default 3) runs of each.
+Report how much the token streams given to the Earley parser shrank,
+and the time taken both ways.
+"""
+
+from __future__ import print_function
+
+import glob
+import os.path as osp
+import sys
+import time
+from io import StringIO
+
+from decompyle3.main import decompile_file
+from decompyle3.parsers import expr_builder
+from decompyle3.parsers.main import PythonLambdaParser
+
+
+def decompile_all(files: list) -> float:
+    start = time.perf_counter()
+    for path in files:
+        try:
+            decompile_file(path, StringIO())
+        except Exception:
+            pass
+    return time.perf_counter() - start
+
+
+def best_time(files: list, build_expressions: bool, repeat: int) -> float:
+    PythonLambdaParser.build_expressions = build_expressions
+    return min(decompile_all(files) for _ in range(repeat))
+
+
+def main(directory: str, repeat: int) -> None:
+    files = sorted(glob.glob(osp.join(directory, "*.pyc")))
+    if not files:
+        sys.exit("no bytecode files in %s" % directory)
+
+    expr_builder.clear()
+    decompile_all(files)
+    stats = expr_builder.stats
+    print(
+        "%d files, %d tokens, %d given to the Earley parser (%.2f times fewer)"
+        % (len(files), stats["tokens"], stats["reduced"], expr_builder.shrinkage())
+    )
+
+    earley = best_time(files, False, repeat)
+    built = best_time(files, True, repeat)
+    print(
+        "Earley only %6.2fs  building expressions %6.2fs  speedup %.1f%%"
+        % (earley, built, 100 * (earley - built) / earley)
+    )
+
+
+if __name__ == "__main__":
+    default = osp.join(osp.dirname(osp.abspath(__file__)), "bytecode_3.8")
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else default,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+    )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Mode: -*- python -*-
+#
+# Copyright (c) 2021 by Rocky Bernstein
+#
+"""
+Usage: bench-huge-literals.py [--earley] [SIZE ...]
+
+Decompile a module made of a huge dict literal with constant keys, one
+with name keys and values, and a huge list literal of constants and
+names, each with SIZE (default 10000, 50000 and 100000) entries. Report
+the time taken to scan, parse and produce source, and the parse time
+per entry, which should stay about the same as SIZE grows.
+
+With --earley, the literals are parsed again by the Earley parser
+alone, without the fast path for straight-line code and without
+building expressions ahead of it. Expect that to take minutes from a
+couple of thousand entries on.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+from io import StringIO
+
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3.parsers.main import PythonLambdaParser
+from decompyle3.scanner import get_scanner
+from decompyle3.semantics.pysource import PARSER_DEFAULT_DEBUG, SourceWalker
+
+LITERALS = {
+    "dict, constant keys": lambda i: "'k%d': %d" % (i, i),
+    "dict, name keys": lambda i: "k%d: v%d" % (i, i),
+    "list": lambda i: "a%d" % i if i % 2 else str(i),
+}
+
+
+def source(kind: str, size: int) -> str:
+    items = ", ".join(LITERALS[kind](i) for i in range(size))
+    if kind == "list":
+        return "x = [%s]\n" % items
+    return "x = {%s}\n" % items
+
+
+def deparse(co) -> tuple:
+    """Return the seconds taken to scan, parse and produce source for *co*."""
+    start = time.perf_counter()
+    scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+    tokens, customize = scanner.ingest(co)
+    scanned = time.perf_counter()
+    walker = SourceWalker(
+        PYTHON_VERSION_TRIPLE,
+        StringIO(),
+        scanner,
+        showast={},
+        debug_parser=PARSER_DEFAULT_DEBUG,
+        linestarts=dict(scanner.opc.findlinestarts(co)),
+    )
+    walker.ast = walker.build_ast(tokens, customize, co, isTopLevel=True)
+    parsed = time.perf_counter()
+    walker.gen_source(walker.ast, co.co_name, customize)
+    done = time.perf_counter()
+    return scanned - start, parsed - scanned, done - parsed
+
+
+def main(sizes: list, earley: bool) -> None:
+    print(
+        "%-20s %7s %8s %8s %8s %11s"
+        % ("literal", "entries", "scan", "parse", "source", "parse/entry")
+    )
+    for kind in LITERALS:
+        for size in sizes:
+            co = compile(source(kind, size), "<huge>", "exec")
+            scan, parse, gen = deparse(co)
+            print(
+                "%-20s %7d %7.2fs %7.2fs %7.2fs %9.1fus"
+                % (kind, size, scan, parse, gen, 1e6 * parse / size)
+            )
+            if earley:
+                PythonLambdaParser.build_expressions = False
+                PythonLambdaParser.straight_line_fast_path = False
+                try:
+                    parse = deparse(co)[1]
+                finally:
+                    PythonLambdaParser.build_expressions = True
+                    PythonLambdaParser.straight_line_fast_path = True
+                print(
+                    "%-20s %7d %8s %7.2fs %8s %9.1fus"
+                    % ("  Earley only", size, "", parse, "", 1e6 * parse / size)
+                )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    earley = "--earley" in args
+    if earley:
+        args.remove("--earley")
+    main([int(arg) for arg in args] or [10000, 50000, 100000], earley)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Mode: -*- python -*-
+#
+# Copyright (c) 2021 by Rocky Bernstein
+#
+"""
+Usage: bench-jump-targets.py [SIZE ...]
+
+Scan a function with a single loop holding SIZE (default 2000, 4000
+and 8000) "if ...: break" and "if ...: continue" statements, so that
+thousands of jumps go to the end of the loop and thousands more back
+to its start. Report the time find_jump_targets() takes, and that time
+per jump to the two targets.
+
+When the jumps to a target were collected by copying a list with one
+more jump each time, the time per jump grew with SIZE; now it stays
+about the same.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3.scanner import get_scanner
+
+BLOCK = """
+        if a == %(i)d:
+            break
+        if b == %(i)d:
+            continue
+"""
+
+
+def function(size: int):
+    # Something before the loop, as the scanner can't start on an
+    # EXTENDED_ARG, which a big enough loop's SETUP_LOOP has.
+    source = "def f(a, b, c):\n    c = c\n    while c:\n" + "".join(
+        BLOCK % {"i": i} for i in range(size)
+    )
+    namespace = {}
+    exec(compile(source, "<jump-targets>", "exec"), namespace)
+    return namespace["f"].__code__
+
+
+def main(sizes: list) -> None:
+    print("%7s %8s %12s %10s" % ("blocks", "jumps", "find targets", "per jump"))
+    for size in sizes:
+        co = function(size)
+        scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+        find_jump_targets = scanner.find_jump_targets
+        timing = {}
+
+        def timed_find_jump_targets(debug):
+            start = time.perf_counter()
+            targets = find_jump_targets(debug)
+            timing["seconds"] = time.perf_counter() - start
+            timing["jumps"] = max(len(targets[target]) for target in targets)
+            return targets
+
+        scanner.find_jump_targets = timed_find_jump_targets
+        scanner.ingest(co)
+        seconds, jumps = timing["seconds"], timing["jumps"]
+        print(
+            "%7d %8d %11.2fs %8.1fus"
+            % (size, jumps, seconds, 1e6 * seconds / jumps)
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [2000, 4000, 8000])
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Mode: -*- python -*-
+#
+# Copyright (c) 2021 by Rocky Bernstein
+#
+"""
+Usage: bench-overlay.py [FUNCTIONS]
+
+Time parsing each function of a generated module with FUNCTIONS
+(default 2000) functions, once with a parser whose grammar keeps every
+rule added by customization, and once with a checkpointed parser that
+overlays each function's rules on the base grammar and drops them
+afterwards. Parse times for the first and last functions show whether
+the cost per function grows as the module is worked through.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from xdis import iscode
+
+from decompyle3 import IS_PYPY, PYTHON_VERSION_TRIPLE
+from decompyle3.parsers.main import get_python_parser
+from decompyle3.scanner import get_scanner
+import decompyle3.parsers.main as python_parser
+
+version_tuple = (
+    (3, 8)
+    if PYTHON_VERSION_TRIPLE >= (3, 9) or PYTHON_VERSION_TRIPLE < (3, 7)
+    else PYTHON_VERSION_TRIPLE
+)
+
+# Function bodies whose customizations differ with *i*, so that the rules
+# added pile up when they are not dropped.
+TEMPLATES = (
+    "def f{i}(a, b):\n    return g(a, {args})\n",
+    "def f{i}(a, *args, **kw):\n    return g(a, *args, x={i}, **kw)\n",
+    "def f{i}(a):\n    return [{args}], ({args},), {{{args}}}\n",
+    "def f{i}(a):\n    x, *y = a\n    return {{'k{i}': x, 'j': y}}\n",
+    "def f{i}(a):\n    for x in a:\n        if x:\n            break\n    return h({args})\n",
+)
+
+
+def make_source(n: int) -> str:
+    lines = []
+    for i in range(n):
+        args = ", ".join("a" for _ in range(1 + i % 40))
+        lines.append(TEMPLATES[i % len(TEMPLATES)].format(i=i, args=args))
+    return "\n".join(lines)
+
+
+def time_parses(p, module) -> list:
+    scanner = get_scanner(version_tuple, IS_PYPY)
+
+    def parse(code):
+        tokens, customize = scanner.ingest(code)
+        p.insts = scanner.insts
+        p.offset2inst_index = scanner.offset2inst_index
+        p.cfg = scanner.cfg
+        p.opc = scanner.opc
+        start = time.perf_counter()
+        python_parser.parse(p, tokens, customize, is_lambda=False, code=code)
+        return time.perf_counter() - start
+
+    parse(module)
+    return [parse(code) for code in module.co_consts if iscode(code)]
+
+
+def report(title: str, times: list) -> None:
+    k = max(len(times) // 10, 1)
+    print(
+        "%-12s total %7.2fs  first %d: %6.2fms/function  last %d: %6.2fms/function"
+        % (
+            title,
+            sum(times),
+            k,
+            1000 * sum(times[:k]) / k,
+            k,
+            1000 * sum(times[-k:]) / k,
+        )
+    )
+
+
+def main(n: int) -> None:
+    module = compile(make_source(n), "<bench-overlay>", "exec")
+
+    p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    report("accumulate", time_parses(p, module))
+
+    p = get_python_parser(version_tuple, is_pypy=IS_PYPY)
+    p.checkpoint()
+    report("overlay", time_parses(p, module))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# Mode: -*- python -*-
+#
+# Copyright (c) 2021 by Rocky Bernstein
+#
+"""
+Usage: bench-scanner.py [SIZE ...]
+
+Scan a function made of SIZE (default 500, 1000 and 2000) blocks, each
+a while loop with a break and a try statement, about 30 instructions,
+so that the functions have 15k to 60k instructions. Report the time
+ingest() takes, and that time per instruction.
+
+Finding where instructions are with first_instr(), last_instr() and the
+like no longer goes through the code, so that part stays about the same
+per instruction as SIZE grows. The time per instruction still grows
+some: xdis looks up each instruction in a list of jump targets while
+disassembling.
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+from xdis.version_info import PYTHON_VERSION_TRIPLE
+
+from decompyle3.scanner import get_scanner
+
+BLOCK = """
+    while a%(i)d < b:
+        if a%(i)d:
+            break
+        a%(i)d += 1
+    try:
+        b = c[%(i)d]
+    except KeyError:
+        pass
+"""
+
+
+def function(size: int):
+    source = "def f(b, c):\n" + "".join(BLOCK % {"i": i} for i in range(size))
+    namespace = {}
+    exec(compile(source, "<scanner>", "exec"), namespace)
+    return namespace["f"].__code__
+
+
+def main(sizes: list) -> None:
+    print("%7s %13s %8s %10s" % ("blocks", "instructions", "ingest", "per instr"))
+    for size in sizes:
+        co = function(size)
+        scanner = get_scanner(PYTHON_VERSION_TRIPLE)
+        start = time.perf_counter()
+        scanner.ingest(co)
+        seconds = time.perf_counter() - start
+        instructions = len(scanner.insts)
+        print(
+            "%7d %13d %7.2fs %8.1fus"
+            % (size, instructions, seconds, 1e6 * seconds / instructions)
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [500, 1000, 2000])
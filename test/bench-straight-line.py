@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Mode: -*- python -*-
+#
+# Copyright (c) 2021 by Rocky Bernstein
+#
+"""
+Usage: bench-straight-line.py [DIRECTORY] [REPEAT]
+
+Decompile the bytecode files in DIRECTORY (default bytecode_3.8, next
+to this script) with and without the fast path for straight-line code,
+taking the best of REPEAT (default 3) runs of each. Report how many
+code objects the fast path parsed, and the time taken both ways.
+"""
+
+from __future__ import print_function
+
+import glob
+import os.path as osp
+import sys
+import time
+from io import StringIO
+
+from decompyle3.main import decompile_file
+from decompyle3.parsers import straight_line
+from decompyle3.parsers.main import PythonLambdaParser
+
+
+def decompile_all(files: list) -> float:
+    start = time.perf_counter()
+    for path in files:
+        try:
+            decompile_file(path, StringIO())
+        except Exception:
+            pass
+    return time.perf_counter() - start
+
+
+def best_time(files: list, fast_path: bool, repeat: int) -> float:
+    PythonLambdaParser.straight_line_fast_path = fast_path
+    return min(decompile_all(files) for _ in range(repeat))
+
+
+def main(directory: str, repeat: int) -> None:
+    files = sorted(glob.glob(osp.join(directory, "*.pyc")))
+    if not files:
+        sys.exit("no bytecode files in %s" % directory)
+
+    straight_line.clear()
+    decompile_all(files)
+    stats = straight_line.stats
+    print(
+        "%d files, %d parses, %d straight-line, %d on the fast path (%.1f%%)"
+        % (
+            len(files),
+            stats["parses"],
+            stats["straight"],
+            stats["hits"],
+            100 * straight_line.hit_rate(),
+        )
+    )
+
+    earley = best_time(files, False, repeat)
+    fast = best_time(files, True, repeat)
+    print(
+        "Earley only %6.2fs  with fast path %6.2fs  speedup %.1f%%"
+        % (earley, fast, 100 * (earley - fast) / earley)
+    )
+
+
+if __name__ == "__main__":
+    default = osp.join(osp.dirname(osp.abspath(__file__)), "bytecode_3.8")
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else default,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+    )
@@ -21,19 +21,16 @@ while [[ -n $1 ]]  ; do
     fi
 
     tmpdir=$workdir/../../tmp/grammar-cover
-    COVER_FILE=${tmpdir}/spark-grammar-${SHORT_VERSION}.cover
     [[ -d  $tmpdir ]] || mkdir $tmpdir
     cd $workdir/../..
     GRAMMAR_TXT=$tmpdir/grammar-${SHORT_VERSION}.txt
     (cd ../.. && pyenv local ${LONG_VERSION})
     cd ./test
-    if [[ -r $COVER_FILE ]]; then
-	rm $COVER_FILE
-    fi
     if [[ -r $GRAMMAR_TXT ]]; then
         GRAMMAR_SAVE_TXT=${tmpdir}/grammar-${SHORT_VERSION}-save.txt
         cp $GRAMMAR_TXT $GRAMMAR_SAVE_TXT
     fi
+    # The coverage report is collected while decompiling and written
+    # to $GRAMMAR_TXT.
     make grammar-coverage-${SHORT_VERSION};
-    spark-parser-coverage --max-count=3000 --path $COVER_FILE > $GRAMMAR_TXT
 done
@@ -19,10 +19,11 @@ Step 2: Run the test:
 
 from __future__ import print_function
 
-import os, time, re, shutil, sys
+import atexit, os, time, re, shutil, sys
 from fnmatch import fnmatch
 
 from decompyle3 import main
+from decompyle3.parsers import grammar_coverage
 import xdis.magics as magics
 
 # ----- configure this for your needs
@@ -139,6 +140,7 @@ if __name__ == "__main__":
     import getopt, sys
 
     do_coverage = do_verify = False
+    coverage_report = None
     test_dirs = []
     start_with = None
 
@@ -147,7 +149,7 @@ if __name__ == "__main__":
     opts, args = getopt.getopt(
         sys.argv[1:],
         "",
-        ["start-with=", "verify-run", "syntax-verify", "max=", "coverage", "all",]
+        ["start-with=", "verify-run", "syntax-verify", "max=", "coverage", "coverage-report=", "all",]
         + test_options_keys,
     )
     vers = ""
@@ -159,6 +161,9 @@ if __name__ == "__main__":
             do_verify = "verify-run"
         elif opt == "--coverage":
             do_coverage = True
+        elif opt == "--coverage-report":
+            do_coverage = True
+            coverage_report = val
         elif opt == "--start-with":
             start_with = val
         elif opt[2:] in test_options_keys:
@@ -173,7 +178,11 @@ if __name__ == "__main__":
                 test_dirs.append(test_options[val])
 
     if do_coverage:
-        os.environ["SPARK_PARSER_COVERAGE"] = "/tmp/spark-grammar-%s.cover" % vers
+        if coverage_report is None:
+            short_vers = ".".join(str(vers).split(".")[:2])
+            coverage_report = "/tmp/grammar-coverage-%s.txt" % short_vers
+        grammar_coverage.profile.enable()
+        atexit.register(grammar_coverage.update, coverage_report)
 
     failed = 0
     for src_dir, pattern, target_dir in test_dirs:
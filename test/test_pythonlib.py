@@ -24,10 +24,11 @@ Step 2: Run the test:
   test_pythonlib.py --mylib --syntaix-verify # decompile verify 'mylib'
 """
 
-import getopt, os, py_compile, sys, shutil, tempfile, time
+import atexit, getopt, os, py_compile, sys, shutil, tempfile, time
 
 from xdis.version_info import PYTHON_VERSION_TRIPLE
 from decompyle3.main import main
+from decompyle3.parsers import grammar_coverage
 from fnmatch import fnmatch
 
 
@@ -87,6 +88,10 @@ def help():
 
   # decompile all of Python's installed lib files
   test_pythonlib.py --3.7
+
+  # add the grammar rules used decompiling the 3.7 tests to the
+  # coverage report /tmp/grammar-coverage-3.7.txt
+  test_pythonlib.py --bytecode-3.7 --coverage
 """
     )
     sys.exit(1)
@@ -190,6 +195,7 @@ if __name__ == "__main__":
             "all",
             "compile",
             "coverage",
+            "coverage-report=",
             "no-rm",
         ]
         + test_options_keys,
@@ -223,15 +229,20 @@ if __name__ == "__main__":
                 test_dirs.append(test_options[val])
         elif opt == "--coverage":
             test_opts["coverage"] = True
+        elif opt == "--coverage-report":
+            test_opts["coverage"] = val
         else:
             help()
             pass
         pass
 
     if test_opts["coverage"]:
-        os.environ["SPARK_PARSER_COVERAGE"] = (
-            "/tmp/spark-grammar-python-lib%s.cover" % test_dirs[0][-1]
-        )
+        # do_tests() exits on failures, so add to the report at exit.
+        report = test_opts["coverage"]
+        if report is True:
+            report = "/tmp/grammar-coverage-%s.txt" % test_dirs[0][-1]
+        grammar_coverage.profile.enable()
+        atexit.register(grammar_coverage.update, report)
 
     last_compile_version = None
     for src_dir, pattern, target_dir, compiled_version in test_dirs: